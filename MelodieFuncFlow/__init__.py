@@ -1,6 +1,11 @@
 from .functional import (
+    MelodieCachedGenerator,
     MelodieFrozenGenerator,
     MelodieGenerator,
     melodie_generator,
     compose,
 )
+from .async_functional import MelodieAsyncGenerator, melodie_async_generator
+from .columnar import MelodieFrozenTable
+from .partitioned import MelodiePartitionedDataset
+from .engines import EnginePool
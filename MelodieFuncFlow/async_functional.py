@@ -0,0 +1,379 @@
+"""
+``MelodieAsyncGenerator``, the ``asyncio`` counterpart of ``MelodieGenerator``.
+"""
+import asyncio
+import collections
+import functools
+import inspect
+
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Deque,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Type,
+    Union,
+)
+
+from .functional import (
+    VARTYPE,
+    VARTYPE2,
+    P,
+    MelodieFrozenGenerator,
+    MelodieGenerator,
+)
+
+
+async def _call(func: Callable[..., Any], *args) -> Any:
+    """
+    Call ``func``, awaiting the result if ``func`` is a coroutine function
+    or returns an awaitable.
+    """
+    ret = func(*args)
+    if inspect.isawaitable(ret):
+        ret = await ret
+    return ret
+
+
+async def _from_sync(iterable: Iterable[VARTYPE]) -> AsyncGenerator[VARTYPE, None]:
+    for item in iterable:
+        yield item
+
+
+class MelodieAsyncGenerator(Generic[VARTYPE]):
+    """
+    The ``asyncio`` counterpart of ``MelodieGenerator``, iterated by ``async for``.
+
+    Operator functions of ``map``, ``filter``, ``extra_job`` and their
+    variants could be either plain functions or coroutine functions.
+    Terminal operations like ``to_list`` and ``reduce`` are coroutines.
+    """
+
+    def __init__(
+        self, inner: Union[AsyncIterable[VARTYPE], Iterable[VARTYPE]]
+    ):
+        if hasattr(inner, "__aiter__"):
+            self.inner = inner.__aiter__()
+        else:
+            self.inner = _from_sync(inner)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> VARTYPE:
+        return await self.inner.__anext__()
+
+    def attributes(self, attr: str) -> "MelodieAsyncGenerator[Any]":
+        """
+        Get attribute from each elements, returning a new generator containing
+        attribute values.
+        """
+
+        async def _(orig_gen):
+            async for item in orig_gen:
+                yield getattr(item, attr)
+
+        return MelodieAsyncGenerator(_(self.inner))
+
+    def cast(self, t_: Type[VARTYPE2]) -> "MelodieAsyncGenerator[VARTYPE2]":
+        """
+        Cast returning type for each element of this iterator.
+        """
+        return MelodieAsyncGenerator(self.inner)
+
+    def filter(
+        self, condition: Callable[[VARTYPE], Union[bool, Awaitable[bool]]]
+    ) -> "MelodieAsyncGenerator[VARTYPE]":
+        """
+        Filter elements that function ``condition`` returns ``True``
+        """
+
+        async def _(orig_gen):
+            async for item in orig_gen:
+                if await _call(condition, item):
+                    yield item
+
+        return MelodieAsyncGenerator(_(self.inner))
+
+    def indexed_filter(
+        self, condition: Callable[[int, VARTYPE], Union[bool, Awaitable[bool]]]
+    ) -> "MelodieAsyncGenerator[VARTYPE]":
+        """
+        Filter elements that function ``condition`` returns ``True`` with index
+        """
+
+        async def _(orig_gen):
+            i = 0
+            async for item in orig_gen:
+                if await _call(condition, i, item):
+                    yield item
+                i += 1
+
+        return MelodieAsyncGenerator(_(self.inner))
+
+    def star_filter(
+        self, condition: Callable[..., Union[bool, Awaitable[bool]]]
+    ) -> "MelodieAsyncGenerator[VARTYPE]":
+        """
+        Filter elements that function ``condition`` returns ``True``.
+        Each element will be unpacked by ``*elem``
+        """
+
+        async def _(orig_gen):
+            async for item in orig_gen:
+                if await _call(condition, *item):
+                    yield item
+
+        return MelodieAsyncGenerator(_(self.inner))
+
+    def extra_job(self, func: Callable[[VARTYPE], Any]) -> "MelodieAsyncGenerator[VARTYPE]":
+        """
+        Inserting function call ``func(elem)`` in the middle of the calculation
+            process, which does not affect the calculation process.
+        """
+
+        async def _(orig_gen):
+            async for item in orig_gen:
+                await _call(func, item)
+                yield item
+
+        return MelodieAsyncGenerator(_(self.inner))
+
+    def indexed_extra_job(
+        self, func: Callable[[int, VARTYPE], Any]
+    ) -> "MelodieAsyncGenerator[VARTYPE]":
+        """
+        Like ``extra_job``, but with index.
+        """
+
+        async def _(orig_gen):
+            i = 0
+            async for item in orig_gen:
+                await _call(func, i, item)
+                yield item
+                i += 1
+
+        return MelodieAsyncGenerator(_(self.inner))
+
+    def _concurrent_map(
+        self,
+        call: Callable[[int, VARTYPE], Awaitable[VARTYPE2]],
+        concurrency: int,
+        ordered: bool,
+    ) -> "MelodieAsyncGenerator[VARTYPE2]":
+        assert concurrency >= 1, "concurrency should be at least 1"
+
+        async def _(orig_gen):
+            if concurrency == 1:
+                i = 0
+                async for item in orig_gen:
+                    yield await call(i, item)
+                    i += 1
+                return
+
+            pending: Deque[asyncio.Future] = collections.deque()
+            exhausted = False
+            i = 0
+            try:
+                while True:
+                    while not exhausted and len(pending) < concurrency:
+                        try:
+                            item = await orig_gen.__anext__()
+                        except StopAsyncIteration:
+                            exhausted = True
+                            break
+                        pending.append(asyncio.ensure_future(call(i, item)))
+                        i += 1
+                    if not pending:
+                        return
+                    if ordered:
+                        task = pending.popleft()
+                        yield await task
+                    else:
+                        done: Set[asyncio.Future] = (
+                            await asyncio.wait(
+                                pending, return_when=asyncio.FIRST_COMPLETED
+                            )
+                        )[0]
+                        task = next(t for t in pending if t in done)
+                        pending.remove(task)
+                        yield task.result()
+            finally:
+                for task in pending:
+                    task.cancel()
+
+        return MelodieAsyncGenerator(_(self.inner))
+
+    def map(
+        self,
+        func: Callable[[VARTYPE], Union[VARTYPE2, Awaitable[VARTYPE2]]],
+        concurrency: int = 1,
+        ordered: bool = True,
+    ) -> "MelodieAsyncGenerator[VARTYPE2]":
+        """
+        Map function ``func`` to each element.
+
+        If ``func`` is a coroutine function, up to ``concurrency`` calls will
+        be awaited concurrently.
+
+        :ordered: Yield results in the input order, or as soon as they complete.
+        """
+        return self._concurrent_map(
+            lambda i, item: _call(func, item), concurrency, ordered
+        )
+
+    def indexed_map(
+        self,
+        func: Callable[[int, VARTYPE], Union[VARTYPE2, Awaitable[VARTYPE2]]],
+        concurrency: int = 1,
+        ordered: bool = True,
+    ) -> "MelodieAsyncGenerator[VARTYPE2]":
+        """
+        Like ``map``, but with index.
+        """
+        return self._concurrent_map(
+            lambda i, item: _call(func, i, item), concurrency, ordered
+        )
+
+    def star_map(
+        self,
+        func: Callable[..., Union[VARTYPE2, Awaitable[VARTYPE2]]],
+        concurrency: int = 1,
+        ordered: bool = True,
+    ) -> "MelodieAsyncGenerator[VARTYPE2]":
+        """
+        Like ``map``, but unpacking each element by ``*elem``.
+        """
+        return self._concurrent_map(
+            lambda i, item: _call(func, *item), concurrency, ordered
+        )
+
+    def slice(
+        self, bound: int, rbound: Optional[int] = None
+    ) -> "MelodieAsyncGenerator[VARTYPE]":
+        """
+        Select an interval of elements, with the same rules as
+        ``MelodieGenerator.slice``.
+        """
+        assert bound >= 0
+        if rbound is None:
+            start, stop = 0, bound
+        elif rbound < 0:
+            assert rbound == -1, "rbound should be -1 or non-negative"
+            start, stop = bound, -1
+        else:
+            assert rbound >= bound
+            start, stop = bound, rbound
+
+        async def _(orig_gen):
+            if stop == start:
+                return
+            i = 0
+            async for item in orig_gen:
+                if i >= start:
+                    yield item
+                i += 1
+                if 0 <= stop <= i:
+                    break
+
+        return MelodieAsyncGenerator(_(self.inner))
+
+    async def fold_left(
+        self, func: Callable[[VARTYPE2, VARTYPE], VARTYPE2], initial: VARTYPE2
+    ) -> VARTYPE2:
+        """
+        Like ``MelodieGenerator.fold_left``. ``func`` could be a coroutine function.
+        """
+        acc = initial
+        async for item in self.inner:
+            acc = await _call(func, acc, item)
+        return acc
+
+    async def reduce(
+        self, func: Callable[[VARTYPE, VARTYPE], VARTYPE], initial: VARTYPE = None
+    ) -> VARTYPE:
+        """
+        Perform reduce on this generator. ``func`` could be a coroutine function.
+        """
+        if initial is None:
+            try:
+                initial = await self.inner.__anext__()
+            except StopAsyncIteration:
+                raise TypeError("reduce() of empty iterable with no initial value")
+        return await self.fold_left(func, initial)
+
+    async def exhaust(self) -> None:
+        """
+        Go through this generator until it is exhausted, returning ``None``.
+        """
+        async for _ in self.inner:
+            pass
+
+    async def head(self) -> VARTYPE:
+        """
+        Get the first element of this generator
+        """
+        return await self.inner.__anext__()
+
+    async def to_list(self) -> List[VARTYPE]:
+        """
+        Convert this generator to list
+        """
+        return [item async for item in self.inner]
+
+    async def to_set(self) -> Set[VARTYPE]:
+        """
+        Convert this generator to set
+        """
+        return {item async for item in self.inner}
+
+    async def freeze(self) -> MelodieFrozenGenerator[VARTYPE]:
+        """
+        Collect all elements into a ``MelodieFrozenGenerator``.
+        """
+        return MelodieFrozenGenerator(await self.to_list())
+
+    def to_sync(self) -> MelodieGenerator[VARTYPE]:
+        """
+        Convert to a ``MelodieGenerator`` driving this generator on a private
+        event loop, pulling one element at each step.
+
+        It could not be used inside a running event loop; use
+        ``await g.freeze()`` there instead.
+        """
+
+        def _(orig_gen):
+            loop = asyncio.new_event_loop()
+            try:
+                while True:
+                    try:
+                        yield loop.run_until_complete(orig_gen.__anext__())
+                    except StopAsyncIteration:
+                        return
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+
+        return MelodieGenerator(_(self.inner))
+
+
+def melodie_async_generator(
+    f: "Callable[P, Union[AsyncGenerator[VARTYPE, None], MelodieAsyncGenerator[VARTYPE]]]",
+) -> "Callable[P, MelodieAsyncGenerator[VARTYPE]]":
+    @functools.wraps(
+        f,
+        assigned=(
+            ("__module__", "__name__", "__qualname__", "__doc__", "__annotation__")
+        ),
+    )
+    def inner(*args, **kwargs):
+        return MelodieAsyncGenerator(f(*args, **kwargs))
+
+    return inner
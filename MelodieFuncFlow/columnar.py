@@ -0,0 +1,392 @@
+"""
+Columnar frozen generators for numeric streams and homogeneous records.
+"""
+import array
+import collections
+import dataclasses
+import functools
+import heapq
+import itertools
+import operator
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from .functional import (
+    VARTYPE,
+    MelodieFrozenGenerator,
+    _FrozenSequence,
+    _is_ndarray,
+)
+
+# Name of the only column of a table built from scalar elements.
+SCALAR_FIELD = "value"
+
+# Number of elements converted to python objects at once when iterating a
+# numpy column.
+_TOLIST_BLOCK = 4096
+
+_EMPTY = object()
+
+
+def _import_numpy(backend: str):
+    assert backend in {"auto", "array", "numpy"}, f"unknown backend {backend!r}"
+    if backend == "array":
+        return None
+    try:
+        import numpy
+    except ImportError:
+        if backend == "numpy":
+            raise
+        return None
+    return numpy
+
+
+class _ColumnBuilder:
+    """
+    Append the values of one column into an ``array.array``.
+
+    The typecode is chosen by the first value: ``"q"`` for ``int`` and ``"d"``
+    for ``float``. If a later value has another type (even ``bool`` or
+    ``int`` into a ``"d"`` column) or does not fit, the column falls back to a
+    list of objects, so the values come back as they were given.
+    """
+
+    __slots__ = ("data", "type")
+
+    def __init__(self):
+        self.data: Union[array.array, List[Any], None] = None
+        self.type: Optional[type] = None
+
+    def append(self, value: Any):
+        data = self.data
+        if data is None:
+            t = self.type = type(value)
+            if t is int:
+                data = array.array("q")
+            elif t is float:
+                data = array.array("d")
+            else:
+                data = []
+            self.data = data
+        elif type(value) is not self.type and isinstance(data, array.array):
+            data = self.data = list(data)
+        try:
+            data.append(value)
+        except OverflowError:
+            data = self.data = list(data)
+            data.append(value)
+
+    def finish(self, numpy) -> Any:
+        data = self.data if self.data is not None else []
+        if numpy is None:
+            return data
+        if isinstance(data, array.array):
+            # Share the buffer of the array, without copying.
+            return numpy.frombuffer(
+                data, dtype=numpy.int64 if data.typecode == "q" else numpy.float64
+            )
+        if len(data) > 0 and all(type(v) is bool for v in data):
+            return numpy.array(data, dtype=bool)
+        return data
+
+
+def _infer_fields(item: Any) -> Optional[List[str]]:
+    """
+    Infer the field names of a record, returning ``None`` for scalars.
+    """
+    if isinstance(item, dict):
+        return list(item.keys())
+    if hasattr(item, "_fields"):
+        return list(item._fields)
+    if dataclasses.is_dataclass(item):
+        return [f.name for f in dataclasses.fields(item)]
+    if hasattr(item, "__dict__"):
+        return list(vars(item).keys())
+    slots = getattr(type(item), "__slots__", None)
+    if slots:
+        return [slots] if isinstance(slots, str) else list(slots)
+    return None
+
+
+def _iter_column(column: Any) -> Iterator[Any]:
+    if _is_ndarray(column):
+        return itertools.chain.from_iterable(
+            column[i : i + _TOLIST_BLOCK].tolist()
+            for i in range(0, len(column), _TOLIST_BLOCK)
+        )
+    return iter(column)
+
+
+def _take_column(column: Any, indices: List[int]) -> Any:
+    if _is_ndarray(column):
+        import numpy
+
+        return column[numpy.asarray(indices, dtype=numpy.intp)]
+    if isinstance(column, array.array):
+        return array.array(column.typecode, map(column.__getitem__, indices))
+    return [column[i] for i in indices]
+
+
+def _compress_column(column: Any, mask: Any) -> Any:
+    if _is_ndarray(column):
+        import numpy
+
+        return column[numpy.asarray(mask, dtype=bool)]
+    if isinstance(column, array.array):
+        return array.array(column.typecode, itertools.compress(column, mask))
+    return list(itertools.compress(column, mask))
+
+
+class _TableRows(_FrozenSequence):
+    """
+    The rows of a ``MelodieFrozenTable``, built on access.
+    """
+
+    __slots__ = ("_table",)
+
+    def __init__(self, table: "MelodieFrozenTable"):
+        self._table = table
+
+    def __len__(self):
+        return self._table._length
+
+    def __iter__(self):
+        return self._table._iter_rows()
+
+    def __getitem__(self, index: int):
+        return self._table.row(index)
+
+
+class MelodieFrozenTable(MelodieFrozenGenerator[VARTYPE]):
+    """
+    A ``MelodieFrozenGenerator`` storing each field of the elements in a
+    compact column instead of a list of objects.
+
+    Numeric columns are ``numpy.ndarray`` (or ``array.array`` without numpy),
+    and other columns are lists. Iterating the table yields rows as
+    namedtuples with the same field names, or the values themselves for a
+    table built from scalars.
+
+    Column operations avoid building the rows: ``attributes`` and ``column``
+    return the column directly, ``where`` and ``filter`` build a mask, and
+    ``sort`` by a field name sorts the column only.
+    """
+
+    def __init__(self, columns: Dict[str, Any], scalar: bool = False):
+        lengths = {len(column) for column in columns.values()}
+        assert len(lengths) <= 1, "all columns should have the same length"
+        assert not scalar or len(columns) == 1, "scalar table should have only one column"
+        self._columns = dict(columns)
+        self._length = lengths.pop() if lengths else 0
+        self._scalar = scalar
+        self._row_type = (
+            None if scalar else collections.namedtuple("Row", list(columns), rename=True)
+        )
+        self.inner = _TableRows(self)
+        self._sort_cache = {}
+
+    @classmethod
+    def from_iterable(
+        cls,
+        iterable: Iterable[Any],
+        fields: Optional[List[str]] = None,
+        backend: str = "auto",
+    ) -> "MelodieFrozenTable[Any]":
+        """
+        Build a table in one pass over ``iterable``.
+
+        Elements could be numbers, or records like dicts, namedtuples,
+        dataclasses and other objects with attributes.
+
+        :fields: Field names of the records. Inferred from the first element if ``None``.
+        :backend: ``"numpy"``, ``"array"``, or ``"auto"`` for numpy if installed.
+        """
+        numpy = _import_numpy(backend)
+        it = iter(iterable)
+        first = next(it, _EMPTY)
+        if first is _EMPTY:
+            names = fields if fields is not None else [SCALAR_FIELD]
+            return cls(
+                {name: _ColumnBuilder().finish(numpy) for name in names},
+                scalar=fields is None,
+            )
+        it = itertools.chain((first,), it)
+
+        if fields is None:
+            fields = _infer_fields(first)
+        if fields is None:
+            builder = _ColumnBuilder()
+            for item in it:
+                builder.append(item)
+            return cls({SCALAR_FIELD: builder.finish(numpy)}, scalar=True)
+
+        getter = operator.itemgetter if isinstance(first, dict) else operator.attrgetter
+        getters = [getter(name) for name in fields]
+        builders = [_ColumnBuilder() for _ in fields]
+        pairs = list(zip(builders, getters))
+        for item in it:
+            for builder, get in pairs:
+                builder.append(get(item))
+        return cls(
+            {name: builder.finish(numpy) for name, builder in zip(fields, builders)}
+        )
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._columns)
+
+    def column(self, name: str = SCALAR_FIELD) -> Any:
+        """
+        Get the column storing field ``name``, without copying.
+        """
+        return self._columns[name]
+
+    def to_columns(self) -> Dict[str, Any]:
+        """
+        Get all columns as a dict of ``{field: column}``. Unlike this,
+        ``to_dict`` builds a dict from rows of ``(key, value)`` pairs, like
+        for any ``MelodieGenerator``.
+        """
+        return dict(self._columns)
+
+    def row(self, index: int) -> Any:
+        """
+        Build the row at ``index``.
+        """
+        values = []
+        for column in self._columns.values():
+            value = column[index]
+            values.append(value.item() if _is_ndarray(column) else value)
+        if self._scalar:
+            return values[0]
+        return self._row_type._make(values)
+
+    def _iter_rows(self) -> Iterator[Any]:
+        columns = [_iter_column(column) for column in self._columns.values()]
+        if self._scalar:
+            return columns[0]
+        return map(self._row_type._make, zip(*columns))
+
+    def attributes(self, attr: str) -> "MelodieFrozenTable[Any]":
+        """
+        Get the column of field ``attr`` as a single-column table, without copying.
+        """
+        if attr not in self._columns:
+            return super().attributes(attr)
+        return MelodieFrozenTable({SCALAR_FIELD: self._columns[attr]}, scalar=True)
+
+    def take(self, indices: List[int]) -> "MelodieFrozenTable[VARTYPE]":
+        """
+        Build a new table with the rows at ``indices``.
+        """
+        return MelodieFrozenTable(
+            {name: _take_column(column, indices) for name, column in self._columns.items()},
+            self._scalar,
+        )
+
+    def where(self, mask: Any) -> "MelodieFrozenTable[VARTYPE]":
+        """
+        Build a new table with the rows where ``mask`` is true. ``mask`` could be
+        a sequence of bools, or a boolean ``numpy.ndarray`` computed from the
+        columns, like ``t.where(t.column("age") > 18)``.
+        """
+        assert len(mask) == self._length, "mask should have the same length as the table"
+        return MelodieFrozenTable(
+            {name: _compress_column(column, mask) for name, column in self._columns.items()},
+            self._scalar,
+        )
+
+    def filter(
+        self, condition: Callable[[VARTYPE], bool]
+    ) -> "MelodieFrozenTable[VARTYPE]":
+        """
+        Filter rows that function ``condition`` returns ``True``, returning a
+        new table. Unlike ``MelodieGenerator.filter``, this is not lazy.
+        """
+        return self.where([bool(condition(row)) for row in self._iter_rows()])
+
+    def _view(self, index: slice) -> "MelodieFrozenTable[VARTYPE]":
+        # Slices of numpy columns are views, other columns are copied.
+        return MelodieFrozenTable(
+            {name: column[index] for name, column in self._columns.items()},
+            self._scalar,
+        )
+
+    def _column_permutation(self, name: str, reverse: bool, cache: bool) -> List[int]:
+        perm = self._cached_permutation(name, reverse)
+        if perm is None:
+            column = self._columns[name]
+            if _is_ndarray(column) and column.dtype.kind in "biuf":
+                import numpy
+
+                if reverse:
+                    # Keep the order of equal elements like ``list.sort(reverse=True)``
+                    n = len(column)
+                    perm = (n - 1 - numpy.argsort(column[::-1], kind="stable"))[::-1]
+                else:
+                    perm = numpy.argsort(column, kind="stable")
+                perm = perm.tolist()
+            else:
+                perm = sorted(range(self._length), key=column.__getitem__, reverse=reverse)
+            if cache:
+                self._cache_permutation(name, reverse, perm)
+        return perm
+
+    def sort(
+        self, key: Union[str, Callable[[VARTYPE], Any]], reverse=False, cache=False
+    ) -> "MelodieFrozenTable[VARTYPE]":
+        """
+        Sort by a field name, using ``argsort`` on that column, or by a key
+        function on rows. The permutation is cached if ``cache``, like
+        ``MelodieFrozenGenerator.sort``.
+        """
+        if isinstance(key, str):
+            perm = self._column_permutation(key, reverse, cache)
+        else:
+            perm = self._sort_permutation(key, key, reverse, cache)
+        return self.take(perm)
+
+    def relsort(
+        self, cmp: Callable[[VARTYPE, VARTYPE], bool], reverse=False, cache=False
+    ) -> "MelodieFrozenTable[VARTYPE]":
+        """
+        Sort by relative comparisons of rows, returning a new table.
+        """
+        return self.take(
+            self._sort_permutation(cmp, functools.cmp_to_key(cmp), reverse, cache)
+        )
+
+    def _select(
+        self, k: int, key: Union[str, Callable[[VARTYPE], Any], None], largest: bool
+    ) -> "MelodieFrozenTable[VARTYPE]":
+        perm = self._cached_permutation(key, largest)
+        if perm is not None:
+            return self.take(perm[:k])
+        select = heapq.nlargest if largest else heapq.nsmallest
+        if isinstance(key, str):
+            indices = select(k, range(self._length), key=self._columns[key].__getitem__)
+        else:
+            key_func = key if key is not None else (lambda row: row)
+            pairs = select(
+                k, enumerate(self._iter_rows()), key=lambda pair: key_func(pair[1])
+            )
+            indices = [i for i, _ in pairs]
+        return self.take(indices)
+
+    def top_k(
+        self, k: int, key: Union[str, Callable[[VARTYPE], Any], None] = None
+    ) -> "MelodieFrozenTable[VARTYPE]":
+        """
+        Get the ``k`` largest rows in descending order, as a new table.
+        ``key`` could be a field name.
+        """
+        return self._select(k, key, True)
+
+    def bottom_k(
+        self, k: int, key: Union[str, Callable[[VARTYPE], Any], None] = None
+    ) -> "MelodieFrozenTable[VARTYPE]":
+        """
+        Get the ``k`` smallest rows in ascending order, as a new table.
+        ``key`` could be a field name.
+        """
+        return self._select(k, key, False)
@@ -0,0 +1,209 @@
+"""
+A reusable pool of ``ipyparallel`` engines, the ``ipyparallel`` backend of
+``parallel_map``.
+
+The client and its views are created on first use and kept, so successive
+calls do not reconnect to the cluster, and initialization runs once per
+pool. Elements are sent in chunks through a load-balanced view, and results
+are awaited by ``concurrent.futures.wait`` on the ``AsyncResult`` objects
+instead of polling.
+"""
+import textwrap
+import threading
+import types
+
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .parallel import _ChunkSizer, _completed_futures, _run_chunk, _take
+
+
+def _init_key(step: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    # Arguments are compared by identity, as ``==`` of arguments like numpy
+    # arrays does not give a bool.
+    if step[0] == "code":
+        return step
+    func = step[1]
+    # Bound methods are created on each access, unlike their instance.
+    owner = getattr(func, "__self__", None)
+    if owner is None or isinstance(owner, types.ModuleType):
+        func_key = id(func)
+    else:
+        func_key = (id(owner), getattr(func, "__name__", None))
+    return ("func", func_key, tuple(map(id, step[2])))
+
+
+class EnginePool:
+    """
+    The engines of an ``ipyparallel`` cluster, reused by ``parallel_map``::
+
+        pool = EnginePool(init_code="import numpy as np", profile="cluster")
+        MelodieGenerator(data).parallel_map(func, engine_pool=pool).to_list()
+
+    :init_functions: Functions called once on every engine before the first
+        map, like ``initializer`` of ``parallel_map``.
+    :init_code: Python code executed once on every engine before the first map.
+    :client: An existing ``ipyparallel.Client`` to use. Otherwise, one is
+        created with ``client_kwargs`` (like ``profile`` or ``url_file``).
+    """
+
+    _shared: Optional["EnginePool"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        init_functions: Sequence[Callable[[], Any]] = (),
+        init_code: str = "",
+        client: Any = None,
+        **client_kwargs: Any,
+    ):
+        self.client_kwargs = client_kwargs
+        self.closed = False
+        self._client = client
+        self._view = None
+        self._direct_view = None
+        self._lock = threading.Lock()
+        # Initializations already done on the engines, by ``_init_key``. The
+        # steps are kept so the ids in their keys are not reused.
+        self._initialized: Dict[Tuple[Any, ...], Tuple[Any, ...]] = {}
+        self._pending_init: List[Tuple[Any, ...]] = [
+            ("func", func, ()) for func in init_functions
+        ]
+        if init_code:
+            self._pending_init.append(("code", init_code))
+
+    @classmethod
+    def shared(cls) -> "EnginePool":
+        """
+        The pool of the default cluster, used by ``parallel_map`` when no
+        ``engine_pool`` is given.
+        """
+        with cls._shared_lock:
+            if cls._shared is None or cls._shared.closed:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def client(self) -> Any:
+        assert not self.closed, "the engine pool is closed"
+        if self._client is None:
+            from ipyparallel import Client
+
+            self._client = Client(**self.client_kwargs)
+        return self._client
+
+    @property
+    def view(self) -> Any:
+        """
+        The load-balanced view tasks are submitted to.
+        """
+        if self._view is None:
+            self._view = self.client.load_balanced_view()
+        return self._view
+
+    @property
+    def direct_view(self) -> Any:
+        """
+        The view of all engines, used to initialize them.
+        """
+        if self._direct_view is None:
+            self._direct_view = self.client[:]
+        return self._direct_view
+
+    @property
+    def n_engines(self) -> int:
+        return len(self.client.ids)
+
+    def initialize(
+        self,
+        func: Optional[Callable[..., Any]] = None,
+        args: Tuple[Any, ...] = (),
+        code: str = "",
+    ):
+        """
+        Call ``func(*args)`` and execute ``code`` on every engine, unless this
+        pool already did so with the same function and argument objects, or
+        the same code. Engines started afterwards are not initialized.
+        """
+        steps = []
+        if code:
+            steps.append(("code", code))
+        if func is not None:
+            steps.append(("func", func, tuple(args)))
+        with self._lock:
+            steps, self._pending_init = self._pending_init + steps, []
+            for step in steps:
+                key = _init_key(step)
+                if key in self._initialized:
+                    continue
+                if step[0] == "code":
+                    self.direct_view.execute(textwrap.dedent(step[1]), block=True)
+                else:
+                    self.direct_view.apply_sync(step[1], *step[2])
+                self._initialized[key] = step
+
+    def map(
+        self,
+        iterable: Iterable[Any],
+        func: Callable[..., Any],
+        star: bool = False,
+        chunksize: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+        total: Optional[int] = None,
+    ) -> Generator[Any, None, None]:
+        """
+        Map ``func`` over ``iterable`` on the engines, yielding results as a
+        stream. The arguments are like those of ``parallel.process_map``,
+        ``max_in_flight`` being ``2 * n_engines`` by default.
+
+        Tasks still pending when this generator is closed are aborted.
+        """
+        self.initialize()
+        engines = max(1, self.n_engines)
+        max_in_flight = max_in_flight if max_in_flight is not None else 2 * engines
+        assert max_in_flight >= 1
+        sizer = _ChunkSizer(chunksize, engines, total)
+        source = iter(iterable)
+        view = self.view
+        submitted: Set[Any] = set()
+
+        def submit() -> Any:
+            chunk = _take(source, sizer.size)
+            if len(chunk) == 0:
+                return None
+            future = view.apply_async(_run_chunk, func, star, chunk)
+            submitted.add(future)
+            return future
+
+        futures = _completed_futures(submit, max_in_flight, ordered)
+        try:
+            for future in futures:
+                submitted.discard(future)
+                results, elapsed = future.result()
+                sizer.feedback(len(results), elapsed)
+                yield from results
+        finally:
+            # Abort before closing ``futures``, which cancels the pending
+            # futures locally and would make them look done.
+            for future in submitted:
+                if not future.done():
+                    try:
+                        future.abort()
+                    except Exception:
+                        pass
+            futures.close()
+
+    def close(self):
+        """
+        Close the connection to the cluster. The engines keep running.
+        """
+        if self._client is not None and not self.closed:
+            self._client.close()
+        self.closed = True
+        self._client = self._view = self._direct_view = None
+
+    def __enter__(self) -> "EnginePool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
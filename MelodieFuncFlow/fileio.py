@@ -0,0 +1,229 @@
+"""
+Buffered file sources and sinks of ``MelodieGenerator``.
+
+Files ending with ``.gz`` are compressed with gzip unless ``compress`` is
+given explicitly.
+"""
+import csv
+import gzip
+import itertools
+import json
+import struct
+
+from typing import IO, Any, Dict, Generator, Iterable, List, Optional, Sequence, Tuple, Union
+
+DEFAULT_CHUNK_SIZE = 2**20
+DEFAULT_BUFFER_SIZE = 2**20
+# Number of rows passed to ``csv.writer.writerows`` at once.
+_CSV_BATCH = 1024
+
+
+def _open(
+    path: str,
+    mode: str,
+    compress: Optional[bool],
+    buffering: int,
+    compresslevel: int = 6,
+    **kwargs,
+) -> IO:
+    if compress is None:
+        compress = str(path).endswith(".gz")
+    if compress:
+        # Reads of gzip files are buffered internally, and writes here are
+        # already done in large blocks.
+        return gzip.open(path, mode, compresslevel=compresslevel, **kwargs)
+    return open(path, mode, buffering=buffering, **kwargs)
+
+
+def read_lines(
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    encoding: str = "utf-8",
+    compress: Optional[bool] = None,
+) -> Generator[str, None, None]:
+    """
+    Yield the lines of a text file without trailing newlines, reading
+    ``chunk_size`` characters at once and splitting them in bulk.
+    """
+    with _open(path, "rt", compress, chunk_size, encoding=encoding) as f:
+        remainder = ""
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            lines = (remainder + block).split("\n")
+            remainder = lines.pop()
+            yield from lines
+        if remainder:
+            yield remainder
+
+
+def read_csv(
+    path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    header: bool = True,
+    encoding: str = "utf-8",
+    compress: Optional[bool] = None,
+    **fmtparams,
+) -> Generator[Union[Dict[str, str], List[str]], None, None]:
+    """
+    Yield the rows of a csv file, as dicts if ``header`` else lists.
+    """
+    with _open(path, "rt", compress, chunk_size, encoding=encoding, newline="") as f:
+        if header:
+            yield from csv.DictReader(f, **fmtparams)
+        else:
+            yield from csv.reader(f, **fmtparams)
+
+
+def read_records(
+    path: str,
+    fmt: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    compress: Optional[bool] = None,
+) -> Generator[Tuple[Any, ...], None, None]:
+    """
+    Yield fixed-size binary records as tuples, unpacked by the ``struct``
+    format ``fmt`` from blocks of about ``chunk_size`` bytes.
+    """
+    record = struct.Struct(fmt)
+    block_size = max(1, chunk_size // record.size) * record.size
+    with _open(path, "rb", compress, block_size) as f:
+        remainder = b""
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            if remainder:
+                block = remainder + block
+            usable = len(block) - len(block) % record.size
+            remainder = block[usable:]
+            yield from record.iter_unpack(memoryview(block)[:usable])
+        if remainder:
+            raise ValueError(
+                f"{path} ends with an incomplete record of {len(remainder)} bytes"
+            )
+
+
+def _write_text_blocks(f: IO, texts: Iterable[str], buffer_size: int) -> int:
+    """
+    Write ``texts`` joined in blocks of about ``buffer_size`` characters,
+    returning the number of texts.
+    """
+    n = 0
+    parts: List[str] = []
+    size = 0
+    for text in texts:
+        parts.append(text)
+        size += len(text)
+        n += 1
+        if size >= buffer_size:
+            f.write("".join(parts))
+            parts.clear()
+            size = 0
+    if parts:
+        f.write("".join(parts))
+    return n
+
+
+def write_lines(
+    items: Iterable[str],
+    path: str,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    encoding: str = "utf-8",
+    compress: Optional[bool] = None,
+    compresslevel: int = 6,
+) -> int:
+    """
+    Write each string as one line, returning the number of lines.
+    """
+    with _open(path, "wt", compress, buffer_size, compresslevel, encoding=encoding) as f:
+        return _write_text_blocks(f, (item + "\n" for item in items), buffer_size)
+
+
+def write_jsonl(
+    items: Iterable[Any],
+    path: str,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    encoding: str = "utf-8",
+    compress: Optional[bool] = None,
+    compresslevel: int = 6,
+    **json_kwargs,
+) -> int:
+    """
+    Write each element as one line of JSON, returning the number of lines.
+    """
+    dumps = json.JSONEncoder(**json_kwargs).encode
+    return write_lines(
+        map(dumps, items), path, buffer_size, encoding, compress, compresslevel
+    )
+
+
+def write_csv(
+    items: Iterable[Union[Dict[str, Any], Sequence[Any]]],
+    path: str,
+    fields: Optional[List[str]] = None,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    encoding: str = "utf-8",
+    compress: Optional[bool] = None,
+    compresslevel: int = 6,
+    **fmtparams,
+) -> int:
+    """
+    Write rows to a csv file, returning the number of rows.
+
+    Dict rows are written with a header of ``fields``, or the keys of the
+    first row if ``fields`` is ``None``. Sequence rows are written as they
+    are, with a header row of ``fields`` if given.
+    """
+    it = iter(items)
+    first = next(it, None)
+    with _open(
+        path, "wt", compress, buffer_size, compresslevel, encoding=encoding, newline=""
+    ) as f:
+        if first is None:
+            if fields is not None:
+                csv.writer(f, **fmtparams).writerow(fields)
+            return 0
+        it = itertools.chain((first,), it)
+        if isinstance(first, dict):
+            writer = csv.DictWriter(
+                f, fields if fields is not None else list(first), **fmtparams
+            )
+            writer.writeheader()
+        else:
+            writer = csv.writer(f, **fmtparams)
+            if fields is not None:
+                writer.writerow(fields)
+        n = 0
+        while True:
+            batch = list(itertools.islice(it, _CSV_BATCH))
+            if not batch:
+                return n
+            writer.writerows(batch)
+            n += len(batch)
+
+
+def write_records(
+    items: Iterable[Sequence[Any]],
+    path: str,
+    fmt: str,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    compress: Optional[bool] = None,
+    compresslevel: int = 6,
+) -> int:
+    """
+    Pack each element (a tuple) by the ``struct`` format ``fmt`` as a
+    fixed-size binary record, returning the number of records.
+    """
+    record = struct.Struct(fmt)
+    per_block = max(1, buffer_size // record.size)
+    it = iter(items)
+    n = 0
+    with _open(path, "wb", compress, buffer_size, compresslevel) as f:
+        while True:
+            batch = list(itertools.islice(it, per_block))
+            if not batch:
+                return n
+            f.write(b"".join(itertools.starmap(record.pack, batch)))
+            n += len(batch)
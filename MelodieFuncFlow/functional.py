@@ -1,9 +1,18 @@
+import array
+import copy
 import functools
+import heapq
+import itertools
+import operator
+import sys
+import threading
+import weakref
 
 
 from typing import (
     Any,
     Callable,
+    Dict,
     Generator,
     Generic,
     Iterable,
@@ -28,37 +37,372 @@ VARTYPE3 = TypeVar("VARTYPE3")
 P = ParamSpec("P")
 
 
-def _in_jupyter() -> bool:
-    try:
-        from IPython import get_ipython
+def _is_ndarray(obj: Any) -> bool:
+    """
+    Check if ``obj`` is a ``numpy.ndarray``, without importing numpy.
+    """
+    numpy = sys.modules.get("numpy")
+    return numpy is not None and isinstance(obj, numpy.ndarray)
+
+
+_STAGE_TEMPLATES = {
+    "map": ("item = {f}(item)",),
+    "indexed_map": ("{c} += 1", "item = {f}({c}, item)"),
+    "star_map": ("item = {f}(*item)",),
+    "filter": ("if not {f}(item):", "    continue"),
+    "indexed_filter": ("{c} += 1", "if not {f}({c}, item):", "    continue"),
+    "star_filter": ("if not {f}(*item):", "    continue"),
+    "extra_job": ("{f}(item)",),
+    "indexed_extra_job": ("{c} += 1", "{f}({c}, item)"),
+    "attributes": ("item = getattr(item, {f})",),
+    "cast": (),
+}
+
+# Stage kinds which might drop elements.
+_FILTER_KINDS = frozenset({"filter", "indexed_filter", "star_filter"})
+
+_FUSED_LOOP_CACHE = {}
+
+
+def _attributes_of(name: str, source: Iterable) -> Iterable:
+    return map(operator.attrgetter(name), source)
+
+
+def _cast(t: Any, source: Iterable) -> Iterable:
+    return source
 
-        shell = get_ipython().__class__.__name__
-        if shell == "ZMQInteractiveShell":
-            return True  # Jupyter notebook or qtconsole
-        else:
-            return False
-    except:
-        return False
 
+# Builtin iterators doing the same as the stage kinds which have one. A plan
+# made of these only is run as a chain of them, which starts faster than the
+# compiled loop, and does not resume a python frame for each element.
+_BUILTIN_STAGES = {
+    "map": map,
+    "filter": filter,
+    "star_map": itertools.starmap,
+    "attributes": _attributes_of,
+    "cast": _cast,
+}
+
+
+class _Stage:
+    """
+    One element-wise stage of a ``MelodieGenerator`` plan.
+
+    :kind: One of the keys of ``_STAGE_TEMPLATES``
+    :func: The operator function, or the attribute name for ``attributes``
+    """
+
+    __slots__ = ("kind", "func")
+
+    def __init__(self, kind: str, func: Any):
+        assert kind in _STAGE_TEMPLATES, f"unknown stage kind {kind}"
+        self.kind = kind
+        self.func = func
+
+    def describe(self) -> str:
+        if self.kind == "attributes":
+            return f"{self.kind}({self.func!r})"
+        if self.kind == "cast":
+            return f"{self.kind}({getattr(self.func, '__name__', self.func)})"
+        return f"{self.kind}({getattr(self.func, '__qualname__', repr(self.func))})"
+
+
+def _build_fused_loop(kinds: Tuple[str, ...]) -> Callable[..., Generator]:
+    """
+    Generate the source of one generator function running all stages of
+    ``kinds`` inside a single ``for`` loop, and compile it.
 
-def _import_tqdm_module():
-    if _in_jupyter():
-        from tqdm.notebook import tqdm
+    The stage functions are passed in as arguments, so the compiled loop
+    could be shared by all plans with the same sequence of stage kinds.
+    """
+    params = ", ".join(f"f{i}" for i in range(len(kinds)))
+    lines = [f"def _fused(source, {params}):"]
+    for i, kind in enumerate(kinds):
+        if kind.startswith("indexed_"):
+            lines.append(f"    c{i} = -1")
+    lines.append("    for item in source:")
+    for i, kind in enumerate(kinds):
+        for template in _STAGE_TEMPLATES[kind]:
+            lines.append("        " + template.format(f=f"f{i}", c=f"c{i}"))
+    lines.append("        yield item")
+    namespace = {}
+    exec(compile("\n".join(lines), f"<fused loop {'->'.join(kinds)}>", "exec"), namespace)
+    return namespace["_fused"]
+
+
+def _run_stages(source: Iterable, stages: Tuple[_Stage, ...]) -> Iterable:
+    """
+    Fuse ``stages`` into one loop over ``source``, or chain the builtin
+    iterators of ``_BUILTIN_STAGES`` if all stages have one.
+    """
+    if len(stages) == 0:
+        return source
+    chained = source
+    for stage in stages:
+        builtin = _BUILTIN_STAGES.get(stage.kind)
+        if builtin is None:
+            break
+        chained = builtin(stage.func, chained)
     else:
-        from tqdm import tqdm
-    return tqdm
+        return chained
+    kinds = tuple([stage.kind for stage in stages])
+    fused = _FUSED_LOOP_CACHE.get(kinds)
+    if fused is None:
+        fused = _FUSED_LOOP_CACHE[kinds] = _build_fused_loop(kinds)
+    return fused(source, *[stage.func for stage in stages])
+
+
+def _reduce_by_key(
+    iterable: Iterable[Any],
+    key: Callable[[Any], Any],
+    func: Callable[[Any, Any], Any],
+    initial: Any,
+) -> dict:
+    """
+    Hash aggregation of ``iterable`` in one pass. If ``initial`` is ``None``,
+    the first element of each key is its initial value; otherwise each key
+    starts from a shallow copy of ``initial``.
+    """
+    acc = {}
+    if initial is None:
+        for item in iterable:
+            k = key(item)
+            if k in acc:
+                acc[k] = func(acc[k], item)
+            else:
+                acc[k] = item
+    else:
+        for item in iterable:
+            k = key(item)
+            if k in acc:
+                acc[k] = func(acc[k], item)
+            else:
+                acc[k] = func(copy.copy(initial), item)
+    return acc
+
+
+def _reduce_chunk_by_key(
+    key: Callable[[Any], Any],
+    func: Callable[[Any, Any], Any],
+    initial: Any,
+    chunk: List[Any],
+) -> dict:
+    # Executed inside worker processes.
+    return _reduce_by_key(chunk, key, func, initial)
+
+
+def _count_one(acc: int, item: Any) -> int:
+    return acc + 1
+
+
+_JOIN_TYPES = {"inner", "left", "right", "outer"}
+
+
+def _hash_join(
+    build: Iterable[Any],
+    probe: Iterable[Any],
+    build_key: Callable[[Any], Any],
+    probe_key: Callable[[Any], Any],
+    build_is_left: bool,
+    keep_build: bool,
+    keep_probe: bool,
+) -> Generator[Tuple[Any, Any], None, None]:
+    """
+    Build a hash table of ``build``, and stream ``probe`` through it, yielding
+    ``(left, right)`` pairs. Unmatched elements of ``probe`` are yielded as
+    they come if ``keep_probe``, and unmatched elements of ``build`` are
+    yielded at the end if ``keep_build``, paired with ``None``.
+    """
+    table = {}
+    for item in build:
+        k = build_key(item)
+        if k in table:
+            table[k].append(item)
+        else:
+            table[k] = [item]
+    matched = set()
+    for item in probe:
+        k = probe_key(item)
+        matches = table.get(k)
+        if matches is not None:
+            if keep_build:
+                matched.add(k)
+            if build_is_left:
+                for b in matches:
+                    yield b, item
+            else:
+                for b in matches:
+                    yield item, b
+        elif keep_probe:
+            yield (None, item) if build_is_left else (item, None)
+    if keep_build:
+        for k, items in table.items():
+            if k not in matched:
+                for b in items:
+                    yield (b, None) if build_is_left else (None, b)
+
+
+def _merge_join(
+    left: Iterable[Any],
+    right: Iterable[Any],
+    left_key: Callable[[Any], Any],
+    right_key: Callable[[Any], Any],
+    keep_left: bool,
+    keep_right: bool,
+) -> Generator[Tuple[Any, Any], None, None]:
+    """
+    Join two inputs sorted ascending by their keys, holding only one group of
+    the right input in memory.
+    """
+    left_groups = itertools.groupby(left, left_key)
+    right_groups = itertools.groupby(right, right_key)
+    left_next = next(left_groups, None)
+    right_next = next(right_groups, None)
+    while left_next is not None and right_next is not None:
+        (lk, left_group), (rk, right_group) = left_next, right_next
+        if lk < rk:
+            if keep_left:
+                for item in left_group:
+                    yield item, None
+            left_next = next(left_groups, None)
+        elif rk < lk:
+            if keep_right:
+                for item in right_group:
+                    yield None, item
+            right_next = next(right_groups, None)
+        else:
+            rights = list(right_group)
+            for item in left_group:
+                for r in rights:
+                    yield item, r
+            left_next = next(left_groups, None)
+            right_next = next(right_groups, None)
+    if keep_left:
+        while left_next is not None:
+            for item in left_next[1]:
+                yield item, None
+            left_next = next(left_groups, None)
+    if keep_right:
+        while right_next is not None:
+            for item in right_next[1]:
+                yield None, item
+            right_next = next(right_groups, None)
 
 
 class MelodieGenerator(Generic[VARTYPE]):
     """
     A generator supporting some common functional-programming operations
+
+    Element-wise operations (``map``, ``filter``, ``extra_job``, their
+    indexed/star variants, ``attributes`` and ``cast``) are not executed
+    one generator per operation. Instead, they are recorded as a plan of
+    stages, and fused into one loop when the iteration starts, or chained
+    as the builtin ``map`` and ``filter`` if all stages are like these.
+    Use ``explain()`` to inspect the plan.
     """
 
+    # Known number of elements of the source, used when it has no length hint.
+    _total: Optional[int] = None
+
     def __init__(self, inner: Union[Generator[VARTYPE, None, None], Iterable[VARTYPE]]):
-        self.inner = iter(inner)
+        self._source = iter(inner)
+        self._stages: Tuple[_Stage, ...] = ()
+        self._running: Optional[Iterable[VARTYPE]] = None
+
+    @property
+    def inner(self) -> Iterable[VARTYPE]:
+        """
+        The underlying iterator. Accessing it compiles the plan, after which
+        new stages will be chained upon the running iterator.
+        """
+        if self._running is None:
+            self._running = _run_stages(self._source, self._stages)
+        return self._running
+
+    @inner.setter
+    def inner(self, inner: Iterable[VARTYPE]):
+        self._source = inner
+        self._stages = ()
+        self._running = inner
+
+    def _with_stage(self, kind: str, func: Any) -> "MelodieGenerator[Any]":
+        # Only the stage is recorded here; the loop is compiled (or looked up)
+        # when the iteration starts. ``__init__`` is skipped, as the source is
+        # an iterator already.
+        g = MelodieGenerator.__new__(MelodieGenerator)
+        g._running = None
+        if self._running is None:
+            g._source = self._source
+            g._stages = self._stages + (_Stage(kind, func),)
+            if self._total is not None:
+                g._total = self._total
+        else:
+            g._source = self.inner
+            g._stages = (_Stage(kind, func),)
+            g._total = self._length_hint()
+        return g
+
+    def _length_hint(self) -> Optional[int]:
+        """
+        The number of elements this generator will yield if it is known
+        without consuming it, otherwise ``None``.
+        """
+        if any(stage.kind in _FILTER_KINDS for stage in self._stages):
+            return None
+        if self._total is not None:
+            return self._total
+        hint = operator.length_hint(
+            self._source if self._running is None else self._running, -1
+        )
+        return None if hint < 0 else hint
+
+    def explain(self) -> str:
+        """
+        Describe the plan of this generator, returning a string like::
+
+            MelodieGenerator plan (3 stages fused into 1 loop)
+              source: list_iterator
+              0: map(<lambda>)
+              1: filter(is_valid)
+              2: attributes('value')
+        """
+        state = "running" if self._running is not None else "pending"
+        lines = [
+            f"{self.__class__.__name__} plan ({len(self._stages)} stages fused into 1 loop, {state})",
+            f"  source: {type(self._source).__name__}",
+        ]
+        for i, stage in enumerate(self._stages):
+            lines.append(f"  {i}: {stage.describe()}")
+        return "\n".join(lines)
+
+    def profile(self) -> "MelodieGenerator[VARTYPE]":
+        """
+        Get a generator running the same plan with each stage instrumented.
+        After (or while) consuming it, its ``profiler`` attribute, a
+        ``PipelineProfile``, reports the elements in/out, self and cumulative
+        time, throughput and selectivity of each stage::
+
+            g = MelodieGenerator(data).map(parse).filter(is_valid).profile()
+            g.exhaust()
+            print(g.profiler.table())
+
+        Only the stages fused so far are profiled. Elements coming from
+        earlier non-fusable operations are timed as the source.
+        Generators not profiled pay nothing for this.
+        """
+        from .profiling import PipelineProfile
+
+        if self._running is None:
+            profiler = PipelineProfile(self._source, self._stages)
+        else:
+            profiler = PipelineProfile(self.inner, ())
+        g = MelodieGenerator(profiler.source)
+        g._stages = tuple(_Stage(kind, probe) for kind, probe in profiler.probed_funcs)
+        g.profiler = profiler
+        return g
 
     def __iter__(self):
-        return self
+        return self.inner
 
     def __next__(self) -> VARTYPE:
         return self.inner.__next__()
@@ -68,23 +412,13 @@ class MelodieGenerator(Generic[VARTYPE]):
         Get attribute from each elements, returning a new generator containing
         attribute values.
         """
-
-        def _(orig_gen):
-            item: VARTYPE
-            for item in orig_gen:
-                yield getattr(item, attr)
-
-        return MelodieGenerator(_(self.inner))
+        return self._with_stage("attributes", attr)
 
     def cast(self, t_: Type[VARTYPE2]) -> "MelodieGenerator[VARTYPE2]":
         """
         Cast returning type for each element of this iterator.
         """
-
-        def _(orig_gen: MelodieGenerator[VARTYPE]):
-            yield from orig_gen
-
-        return MelodieGenerator(_(self.inner))
+        return self._with_stage("cast", t_)
 
     def filter(
         self, condition: Callable[[VARTYPE], bool]
@@ -92,14 +426,7 @@ class MelodieGenerator(Generic[VARTYPE]):
         """
         Filter elements that function ``condition`` returns ``True``
         """
-
-        def _(orig_gen):
-            item: VARTYPE
-            for item in orig_gen:
-                if condition(item):
-                    yield item
-
-        return MelodieGenerator(_(self.inner))
+        return self._with_stage("filter", condition)
 
     def indexed_filter(
         self, condition: Callable[[int, VARTYPE], bool]
@@ -107,14 +434,7 @@ class MelodieGenerator(Generic[VARTYPE]):
         """
         Filter elements that function ``condition`` returns ``True`` with index
         """
-
-        def _(orig_gen):
-            item: VARTYPE
-            for i, item in enumerate(orig_gen):
-                if condition(i, item):
-                    yield item
-
-        return MelodieGenerator(_(self.inner))
+        return self._with_stage("indexed_filter", condition)
 
     def star_filter(
         self, condition: Callable[..., bool]
@@ -123,14 +443,7 @@ class MelodieGenerator(Generic[VARTYPE]):
         Filter elements that function ``condition`` returns ``True``.
         Each element will be unpacked by ``*elem``
         """
-
-        def _(orig_gen):
-            item: VARTYPE
-            for item in orig_gen:
-                if condition(*item):
-                    yield item
-
-        return MelodieGenerator(_(self.inner))
+        return self._with_stage("star_filter", condition)
 
     def extra_job(self, func: Callable[[VARTYPE], Any]) -> "MelodieGenerator[VARTYPE]":
         """
@@ -141,14 +454,7 @@ class MelodieGenerator(Generic[VARTYPE]):
             is the same as ``g.map(lambda item: item.value)``,
             but the former has extra printouts for each element.
         """
-
-        def _(orig_gen):
-            item: VARTYPE
-            for item in orig_gen:
-                func(item)
-                yield item
-
-        return MelodieGenerator(_(self.inner))
+        return self._with_stage("extra_job", func)
 
     def indexed_extra_job(
         self, func: Callable[[int, VARTYPE], Any]
@@ -156,104 +462,726 @@ class MelodieGenerator(Generic[VARTYPE]):
         """
         Like ``extra_job``, but with index.
         """
+        return self._with_stage("indexed_extra_job", func)
+
+    def map(self, func: Callable[[VARTYPE], VARTYPE2]) -> "MelodieGenerator[VARTYPE2]":
+        """
+        Map function ``func`` to each element
+        """
+        return self._with_stage("map", func)
+
+    def indexed_map(
+        self, func: Callable[[int, VARTYPE], VARTYPE2]
+    ) -> "MelodieGenerator[VARTYPE2]":
+        """
+        Map function ``func`` to each element
+        """
+        return self._with_stage("indexed_map", func)
+
+    def star_map(self, func: Callable[..., VARTYPE2]) -> "MelodieGenerator[VARTYPE2]":
+        """
+        Map function ``func`` to each element with unpacking them by ``*elem``.
+        """
+        return self._with_stage("star_map", func)
+
+    def memo_map(
+        self,
+        func: Callable[[VARTYPE], VARTYPE2],
+        key: Optional[Callable[[VARTYPE], Any]] = None,
+        maxsize: Optional[int] = 2**16,
+        ttl: Optional[float] = None,
+        persist: Optional[str] = None,
+        namespace: Optional[str] = None,
+    ) -> "MelodieGenerator[VARTYPE2]":
+        """
+        Map the pure function ``func`` to each element, computing it only once
+        for the elements with the same ``key`` (the element itself by default).
+
+        Results are kept in an LRU of ``maxsize`` entries, expiring after
+        ``ttl`` seconds if given. With ``persist`` as a file path, results are
+        also stored on disk, so re-running the same analysis skips the elements
+        computed before, see ``MelodieFuncFlow.memo.MemoCache``.
+
+        The cache is available as the ``memo`` attribute of the returned
+        generator, like ``g.memo.stats()`` for the hits and misses.
+        """
+        from .memo import MemoCache
+
+        cache = MemoCache(func, key, maxsize, ttl, persist, namespace)
 
         def _(orig_gen):
-            item: VARTYPE
-            for i, item in enumerate(orig_gen):
-                func(i, item)
-                yield item
+            try:
+                for item in orig_gen:
+                    yield cache(item)
+            finally:
+                cache.flush()
 
-        return MelodieGenerator(_(self.inner))
+        g = MelodieGenerator(_(self.inner))
+        g._total = self._length_hint()
+        g.memo = cache
+        return g
 
-    def map(self, func: Callable[[VARTYPE], VARTYPE2]) -> "MelodieGenerator[VARTYPE2]":
+    def parallel_map(
+        self,
+        func: Callable[..., VARTYPE2],
+        star=False,
+        init_code="",
+        backend: str = "ipyparallel",
+        workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+        initializer: Optional[Callable[..., Any]] = None,
+        initargs: Tuple[Any, ...] = (),
+        shm_threshold: Optional[int] = 256 * 2**10,
+        engine_pool: Optional["EnginePool"] = None,
+    ) -> "MelodieGenerator[VARTYPE2]":
         """
-        Map function ``func`` to each element
+        Map in parallel, with ``ipyparallel`` or a local process pool.
+
+        If ``star`` is ``True``, each element will be unpacked by ``*elem``.
+
+        For ``backend="ipyparallel"``, elements are sent in chunks to the
+        engines of ``engine_pool`` (an ``EnginePool``, by default the shared
+        pool of the default cluster), which keeps its client between calls.
+        MelodieFuncFlow should be importable on the engines. Other modules
+        used by ``func`` could be imported by ``init_code`` or ``initializer``,
+        which run once per pool.
+
+        For ``backend="process"``, a ``concurrent.futures.ProcessPoolExecutor``
+        is started on this machine, and elements are sent in chunks.
+        ``func`` and ``initializer`` must be picklable, so lambdas and local
+        functions are not allowed.
+
+        :init_code: Code executed on every engine before mapping. (ipyparallel only)
+        :backend: ``"ipyparallel"`` or ``"process"``
+        :workers: Number of worker processes, ``os.cpu_count()`` by default. (process only)
+        :chunksize: Number of elements in one task. Decided automatically if ``None``.
+        :max_in_flight: Maximum number of pending chunks, ``2 * workers`` (or
+            engines) by default.
+        :ordered: Yield results in the input order, or as soon as they are ready.
+        :initializer: Called with ``initargs`` once in each worker process or engine.
+        :shm_threshold: Numpy arrays and byte buffers of at least this many bytes
+            are passed to and from the workers through shared memory instead of
+            pickles. ``None`` to always pickle. (process only)
+        :engine_pool: The ``EnginePool`` to run on. (ipyparallel only)
+        """
+        if backend == "process":
+            from .parallel import process_map
+
+            total = len(self) if isinstance(self, MelodieFrozenGenerator) else None
+            return MelodieGenerator(
+                process_map(
+                    self.inner,
+                    func,
+                    star=star,
+                    workers=workers,
+                    chunksize=chunksize,
+                    max_in_flight=max_in_flight,
+                    ordered=ordered,
+                    initializer=initializer,
+                    initargs=initargs,
+                    total=total,
+                    shm_threshold=shm_threshold,
+                )
+            )
+        elif backend != "ipyparallel":
+            raise ValueError(f"Unknown parallel backend {backend!r}")
+
+        from .engines import EnginePool
+
+        pool = engine_pool if engine_pool is not None else EnginePool.shared()
+        pool.initialize(initializer, initargs, init_code)
+        total = len(self) if isinstance(self, MelodieFrozenGenerator) else None
+        return MelodieGenerator(
+            pool.map(
+                self.inner,
+                func,
+                star=star,
+                chunksize=chunksize,
+                max_in_flight=max_in_flight,
+                ordered=ordered,
+                total=total,
+            )
+        )
+
+    def thread_map(
+        self,
+        func: Callable[[VARTYPE], VARTYPE2],
+        workers: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+    ) -> "MelodieGenerator[VARTYPE2]":
+        """
+        Map function ``func`` to each element with a thread pool, overlapping
+        the waiting time of I/O bound functions.
+
+        Elements are pulled lazily, and at most ``max_in_flight`` elements
+        (``2 * workers`` by default) are being processed or waiting to be yielded.
+
+        :workers: Number of threads, ``min(32, os.cpu_count() + 4)`` by default.
+        :ordered: Yield results in the input order, or as soon as they complete.
+        """
+        from .parallel import thread_map
+
+        return MelodieGenerator(
+            thread_map(
+                self.inner,
+                func,
+                workers=workers,
+                max_in_flight=max_in_flight,
+                ordered=ordered,
+            )
+        )
+
+    def indexed_thread_map(
+        self,
+        func: Callable[[int, VARTYPE], VARTYPE2],
+        workers: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+    ) -> "MelodieGenerator[VARTYPE2]":
+        """
+        Like ``thread_map``, but with index.
+        """
+        from .parallel import thread_map
+
+        return MelodieGenerator(
+            thread_map(
+                self.inner,
+                func,
+                indexed=True,
+                workers=workers,
+                max_in_flight=max_in_flight,
+                ordered=ordered,
+            )
+        )
+
+    def star_thread_map(
+        self,
+        func: Callable[..., VARTYPE2],
+        workers: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        ordered: bool = True,
+    ) -> "MelodieGenerator[VARTYPE2]":
+        """
+        Like ``thread_map``, but unpacking each element by ``*elem``.
+        """
+        from .parallel import thread_map
+
+        return MelodieGenerator(
+            thread_map(
+                self.inner,
+                func,
+                star=True,
+                workers=workers,
+                max_in_flight=max_in_flight,
+                ordered=ordered,
+            )
+        )
+
+    def prefetch(self, n: int = 64, mode: str = "thread") -> "MelodieGenerator[VARTYPE]":
+        """
+        Run the chain before this operation in a background worker, keeping up
+        to ``n`` elements ready in a bounded queue, so a slow upstream (like
+        reading and decompressing files) overlaps with the downstream.
+
+        The worker starts when the first element is requested. Exceptions of
+        the upstream are raised to the consumer, and closing the returned
+        generator (or stopping early, like ``head()`` and ``slice``, once it is
+        released) stops the worker.
+
+        :mode: ``"thread"`` for upstreams releasing the GIL (I/O, decompression,
+            numpy), or ``"process"`` for cpu-bound python upstreams. The process
+            is forked and inherits the upstream, so this generator should not be
+            used from other places afterwards, and elements should be picklable.
+        """
+        from .parallel import prefetch_process, prefetch_thread
+
+        if mode == "thread":
+            it = prefetch_thread(self.inner, n)
+        elif mode == "process":
+            it = prefetch_process(self.inner, n)
+        else:
+            raise ValueError(f"Unknown prefetch mode {mode!r}")
+        g = MelodieGenerator(it)
+        g._total = self._length_hint()
+        return g
+
+    def pipeline(
+        self,
+        workers_per_stage: Union[int, List[int]] = 1,
+        groups: Optional[List[int]] = None,
+        batch_size: int = 256,
+        queue_size: int = 8,
+        ordered: bool = True,
+    ) -> "MelodieGenerator[VARTYPE]":
+        """
+        Run the pending stages in worker processes, each group of stages in its
+        own processes, connected by bounded queues of batches, so stages run
+        concurrently like an assembly line. The source is read in this process::
+
+            g = MelodieGenerator(lines).map(parse).filter(is_valid).map(score)
+            g = g.pipeline(workers_per_stage=[1, 1, 4])
+            for result in g: ...
+            print(g.executor.stats())
+
+        The ``executor`` attribute of the returned generator, a
+        ``PipelineExecutor``, reports the elements in/out and the input queue
+        depth of each group: a group whose queue stays full is the bottleneck.
+
+        The workers are forked, so stage functions do not need to be picklable,
+        but elements do. Indexed stages are not supported.
+
+        :workers_per_stage: number of processes of each group, or of every group.
+        :groups: number of consecutive stages in each group. By default each
+            stage is a group, except ``attributes`` and ``cast`` which join the
+            previous one.
+        :batch_size: number of elements sent at once between groups.
+        :queue_size: number of batches each queue holds before blocking.
+        :ordered: if False, yield batches as soon as they are done.
+        """
+        from .pipeline import PipelineExecutor
+
+        if self._running is not None:
+            raise ValueError("pipeline requires a generator whose plan is not running yet")
+        executor = PipelineExecutor(
+            self._source,
+            self._stages,
+            workers_per_stage=workers_per_stage,
+            groups=groups,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            ordered=ordered,
+        )
+        g = MelodieGenerator(iter(executor))
+        g._total = self._length_hint()
+        g.executor = executor
+        return g
+
+    def partitioned(
+        self,
+        n: int,
+        by: Union[str, Callable[[VARTYPE], Any], None] = "round_robin",
+        backend: str = "process",
+        workers: Optional[int] = None,
+    ) -> "MelodiePartitionedDataset":
+        """
+        Split the elements into ``n`` partitions, getting a
+        ``MelodiePartitionedDataset`` whose chained operations run on each
+        partition in parallel, on a local process pool or on ``ipyparallel``
+        engines::
+
+            def user_of(record):
+                return record.user
+
+            ds = MelodieGenerator(records).partitioned(8, by=user_of)
+            counts = ds.group_by(user_of).star_map(count_events).collect()
+
+        With the ``"process"`` backend, functions are pickled to the workers,
+        so they should be defined at module level, not lambdas.
+
+        :by: ``"round_robin"`` to deal the elements in turn, or a key function
+            to put elements with equal keys into the same partition.
+        :backend: ``"process"`` or ``"ipyparallel"``
+        """
+        from .partitioned import MelodiePartitionedDataset
+
+        return MelodiePartitionedDataset.from_iterable(self.inner, n, by, backend, workers)
+
+    def batch(self, size: int) -> "MelodieGenerator[List[VARTYPE]]":
+        """
+        Group every ``size`` elements into a list. The last batch may be shorter.
         """
+        assert size >= 1, "batch size should be at least 1"
 
         def _(orig_gen):
-            item: VARTYPE
-            for item in orig_gen:
-                yield func(item)
+            while True:
+                chunk = list(itertools.islice(orig_gen, size))
+                if not chunk:
+                    return
+                yield chunk
 
         return MelodieGenerator(_(self.inner))
 
-    def indexed_map(
-        self, func: Callable[[int, VARTYPE], VARTYPE2]
+    def unbatch(self) -> "MelodieGenerator[Any]":
+        """
+        Flatten each element, the reverse operation of ``batch``.
+        """
+        return MelodieGenerator(itertools.chain.from_iterable(self.inner))
+
+    def map_batches(
+        self,
+        func: Callable[[Any], Iterable[VARTYPE2]],
+        size: int = 1024,
+        format: str = "list",
+        dtype: Any = None,
     ) -> "MelodieGenerator[VARTYPE2]":
         """
-        Map function ``func`` to each element
+        Pass every ``size`` elements to ``func`` at once, and flatten the
+        returned batches back into the stream. ``func`` should return one
+        result for each input element to keep the stream aligned, but this
+        is not enforced.
+
+        With ``format="numpy"``, ``func`` receives a ``numpy.ndarray`` so that
+        vectorized operations could be used, and returned arrays are converted
+        back to python objects by ``tolist()``.
+
+        :format: ``"list"`` or ``"numpy"``
+        :dtype: The dtype of the arrays for ``format="numpy"``. If given, the
+            arrays are built with ``numpy.fromiter`` without intermediate lists.
         """
+        assert size >= 1, "batch size should be at least 1"
+        if format == "list":
+
+            def _(orig_gen):
+                while True:
+                    chunk = list(itertools.islice(orig_gen, size))
+                    if not chunk:
+                        return
+                    yield from func(chunk)
+
+        elif format == "numpy":
+            import numpy as np
+
+            def _(orig_gen):
+                while True:
+                    if dtype is not None:
+                        chunk = np.fromiter(itertools.islice(orig_gen, size), dtype)
+                    else:
+                        chunk = np.asarray(list(itertools.islice(orig_gen, size)))
+                    if len(chunk) == 0:
+                        return
+                    ret = func(chunk)
+                    yield from (ret.tolist() if isinstance(ret, np.ndarray) else ret)
 
-        def _(orig_gen):
-            item: VARTYPE
-            for i, item in enumerate(orig_gen):
-                yield func(i, item)
+        else:
+            raise ValueError(f"format should be 'list' or 'numpy', but got {format!r}")
 
         return MelodieGenerator(_(self.inner))
 
-    def star_map(self, func: Callable[..., VARTYPE2]) -> "MelodieGenerator[VARTYPE2]":
+    def top_k(
+        self, k: int, key: Optional[Callable[[VARTYPE], Any]] = None
+    ) -> "MelodieFrozenGenerator[VARTYPE]":
         """
-        Map function ``func`` to each element with unpacking them by ``*elem``.
+        Get the ``k`` largest elements by ``key`` in descending order, with a
+        heap of size ``k``. Equivalent to ``sorted(g, key=key, reverse=True)[:k]``,
+        but the generator is consumed as a stream using ``O(k)`` memory.
+        """
+        return MelodieFrozenGenerator(heapq.nlargest(k, self.inner, key=key))
+
+    def bottom_k(
+        self, k: int, key: Optional[Callable[[VARTYPE], Any]] = None
+    ) -> "MelodieFrozenGenerator[VARTYPE]":
+        """
+        Get the ``k`` smallest elements by ``key`` in ascending order, with a
+        heap of size ``k``. Equivalent to ``sorted(g, key=key)[:k]``.
+        """
+        return MelodieFrozenGenerator(heapq.nsmallest(k, self.inner, key=key))
+
+    def group_by(
+        self, key: Callable[[VARTYPE], VARTYPE2], presorted: bool = False
+    ) -> "MelodieGenerator[Tuple[VARTYPE2, List[VARTYPE]]]":
+        """
+        Group elements by ``key``, returning a generator of ``(key, elements)``.
+
+        By default, the groups are collected in a hash table in one pass when
+        the iteration starts, and yielded in the order their keys first appear.
+
+        If the input is already sorted (or at least clustered) by ``key``,
+        pass ``presorted=True`` to stream each group out as soon as it ends,
+        keeping only the current group in memory.
         """
+        if presorted:
+            return MelodieGenerator(
+                (k, list(group)) for k, group in itertools.groupby(self.inner, key)
+            )
 
         def _(orig_gen):
-            item: VARTYPE
+            groups = {}
             for item in orig_gen:
-                yield func(*item)
+                k = key(item)
+                if k in groups:
+                    groups[k].append(item)
+                else:
+                    groups[k] = [item]
+            yield from groups.items()
 
         return MelodieGenerator(_(self.inner))
 
-    def parallel_map(
-        self, func: Callable[..., VARTYPE2], star=False, init_code=""
-    ) -> "MelodieGenerator[VARTYPE2]":
+    def reduce_by_key(
+        self,
+        key: Callable[[VARTYPE], VARTYPE2],
+        func: Callable[[VARTYPE3, VARTYPE], VARTYPE3],
+        initial: VARTYPE3 = None,
+        presorted: bool = False,
+        combine: Optional[Callable[[VARTYPE3, VARTYPE3], VARTYPE3]] = None,
+        workers: Optional[int] = None,
+        chunksize: int = 10000,
+    ) -> "MelodieGenerator[Tuple[VARTYPE2, VARTYPE3]]":
+        """
+        Like ``fold_left`` (or ``reduce`` if ``initial`` is ``None``) for each
+        group of elements with the same ``key``, returning a generator of
+        ``(key, result)`` in the order keys first appear. Each key starts from
+        a shallow copy of ``initial``.
+
+        Aggregation is done in one pass with a hash table holding one result
+        per key. With ``presorted=True``, the input should be sorted by ``key``,
+        and results are streamed out as soon as each group ends.
+
+        If ``workers`` is given, chunks of ``chunksize`` elements are reduced in
+        worker processes, and the partial results of the same key are merged
+        by ``combine(result1, result2)``. ``combine`` defaults to ``func`` when
+        ``initial`` is ``None``. ``key``, ``func`` and ``combine`` should be
+        picklable in this case.
+        """
+        if presorted:
+            assert workers is None, "presorted mode could not run on workers"
+
+            def reduce_group(group):
+                if initial is None:
+                    return functools.reduce(func, group)
+                return functools.reduce(func, group, copy.copy(initial))
+
+            return MelodieGenerator(
+                (k, reduce_group(group))
+                for k, group in itertools.groupby(self.inner, key)
+            )
+
+        if workers is None:
+
+            def _(orig_gen):
+                yield from _reduce_by_key(orig_gen, key, func, initial).items()
+
+            return MelodieGenerator(_(self.inner))
+
+        if combine is None:
+            assert initial is None, "combine is required if initial is given"
+            combine = func
+        partials = self.batch(chunksize).parallel_map(
+            functools.partial(_reduce_chunk_by_key, key, func, initial),
+            backend="process",
+            workers=workers,
+            chunksize=1,
+        )
+
+        def _(partials):
+            acc = {}
+            for partial in partials:
+                for k, v in partial.items():
+                    acc[k] = combine(acc[k], v) if k in acc else v
+            yield from acc.items()
+
+        return MelodieGenerator(_(partials))
+
+    def count_by(
+        self,
+        key: Callable[[VARTYPE], VARTYPE2],
+        presorted: bool = False,
+        workers: Optional[int] = None,
+        chunksize: int = 10000,
+    ) -> "MelodieGenerator[Tuple[VARTYPE2, int]]":
+        """
+        Count elements of each ``key``, returning a generator of ``(key, count)``.
+        See ``reduce_by_key`` for ``presorted``, ``workers`` and ``chunksize``.
+        """
+        return self.reduce_by_key(
+            key,
+            _count_one,
+            0,
+            presorted=presorted,
+            combine=operator.add,
+            workers=workers,
+            chunksize=chunksize,
+        )
+
+    def sort_external(
+        self,
+        key: Optional[Callable[[VARTYPE], Any]] = None,
+        reverse: bool = False,
+        memory_limit: Optional[int] = None,
+        tmp_dir: Optional[str] = None,
+    ) -> "MelodieGenerator[VARTYPE]":
+        """
+        Sort this generator stably like ``sorted``, even if it does not fit
+        in memory.
+
+        Sorting starts with the iteration. Elements are sorted in runs of
+        about ``memory_limit`` bytes (256 MiB by default), which are written
+        to temporary files under ``tmp_dir`` and merged lazily. No file is
+        written if all elements fit in one run.
         """
-        Map with ``ipyparallel``.
-
-        Members in this package will be automatically imported.
-
-        To use members from other packages, please inject the initialization
-        code by ``init_code`` parameter.
-
-        :init_code: Code to be executed ``before`` parallel execution.
-        """
-        from ipyparallel import Client
-
-        c = Client()
-        dview = c[:]
-        code = """
-        def update_props_to_globals(module):
-            for item in dir(module):
-                if not item.startswith("__"):
-                    globals()[item] = getattr(module, item)
-            
-        def p():
-            import MelodieStaticAnalysis
-            import MelodieStaticAnalysis.clang_utils
-            update_props_to_globals(MelodieStaticAnalysis.clang_utils)
-            update_props_to_globals(MelodieStaticAnalysis)
-        p()
-        """
-        dview.execute(code)
-        cores = len(c[:])
-
-        def _(orig_gen_: MelodieGenerator):
-            orig_gen = iter(orig_gen_)
-            async_tasks = []
-            for _ in range(cores):
-                arg = next(orig_gen)
-                async_tasks.append(dview.map_async(func, [arg]))
-            while async_tasks:
-                async_task = async_tasks[0]
-                if async_task.ready():
-                    async_tasks.remove(async_task)
-                    try:
-                        arg = next(orig_gen)
-                        async_tasks.append(dview.map_async(func, [arg]))
-                    except StopIteration:
-                        pass
-                    yield async_task.result()[0]
-
-        return MelodieGenerator(_(self))
+        from .storage import external_sort
+
+        return MelodieGenerator(
+            external_sort(self.inner, key, reverse, memory_limit, tmp_dir)
+        )
+
+    def join(
+        self,
+        other: Iterable[VARTYPE2],
+        left_key: Callable[[VARTYPE], Any],
+        right_key: Optional[Callable[[VARTYPE2], Any]] = None,
+        how: str = "inner",
+        build: str = "auto",
+    ) -> "MelodieGenerator[Tuple[Optional[VARTYPE], Optional[VARTYPE2]]]":
+        """
+        Hash join this generator with ``other``, yielding ``(left, right)``
+        pairs of elements with equal keys. Unmatched elements kept by ``how``
+        are paired with ``None``.
+
+        A hash table is built on one side and the other side is streamed.
+        With ``build="auto"``, the table is built on the side with a length
+        (like a frozen generator or a list), the smaller one if both have,
+        and ``other`` otherwise. The pairs come in the order of the streamed
+        side, followed by the unmatched elements of the built side.
+
+        :right_key: Key of ``other``, the same as ``left_key`` if ``None``.
+        :how: ``"inner"``, ``"left"``, ``"right"`` or ``"outer"``
+        :build: ``"auto"``, ``"left"`` or ``"right"``
+        """
+        assert how in _JOIN_TYPES, f"how should be one of {_JOIN_TYPES}, but got {how!r}"
+        assert build in {"auto", "left", "right"}, f"unknown build side {build!r}"
+        right_key = left_key if right_key is None else right_key
+        if build == "auto":
+            left_sized, right_sized = hasattr(self, "__len__"), hasattr(other, "__len__")
+            if left_sized and right_sized:
+                build = "left" if len(self) < len(other) else "right"
+            else:
+                build = "left" if left_sized else "right"
+        keep_left = how in {"left", "outer"}
+        keep_right = how in {"right", "outer"}
+
+        def _(left, right):
+            if build == "left":
+                yield from _hash_join(
+                    left, right, left_key, right_key, True, keep_left, keep_right
+                )
+            else:
+                yield from _hash_join(
+                    right, left, right_key, left_key, False, keep_right, keep_left
+                )
+
+        return MelodieGenerator(_(self.inner, other))
+
+    def merge_join(
+        self,
+        other: Iterable[VARTYPE2],
+        left_key: Callable[[VARTYPE], Any],
+        right_key: Optional[Callable[[VARTYPE2], Any]] = None,
+        how: str = "inner",
+    ) -> "MelodieGenerator[Tuple[Optional[VARTYPE], Optional[VARTYPE2]]]":
+        """
+        Like ``join``, but both inputs should be sorted ascending by their
+        keys. Both sides are streamed, holding one group of equal keys of
+        ``other`` in memory, and pairs come in the order of the keys.
+        """
+        assert how in _JOIN_TYPES, f"how should be one of {_JOIN_TYPES}, but got {how!r}"
+        right_key = left_key if right_key is None else right_key
+        return MelodieGenerator(
+            _merge_join(
+                self.inner,
+                other,
+                left_key,
+                right_key,
+                how in {"left", "outer"},
+                how in {"right", "outer"},
+            )
+        )
+
+    def cogroup(
+        self,
+        other: Iterable[VARTYPE2],
+        left_key: Callable[[VARTYPE], Any],
+        right_key: Optional[Callable[[VARTYPE2], Any]] = None,
+    ) -> "MelodieGenerator[Tuple[Any, List[VARTYPE], List[VARTYPE2]]]":
+        """
+        Group both this generator and ``other`` by key, yielding
+        ``(key, left_elements, right_elements)`` for each key in either side,
+        in the order keys first appear in this generator and then in ``other``.
+        """
+        right_key = left_key if right_key is None else right_key
+
+        def _(left, right):
+            groups = {}
+            for item in left:
+                k = left_key(item)
+                if k in groups:
+                    groups[k][0].append(item)
+                else:
+                    groups[k] = ([item], [])
+            for item in right:
+                k = right_key(item)
+                if k in groups:
+                    groups[k][1].append(item)
+                else:
+                    groups[k] = ([], [item])
+            for k, (lefts, rights) in groups.items():
+                yield k, lefts, rights
+
+        return MelodieGenerator(_(self.inner, other))
+
+    def distinct(
+        self,
+        key: Optional[Callable[[VARTYPE], Any]] = None,
+        approximate: bool = False,
+        capacity: int = 10**7,
+        error_rate: float = 0.01,
+    ) -> "MelodieGenerator[VARTYPE]":
+        """
+        Keep the first element of each ``key`` (the element itself if ``None``),
+        streaming them out in order.
+
+        By default the keys seen are kept in a set. With ``approximate=True``,
+        a Bloom filter sized for ``capacity`` keys is used instead, taking
+        constant memory: duplicates are always removed, but about
+        ``error_rate`` of the distinct elements are dropped as false positives
+        (more if there are more than ``capacity`` distinct keys). Keys do not
+        need to be hashable in this mode.
+        """
+        if approximate:
+            from .sketches import BloomFilter
+
+            bloom = BloomFilter(capacity, error_rate)
+            add = bloom.add
+            if key is None:
+                return self._with_stage("filter", lambda item: not add(item))
+            return self._with_stage("filter", lambda item: not add(key(item)))
+
+        seen = set()
+        seen_add = seen.add
+
+        def first_seen(item) -> bool:
+            k = item if key is None else key(item)
+            if k in seen:
+                return False
+            seen_add(k)
+            return True
+
+        return self._with_stage("filter", first_seen)
+
+    def count_distinct(
+        self,
+        key: Optional[Callable[[VARTYPE], Any]] = None,
+        approximate: bool = False,
+        error_rate: float = 0.01,
+    ) -> int:
+        """
+        Count the distinct ``key`` (the element itself if ``None``) of elements.
+
+        With ``approximate=True``, a HyperLogLog sketch with relative standard
+        error ``error_rate`` is used, taking constant memory.
+        """
+        keys = self.inner if key is None else map(key, self.inner)
+        if approximate:
+            from .sketches import HyperLogLog
+
+            sketch = HyperLogLog.from_error_rate(error_rate)
+            add = sketch.add
+            for k in keys:
+                add(k)
+            return sketch.count()
+        return len(set(keys))
 
     def fold_left(
         self, func: Callable[[VARTYPE2, VARTYPE], VARTYPE2], initial: VARTYPE2
@@ -281,6 +1209,70 @@ class MelodieGenerator(Generic[VARTYPE]):
         else:
             return functools.reduce(func, self, initial)
 
+    def parallel_reduce(
+        self,
+        func: Callable[[VARTYPE2, VARTYPE], VARTYPE2],
+        initial: VARTYPE2 = None,
+        combine: Optional[Callable[[VARTYPE2, VARTYPE2], VARTYPE2]] = None,
+        workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+        initializer: Optional[Callable[..., Any]] = None,
+        initargs: Tuple[Any, ...] = (),
+    ) -> VARTYPE2:
+        """
+        Like ``reduce`` (or ``fold_left`` if ``initial`` is given), but chunks of
+        elements are reduced by ``func`` in worker processes, and the partial
+        results are combined by ``combine(result1, result2)`` as a tree.
+
+        ``combine`` should be associative, and ``initial`` should be its
+        identity, as each chunk starts from a copy of ``initial``. ``combine``
+        defaults to ``func`` when ``initial`` is ``None``. For example, to count
+        distinct elements with mergeable sketches::
+
+            g.parallel_reduce(add_to_sketch, HyperLogLog(), HyperLogLog.merge)
+
+        ``func``, ``combine`` and ``initial`` should be picklable.
+
+        :workers: Number of worker processes, ``os.cpu_count()`` by default.
+        :chunksize: Number of elements in one task. Decided automatically if ``None``.
+        :initializer: Called with ``initargs`` once in each worker process.
+        """
+        from .parallel import tree_reduce
+
+        if combine is None:
+            assert initial is None, "combine is required if initial is given"
+        return tree_reduce(
+            self.inner,
+            func,
+            initial,
+            combine,
+            workers=workers,
+            chunksize=chunksize,
+            initializer=initializer,
+            initargs=initargs,
+            total=self._length_hint(),
+        )
+
+    def fold(
+        self,
+        combine: Callable[[VARTYPE, VARTYPE], VARTYPE],
+        zero: VARTYPE = None,
+        workers: Optional[int] = None,
+        chunksize: Optional[int] = None,
+    ) -> VARTYPE:
+        """
+        Fold the elements of a monoid, like numbers with ``operator.add``,
+        ``min``/``max``, or mergeable sketches with their ``merge``. ``combine``
+        should be associative, and ``zero`` its identity (if given), which is
+        returned for an empty generator.
+
+        If ``workers`` is given, the fold runs in parallel as
+        ``parallel_reduce(combine, zero, combine, workers, chunksize)``.
+        """
+        if workers is None:
+            return self.reduce(combine, zero)
+        return self.parallel_reduce(combine, zero, combine, workers, chunksize)
+
     def exhaust(self) -> None:
         """
         Go through this generator until it is exhausted, returning ``None``.
@@ -308,27 +1300,19 @@ class MelodieGenerator(Generic[VARTYPE]):
         if rbound is None:
             start, stop = 0, bound
         elif rbound < 0:
-            assert rbound == -1, "if rbound "
+            assert rbound == -1, "rbound should be -1 or non-negative"
             start, stop = bound, -1
         else:
             assert rbound >= bound
             start, stop = bound, rbound
 
-        def _(orig_gen: Iterable[VARTYPE]):
-            if stop < 0:
-                for i, item in enumerate(orig_gen):
-                    if i >= start:
-                        yield item
-            else:
-                for i, item in enumerate(orig_gen):
-                    if start <= i < stop:
-                        yield item
-                    elif i < start:
-                        continue
-                    else:
-                        break
-
-        return MelodieGenerator(_(self.inner))
+        total = self._length_hint()
+        g = MelodieGenerator(
+            itertools.islice(self.inner, start, None if stop < 0 else stop)
+        )
+        if total is not None:
+            g._total = max(0, (total if stop < 0 else min(total, stop)) - start)
+        return g
 
     def __getitem__(self, index) -> Union[VARTYPE, "MelodieGenerator[VARTYPE]"]:
         if isinstance(index, slice):
@@ -352,30 +1336,255 @@ class MelodieGenerator(Generic[VARTYPE]):
         """
         return set(self.inner)
 
-    def freeze(self) -> "MelodieFrozenGenerator[VARTYPE]":
+    def to_dict(self) -> Dict[Any, Any]:
+        """
+        Convert this generator of ``(key, value)`` pairs to dict
+        """
+        return dict(self.inner)
+
+    def freeze(
+        self,
+        columnar: bool = False,
+        fields: Optional[List[str]] = None,
+        backend: str = "auto",
+        spill_to: Optional[str] = None,
+        memory_limit: Optional[int] = None,
+    ) -> "MelodieFrozenGenerator[VARTYPE]":
         """
         Convert the current iterator to a ``MelodieFrozenGenerator``.
+
+        If ``columnar`` is ``True``, a ``MelodieFrozenTable`` storing each field
+        as a compact array is created instead. See ``MelodieFrozenTable.from_iterable``
+        for ``fields`` and ``backend``.
+
+        If ``spill_to`` is a file path, elements are kept in memory until their
+        pickled size exceeds ``memory_limit`` bytes (256 MiB by default), and
+        the rest are written to ``spill_to`` and ``spill_to + ".idx"``.
+        The result is still replayable and supports ``len`` and random access,
+        reading the spilled elements through memory-mapped files.
         """
+        if spill_to is not None:
+            assert not columnar, "spilling is not supported for columnar freezing"
+            from .storage import spill_freeze
+
+            return MelodieFrozenGenerator(spill_freeze(self.inner, spill_to, memory_limit))
+        if columnar:
+            from .columnar import MelodieFrozenTable
+
+            return MelodieFrozenTable.from_iterable(self.inner, fields, backend)
         lst = self.to_list()
         return MelodieFrozenGenerator(lst)
 
-    def show_progress(self) -> "MelodieGenerator[VARTYPE]":
+    def cache(self, maxsize: Optional[int] = None) -> "MelodieCachedGenerator[VARTYPE]":
         """
-        Show the progress of this iterator, without interfering the computation flow.
+        Make this generator replayable without consuming it upfront like ``freeze``.
+        See ``MelodieCachedGenerator``.
+        """
+        return MelodieCachedGenerator(self.inner, maxsize)
 
-        For ``MelodieGenerator``, as the total number is not determined, a counter-only
-        tqdm progress indicator will be shown like ``20it [00:02,  9.01it/s]``
+    def tee(
+        self, n: int = 2, maxsize: Optional[int] = None
+    ) -> Tuple["MelodieGenerator[VARTYPE]", ...]:
         """
-        tqdm = _import_tqdm_module()
+        Split this generator into ``n`` independent generators, like
+        ``itertools.tee``, which could be consumed concurrently from
+        several threads.
+
+        An element is kept only until all of the ``n`` generators have passed
+        it (generators garbage collected are not waited for), so memory stays
+        small when they progress at similar rates. If ``maxsize`` is given,
+        at most about ``2 * maxsize`` elements are kept, and a generator
+        falling further behind raises ``RuntimeError``.
+        """
+        assert n >= 1
+        buffer = _CacheBuffer(self.inner, maxsize, evict_consumed=True)
+        return tuple(MelodieGenerator(_CacheCursor(buffer)) for _ in range(n))
+
+    @staticmethod
+    def from_lines(
+        path: str,
+        chunk_size: int = 2**20,
+        encoding: str = "utf-8",
+        compress: Optional[bool] = None,
+    ) -> "MelodieGenerator[str]":
+        """
+        Create a generator of the lines of a text file, without trailing
+        newlines. The file is read in blocks of ``chunk_size`` characters when
+        the iteration starts. Files ending with ``.gz`` are decompressed,
+        unless ``compress`` is given.
+        """
+        from .fileio import read_lines
 
-        def _(orig_gen):
-            bar = tqdm()
-            item: VARTYPE
-            for item in orig_gen:
-                bar.update()
-                yield item
+        return MelodieGenerator(read_lines(path, chunk_size, encoding, compress))
 
-        return MelodieGenerator(_(self.inner))
+    @staticmethod
+    def from_jsonl(
+        path: str,
+        chunk_size: int = 2**20,
+        encoding: str = "utf-8",
+        compress: Optional[bool] = None,
+    ) -> "MelodieGenerator[Any]":
+        """
+        Create a generator of the JSON values in each non-empty line of a file.
+        See ``from_lines``.
+        """
+        import json
+
+        return MelodieGenerator.from_lines(path, chunk_size, encoding, compress).filter(
+            str.strip
+        ).map(json.loads)
+
+    @staticmethod
+    def from_csv(
+        path: str,
+        chunk_size: int = 2**20,
+        header: bool = True,
+        encoding: str = "utf-8",
+        compress: Optional[bool] = None,
+        **fmtparams,
+    ) -> "MelodieGenerator[Any]":
+        """
+        Create a generator of the rows of a csv file, as dicts if ``header``
+        else lists. ``fmtparams`` are passed to the ``csv`` module.
+        """
+        from .fileio import read_csv
+
+        return MelodieGenerator(
+            read_csv(path, chunk_size, header, encoding, compress, **fmtparams)
+        )
+
+    @staticmethod
+    def from_records(
+        path: str,
+        fmt: str,
+        chunk_size: int = 2**20,
+        compress: Optional[bool] = None,
+    ) -> "MelodieGenerator[Tuple[Any, ...]]":
+        """
+        Create a generator of fixed-size binary records, unpacked as tuples by
+        the ``struct`` format ``fmt``, like ``"<qd"``. The file is read in
+        blocks of about ``chunk_size`` bytes.
+        """
+        from .fileio import read_records
+
+        return MelodieGenerator(read_records(path, fmt, chunk_size, compress))
+
+    def to_lines(
+        self,
+        path: str,
+        buffer_size: int = 2**20,
+        encoding: str = "utf-8",
+        compress: Optional[bool] = None,
+        compresslevel: int = 6,
+    ) -> int:
+        """
+        Write each element (a string) as one line, returning the number of lines.
+
+        Lines are joined and written in blocks of about ``buffer_size``
+        characters. Files ending with ``.gz`` are compressed, unless
+        ``compress`` is given.
+        """
+        from .fileio import write_lines
+
+        return write_lines(self.inner, path, buffer_size, encoding, compress, compresslevel)
+
+    def to_jsonl(
+        self,
+        path: str,
+        buffer_size: int = 2**20,
+        encoding: str = "utf-8",
+        compress: Optional[bool] = None,
+        compresslevel: int = 6,
+        **json_kwargs,
+    ) -> int:
+        """
+        Write each element as one line of JSON, returning the number of lines.
+        ``json_kwargs`` are passed to ``json.JSONEncoder``. See ``to_lines``.
+        """
+        from .fileio import write_jsonl
+
+        return write_jsonl(
+            self.inner, path, buffer_size, encoding, compress, compresslevel, **json_kwargs
+        )
+
+    def to_csv(
+        self,
+        path: str,
+        fields: Optional[List[str]] = None,
+        buffer_size: int = 2**20,
+        encoding: str = "utf-8",
+        compress: Optional[bool] = None,
+        compresslevel: int = 6,
+        **fmtparams,
+    ) -> int:
+        """
+        Write each element (a dict or a sequence) as a csv row, returning the
+        number of rows. Dict rows get a header of ``fields``, or of the keys
+        of the first row.
+        """
+        from .fileio import write_csv
+
+        return write_csv(
+            self.inner,
+            path,
+            fields,
+            buffer_size,
+            encoding,
+            compress,
+            compresslevel,
+            **fmtparams,
+        )
+
+    def to_records(
+        self,
+        path: str,
+        fmt: str,
+        buffer_size: int = 2**20,
+        compress: Optional[bool] = None,
+        compresslevel: int = 6,
+    ) -> int:
+        """
+        Pack each element (a tuple) by the ``struct`` format ``fmt`` as a
+        fixed-size binary record, returning the number of records.
+        Read them back by ``MelodieGenerator.from_records``.
+        """
+        from .fileio import write_records
+
+        return write_records(self.inner, path, fmt, buffer_size, compress, compresslevel)
+
+    def to_async(self) -> "MelodieAsyncGenerator[VARTYPE]":
+        """
+        Convert this generator to a ``MelodieAsyncGenerator``, which could be
+        iterated with ``async for``.
+        """
+        from .async_functional import MelodieAsyncGenerator
+
+        return MelodieAsyncGenerator(self.inner)
+
+    def show_progress(
+        self,
+        sink: Union[str, Callable[[int, Optional[int]], Any], Any] = "tqdm",
+        total: Optional[int] = None,
+        interval: Optional[float] = None,
+    ) -> "MelodieGenerator[VARTYPE]":
+        """
+        Show the progress of this iterator, without interfering the computation flow.
+
+        The count is reported at most once per ``interval`` seconds, so the
+        overhead per element is a counter increment. If ``total`` is not
+        given, it is taken from frozen generators, slices and sized sources,
+        and otherwise a counter-only indicator is shown, like
+        ``20it [00:02,  9.01it/s]`` for tqdm.
+
+        :sink: ``"tqdm"``, ``"logging"``, a callback ``f(count, total)``, or a
+            ``MelodieFuncFlow.progress.ProgressSink`` like ``MetricsSink``.
+        """
+        from .progress import make_sink, track
+
+        total = self._length_hint() if total is None else total
+        g = MelodieGenerator(track(self.inner, make_sink(sink), total, interval))
+        g._total = total
+        return g
 
     def head(self) -> VARTYPE:
         """
@@ -406,21 +1615,60 @@ class MelodieGenerator(Generic[VARTYPE]):
         return self.freeze()
 
 
-class SeqIter:
+class _FrozenSequence:
+    """
+    Base class of the read-only sequences backing a ``MelodieFrozenGenerator``
+    other than lists and tuples. Subclasses implement ``__len__``, ``__iter__``
+    and ``__getitem__`` for integer indices.
+    """
+
+    __slots__ = ()
+
+
+class _SeqView(_FrozenSequence):
     """
-    The iterator to deal with for-loops in AgentList or other agent containers
+    A read-only view selecting ``indices`` of a list or tuple without copying.
+
+    ``indices`` is a ``range`` for slices, or a list of indices for permutations.
     """
 
-    def __init__(self, seq: List[Any]):
+    __slots__ = ("_seq", "_indices")
+
+    def __init__(
+        self, seq: Union[List[Any], Tuple[Any, ...]], indices: Union[range, List[int]]
+    ):
         self._seq = seq
-        self._i = 0
+        self._indices = indices
 
-    def __next__(self):
-        if self._i >= len(self._seq):
-            raise StopIteration
-        next_item = self._seq[self._i]
-        self._i += 1
-        return next_item
+    @staticmethod
+    def select(
+        seq: Union[List[Any], Tuple[Any, ...], "_SeqView"], indices: List[int]
+    ) -> "_SeqView":
+        """
+        Select ``indices`` of ``seq``, composing the indices if ``seq`` is a view.
+        """
+        if isinstance(seq, _SeqView):
+            base = seq._indices
+            return _SeqView(seq._seq, [base[i] for i in indices])
+        return _SeqView(seq, indices)
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __iter__(self):
+        indices = self._indices
+        if (
+            isinstance(indices, range)
+            and indices.step == 1
+            and isinstance(self._seq, (list, tuple))
+        ):
+            return itertools.islice(self._seq, indices.start, indices.stop)
+        return map(self._seq.__getitem__, indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return _SeqView(self._seq, self._indices[index])
+        return self._seq[self._indices[index]]
 
 
 class MelodieFrozenGenerator(MelodieGenerator[VARTYPE]):
@@ -430,10 +1678,13 @@ class MelodieFrozenGenerator(MelodieGenerator[VARTYPE]):
     """
 
     def __init__(self, inner: List[VARTYPE]):
-        assert isinstance(
-            inner, (list, tuple)
-        ), f"parameter inner should be list or tuple, but got {inner}"
+        assert isinstance(inner, (list, tuple, _FrozenSequence, array.array)) or _is_ndarray(
+            inner
+        ), f"parameter inner should be list, tuple or array, but got {inner}"
         self.inner = inner
+        # The most recent sorted permutation of ``inner`` asked to be cached,
+        # keyed by ``(key or cmp, reverse)``, with the length it was computed for.
+        self._sort_cache = {}
 
     @property
     def len(self):
@@ -442,8 +1693,11 @@ class MelodieFrozenGenerator(MelodieGenerator[VARTYPE]):
     def __len__(self):
         return len(self.inner)
 
+    def _length_hint(self) -> Optional[int]:
+        return len(self.inner)
+
     def __iter__(self):
-        return SeqIter(self.inner)
+        return iter(self.inner)
 
     def __next__(self) -> Any:
         raise NotImplementedError
@@ -451,44 +1705,312 @@ class MelodieFrozenGenerator(MelodieGenerator[VARTYPE]):
     def head(self) -> Any:
         return self.inner[0]
 
-    def show_progress(self) -> MelodieGenerator[VARTYPE]:
-        """
-        Show the progress of this iterator, without interfering the computation flow.
+    def _view(self, index: slice) -> "MelodieFrozenGenerator[VARTYPE]":
+        inner = self.inner
+        if isinstance(inner, _SeqView):
+            return MelodieFrozenGenerator(inner[index])
+        return MelodieFrozenGenerator(_SeqView(inner, range(len(inner))[index]))
 
-        For frozen generator, this will show a tqdm progress bar with percentage.
+    def slice(
+        self, bound: int, rbound: Optional[int] = None
+    ) -> "MelodieFrozenGenerator[VARTYPE]":
         """
+        Select an interval of elements with the same rules as
+        ``MelodieGenerator.slice``, returning a frozen view of this
+        generator without copying the elements.
+        """
+        assert bound >= 0
+        if rbound is None:
+            start, stop = 0, bound
+        elif rbound < 0:
+            assert rbound == -1, "rbound should be -1 or non-negative"
+            start, stop = bound, None
+        else:
+            assert rbound >= bound
+            start, stop = bound, rbound
+        return self._view(slice(start, stop))
 
-        tqdm = _import_tqdm_module()
-
-        def _(orig_gen):
-            bar = tqdm(total=len(self.inner))
-            item: VARTYPE
-            for item in orig_gen:
-                bar.update(1)
-                yield item
+    def __getitem__(
+        self, index
+    ) -> Union[VARTYPE, "MelodieFrozenGenerator[VARTYPE]"]:
+        """
+        Index directly into the elements. Negative indices are supported, and
+        slices (with steps and negative bounds) return a frozen view of this
+        generator without copying the elements.
 
-        return MelodieGenerator(_(self.inner))
+        Like ``MelodieGenerator``, a stop of ``-1`` without a step means the
+        end, so ``g[2:-1]`` is ``g[2:]`` for both. Other negative bounds count
+        from the end as in Python.
+        """
+        if isinstance(index, slice):
+            if index.stop == -1 and index.step in (None, 1):
+                index = slice(index.start, None)
+            return self._view(index)
+        return self.inner[index]
+
+    def _cached_permutation(self, cache_key: Any, reverse: bool) -> Optional[List[int]]:
+        entry = self._sort_cache.get((cache_key, reverse))
+        if entry is None or entry[0] != len(self):
+            return None
+        return entry[1]
+
+    def _cache_permutation(self, cache_key: Any, reverse: bool, perm: List[int]):
+        # Only the most recent permutation is kept, so sorting by many key
+        # functions (like lambdas) does not keep their permutations alive.
+        self._sort_cache.clear()
+        self._sort_cache[(cache_key, reverse)] = (len(self), perm)
+
+    def _sort_permutation(
+        self,
+        cache_key: Any,
+        key: Optional[Callable[[VARTYPE], Any]],
+        reverse: bool,
+        cache: bool,
+    ) -> List[int]:
+        perm = self._cached_permutation(cache_key, reverse)
+        if perm is None:
+            keys = list(self.inner) if key is None else [key(item) for item in self.inner]
+            perm = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+            if cache:
+                self._cache_permutation(cache_key, reverse, perm)
+        return perm
 
     def sort(
-        self, key: Callable[[VARTYPE], Union[int, float, str, tuple]], reverse=False
+        self,
+        key: Optional[Callable[[VARTYPE], Union[int, float, str, tuple]]],
+        reverse=False,
+        cache=False,
     ) -> "MelodieFrozenGenerator[VARTYPE]":
         """
         Sort by key
+
+        With ``cache=True``, the sorted permutation is kept for this
+        ``(key, reverse)``, so sorting again with the same ``key`` function
+        object (or ``top_k``/``bottom_k`` by it) is cheap. Only the most recent
+        one is kept, and the elements must not be changed while it is.
+        Sorting by a cached permutation returns a view of this generator,
+        without copying the elements.
         """
-        new_list = [item for item in self.inner]
-        new_list.sort(key=key, reverse=reverse)
-        return MelodieFrozenGenerator(new_list)
+        if not cache and self._cached_permutation(key, reverse) is None:
+            return MelodieFrozenGenerator(sorted(self.inner, key=key, reverse=reverse))
+        perm = self._sort_permutation(key, key, reverse, cache)
+        return MelodieFrozenGenerator(_SeqView.select(self.inner, perm))
 
     def relsort(
-        self, cmp: Callable[[VARTYPE, VARTYPE], bool], reverse=False
+        self, cmp: Callable[[VARTYPE, VARTYPE], bool], reverse=False, cache=False
     ) -> "MelodieFrozenGenerator[VARTYPE]":
         """
         Sort by relative comparisons
+
+        Like ``sort``, the sorted permutation is cached for ``(cmp, reverse)``
+        if ``cache``.
         """
         key = functools.cmp_to_key(cmp)
-        new_list = [item for item in self.inner]
-        new_list.sort(key=key, reverse=reverse)
-        return MelodieFrozenGenerator(new_list)
+        if not cache and self._cached_permutation(cmp, reverse) is None:
+            return MelodieFrozenGenerator(sorted(self.inner, key=key, reverse=reverse))
+        perm = self._sort_permutation(cmp, key, reverse, cache)
+        return MelodieFrozenGenerator(_SeqView.select(self.inner, perm))
+
+    def clear_sort_cache(self) -> None:
+        """
+        Release the cached sorted permutation.
+        """
+        self._sort_cache.clear()
+
+    def top_k(
+        self, k: int, key: Optional[Callable[[VARTYPE], Any]] = None
+    ) -> "MelodieFrozenGenerator[VARTYPE]":
+        """
+        Like ``MelodieGenerator.top_k``, using the cached descending sort of
+        ``key`` if there is one.
+        """
+        perm = self._cached_permutation(key, True)
+        if perm is not None:
+            return MelodieFrozenGenerator(_SeqView.select(self.inner, perm[:k]))
+        return super().top_k(k, key)
+
+    def bottom_k(
+        self, k: int, key: Optional[Callable[[VARTYPE], Any]] = None
+    ) -> "MelodieFrozenGenerator[VARTYPE]":
+        """
+        Like ``MelodieGenerator.bottom_k``, using the cached ascending sort of
+        ``key`` if there is one.
+        """
+        perm = self._cached_permutation(key, False)
+        if perm is not None:
+            return MelodieFrozenGenerator(_SeqView.select(self.inner, perm[:k]))
+        return super().bottom_k(k, key)
+
+    def partition(
+        self, k: int, key: Optional[Callable[[VARTYPE], Any]] = None
+    ) -> "MelodieFrozenGenerator[VARTYPE]":
+        """
+        Rearrange the elements like C++ ``std::nth_element``: the element at
+        position ``k`` is the one that would be there if sorted ascending by
+        ``key``, elements before it are not greater, and elements after it
+        are not less. Only the ``k + 1`` smallest (or the ``n - k`` largest)
+        elements are ordered, costing ``O(n log min(k, n - k))``.
+
+        Negative ``k`` counts from the end. The result is a view of this
+        generator and does not copy the elements.
+        """
+        n = len(self.inner)
+        if k < 0:
+            k += n
+        assert 0 <= k < n, f"k should be in [0, {n}), but got {k}"
+        inner = self.inner
+        if key is None:
+            keys = inner
+        else:
+            keys = [key(item) for item in inner]
+        if k < n // 2:
+            selected = heapq.nsmallest(k + 1, range(n), key=keys.__getitem__)
+            chosen = set(selected)
+            perm = selected + [i for i in range(n) if i not in chosen]
+        else:
+            selected = heapq.nlargest(n - k, range(n), key=keys.__getitem__)
+            chosen = set(selected)
+            perm = [i for i in range(n) if i not in chosen] + selected[::-1]
+        return MelodieFrozenGenerator(_SeqView.select(inner, perm))
+
+
+_END = object()
+
+
+class _CacheBuffer:
+    """
+    Elements pulled from ``source`` and shared by several cursors.
+
+    Element ``i`` (counted from the start of ``source``) is stored at
+    ``items[i - start]``. Elements before ``start`` have been evicted: by
+    ``maxsize``, keeping only the latest ones, or by ``evict_consumed``,
+    once every live cursor has passed them. Evictions are done in batches,
+    so at most about ``2 * maxsize`` elements are kept.
+    """
+
+    def __init__(self, source: Iterable[Any], maxsize: Optional[int], evict_consumed: bool):
+        assert maxsize is None or maxsize >= 1
+        self.source = iter(source)
+        self.items: List[Any] = []
+        self.start = 0
+        self.exhausted = False
+        self.maxsize = maxsize
+        self.evict_consumed = evict_consumed
+        self.cursors: "weakref.WeakSet[_CacheCursor]" = weakref.WeakSet()
+        self.lock = threading.Lock()
+        self._trim_at = 2 * maxsize if maxsize is not None else 64
+
+    def get(self, i: int) -> Any:
+        """
+        Get element ``i``, pulling ``source`` if needed, returning ``_END``
+        if ``source`` is exhausted before it.
+        """
+        with self.lock:
+            items = self.items
+            while i >= self.start + len(items):
+                if self.exhausted:
+                    return _END
+                try:
+                    items.append(next(self.source))
+                except StopIteration:
+                    self.exhausted = True
+                    return _END
+                if len(items) >= self._trim_at and (
+                    self.maxsize is not None or self.evict_consumed
+                ):
+                    self._trim()
+                    items = self.items
+            if i < self.start:
+                raise RuntimeError(
+                    f"element {i} has been evicted from the cache (maxsize={self.maxsize})"
+                )
+            return items[i - self.start]
+
+    def _trim(self):
+        end = self.start + len(self.items)
+        low = self.start
+        if self.evict_consumed:
+            low = min((cursor.pos for cursor in self.cursors), default=end)
+        if self.maxsize is not None:
+            low = max(low, end - self.maxsize)
+        if low > self.start:
+            del self.items[: low - self.start]
+            self.start = low
+        if self.maxsize is not None:
+            self._trim_at = 2 * self.maxsize
+        else:
+            self._trim_at = max(64, 2 * len(self.items))
+
+
+class _CacheCursor:
+    """
+    An independent iterator over a ``_CacheBuffer``.
+    """
+
+    __slots__ = ("buffer", "pos", "__weakref__")
+
+    def __init__(self, buffer: _CacheBuffer):
+        self.buffer = buffer
+        self.pos = buffer.start if buffer.evict_consumed else 0
+        buffer.cursors.add(self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        item = self.buffer.get(self.pos)
+        if item is _END:
+            raise StopIteration
+        self.pos += 1
+        return item
+
+
+class MelodieCachedGenerator(MelodieGenerator[VARTYPE]):
+    """
+    ``MelodieCachedGenerator`` is replayable like ``MelodieFrozenGenerator``,
+    but the upstream is pulled lazily: elements are recorded the first time
+    any iterator reaches them, and replayed to the others.
+
+    Each ``iter(g)`` (and each operation like ``map``) starts an independent
+    iterator from the head, and iterators could be consumed concurrently from
+    several threads.
+
+    If ``maxsize`` is given, only about the latest ``maxsize`` elements are
+    kept, and an iterator falling further behind raises ``RuntimeError``.
+    """
+
+    def __init__(
+        self,
+        inner: Union[Generator[VARTYPE, None, None], Iterable[VARTYPE]],
+        maxsize: Optional[int] = None,
+    ):
+        self._buffer = _CacheBuffer(inner, maxsize, evict_consumed=False)
+        self._source = self._buffer
+        self._stages = ()
+        self._running = self._buffer
+
+    @property
+    def inner(self) -> Iterable[VARTYPE]:
+        """
+        A new iterator starting from the head.
+        """
+        return _CacheCursor(self._buffer)
+
+    @property
+    def cached(self) -> int:
+        """
+        Number of elements pulled from the upstream so far.
+        """
+        return self._buffer.start + len(self._buffer.items)
+
+    def __iter__(self):
+        return self.inner
+
+    def __next__(self) -> Any:
+        raise NotImplementedError
+
+    def head(self) -> VARTYPE:
+        return next(self.inner)
 
 
 T = TypeVar("T")
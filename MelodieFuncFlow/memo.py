@@ -0,0 +1,258 @@
+"""
+Memoization of ``MelodieGenerator.memo_map``.
+"""
+import collections
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+import types
+import weakref
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_MAXSIZE = 2**16
+# Number of computed results written to the on-disk cache at once.
+FLUSH_EVERY = 256
+
+_MISSING = object()
+
+
+def _as_int(number: Any) -> Optional[int]:
+    """
+    The ``int`` equal to the ``bool``, ``int``, ``float`` or ``complex``
+    ``number``, or ``None`` if there is none.
+    """
+    if isinstance(number, int):
+        return int(number)
+    if isinstance(number, complex):
+        if number.imag != 0:
+            return None
+        number = number.real
+    if isinstance(number, float) and number.is_integer():
+        return int(number)
+    return None
+
+
+def _encode(item: Any, out: List[bytes]):
+    # Equal items are encoded to the same bytes, whatever their identity, so
+    # the items of containers are walked instead of pickled.
+    if isinstance(item, str):
+        data = item.encode("utf-8", "surrogatepass")
+        out.append(b"s%d:" % len(data))
+        out.append(data)
+    elif isinstance(item, (bytes, bytearray)):
+        out.append(b"b%d:" % len(item))
+        out.append(bytes(item))
+    elif isinstance(item, (int, float, complex)):
+        as_int = _as_int(item)
+        if as_int is not None:
+            out.append(b"i%d;" % as_int)
+        elif isinstance(item, complex) and item.imag != 0:
+            out.append(f"j{item.real.hex()},{item.imag.hex()};".encode())
+        else:
+            out.append(f"f{float(item.real).hex()};".encode())
+    elif item is None:
+        out.append(b"n")
+    elif isinstance(item, (tuple, list)):
+        out.append(b"t%d:" % len(item) if isinstance(item, tuple) else b"l%d:" % len(item))
+        for element in item:
+            _encode(element, out)
+    elif isinstance(item, dict):
+        pairs = sorted(_encoded(k) + _encoded(v) for k, v in item.items())
+        out.append(b"d%d:" % len(pairs))
+        out.extend(pairs)
+    elif isinstance(item, (set, frozenset)):
+        elements = sorted(_encoded(element) for element in item)
+        out.append(b"e%d:" % len(elements))
+        out.extend(elements)
+    elif isinstance(item, types.CodeType):
+        out.append(b"c")
+        _encode(item.co_code, out)
+        _encode(item.co_consts, out)
+        _encode(item.co_names, out)
+    else:
+        data = pickle.dumps(item, 4)
+        out.append(b"p%d:" % len(data))
+        out.append(data)
+
+
+def _encoded(item: Any) -> bytes:
+    out: List[bytes] = []
+    _encode(item, out)
+    return b"".join(out)
+
+
+def stable_digest(item: Any) -> bytes:
+    """
+    A 128-bit BLAKE2b digest of ``item``, which is the same across
+    processes and runs, and for equal items: numbers by value, strings,
+    bytes, ``None``, code objects, and tuples, lists, dicts and sets of
+    them. Other objects are digested by their pickle.
+    """
+    return hashlib.blake2b(_encoded(item), digest_size=16).digest()
+
+
+def default_namespace(func: Callable[[Any], Any]) -> str:
+    """
+    The qualified name of ``func``, with a digest of its code if it has
+    one, so lambdas and local functions sharing a name are told apart, and
+    results of an edited function are not reused.
+    """
+    name = f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+    code = getattr(func, "__code__", None)
+    if code is None:
+        return name
+    return f"{name}:{stable_digest(code).hex()}"
+
+
+def _flush(conn: sqlite3.Connection, pending: List[Tuple[bytes, float, bytes]]):
+    if pending:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO memo (key, created, value) VALUES (?, ?, ?)",
+                pending,
+            )
+        pending.clear()
+
+
+def _close(conn: sqlite3.Connection, pending: List[Tuple[bytes, float, bytes]]):
+    _flush(conn, pending)
+    conn.close()
+
+
+class MemoCache:
+    """
+    A memoized version of ``func``, caching results by ``key(item)`` (or
+    the item itself) in an in-memory LRU of at most ``maxsize`` entries.
+
+    If ``ttl`` is given, results expire after ``ttl`` seconds. If ``persist``
+    is a file path, results are also stored in an SQLite database there,
+    keyed by ``stable_digest`` of ``namespace`` and the key, so another run
+    reuses them. Results are written every ``FLUSH_EVERY`` misses and on
+    ``flush()``/``close()``. ``namespace`` defaults to
+    ``default_namespace(func)``, which changes when the code of ``func``
+    does; give one explicitly to share results across versions.
+
+    Keys should be picklable for ``persist``, and results always.
+    The cache could be shared by several threads.
+    """
+
+    def __init__(
+        self,
+        func: Callable[[Any], Any],
+        key: Optional[Callable[[Any], Any]] = None,
+        maxsize: Optional[int] = DEFAULT_MAXSIZE,
+        ttl: Optional[float] = None,
+        persist: Optional[str] = None,
+        namespace: Optional[str] = None,
+    ):
+        assert maxsize is None or maxsize >= 0, "maxsize should be non-negative"
+        self.func = func
+        self.key = key
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.namespace = namespace if namespace is not None else default_namespace(func)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "collections.OrderedDict[Any, Tuple[Any, Optional[float]]]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[bytes, float, bytes]] = []
+        if persist is not None:
+            self._conn = sqlite3.connect(persist, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS memo "
+                    "(key BLOB PRIMARY KEY, created REAL, value BLOB)"
+                )
+            self._finalizer = weakref.finalize(self, _close, self._conn, self._pending)
+
+    def _remember(self, k: Any, value: Any):
+        if self.maxsize == 0:
+            return
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        memory = self._memory
+        memory[k] = (value, expires)
+        memory.move_to_end(k)
+        if self.maxsize is not None and len(memory) > self.maxsize:
+            memory.popitem(last=False)
+
+    def __call__(self, item: Any) -> Any:
+        k = item if self.key is None else self.key(item)
+        try:
+            hash(k)
+            memory_key = k
+        except TypeError:
+            memory_key = stable_digest(k)
+        with self._lock:
+            entry = self._memory.get(memory_key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._memory.move_to_end(memory_key)
+                    self.hits += 1
+                    return value
+                del self._memory[memory_key]
+            if self._conn is not None:
+                digest = stable_digest((self.namespace, k))
+                row = self._conn.execute(
+                    "SELECT created, value FROM memo WHERE key = ?", (digest,)
+                ).fetchone()
+                if row is not None and (self.ttl is None or time.time() - row[0] < self.ttl):
+                    value = pickle.loads(row[1])
+                    self.disk_hits += 1
+                    self._remember(memory_key, value)
+                    return value
+
+        value = self.func(item)
+        with self._lock:
+            self.misses += 1
+            self._remember(memory_key, value)
+            if self._conn is not None:
+                self._pending.append(
+                    (digest, time.time(), pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                )
+                if len(self._pending) >= FLUSH_EVERY:
+                    _flush(self._conn, self._pending)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the numbers of memory hits, disk hits and misses, and the number
+        of results in memory.
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self._memory),
+        }
+
+    def clear(self):
+        """
+        Remove the results in memory. The on-disk cache is kept.
+        """
+        with self._lock:
+            self._memory.clear()
+
+    def flush(self):
+        """
+        Write the pending results to the on-disk cache.
+        """
+        if self._conn is not None:
+            with self._lock:
+                _flush(self._conn, self._pending)
+
+    def close(self):
+        """
+        Flush and close the on-disk cache.
+        """
+        if self._conn is not None:
+            with self._lock:
+                self._finalizer()
+                self._conn = None
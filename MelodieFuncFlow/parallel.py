@@ -0,0 +1,544 @@
+"""
+Executors for the parallel operations of ``MelodieGenerator``, like
+``parallel_map`` and ``thread_map``.
+"""
+import collections
+import copy
+import functools
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from . import sharedmem
+from .sharedmem import SHM_THRESHOLD
+
+# Expected execution time of one chunk when the chunk size is adapted
+# automatically. Long enough to amortize the pickling and IPC costs of a task,
+# short enough to keep the workers balanced.
+CHUNK_TARGET_SECONDS = 0.05
+MAX_AUTO_CHUNKSIZE = 4096
+
+# Maximum number of elements sent at once by a prefetching process, and the
+# longest time an element waits for its batch to fill.
+PREFETCH_BATCH = 64
+PREFETCH_FLUSH_SECONDS = 0.05
+# Interval of checking whether the other side of a prefetch is gone.
+_POLL_SECONDS = 0.1
+
+
+def _run_chunk(
+    func: Callable[..., Any], star: bool, chunk: List[Any]
+) -> Tuple[List[Any], float]:
+    """
+    Executed inside the worker, returning the results of ``chunk`` and the
+    time spent on it.
+    """
+    t0 = time.perf_counter()
+    if star:
+        results = [func(*item) for item in chunk]
+    else:
+        results = [func(item) for item in chunk]
+    return results, time.perf_counter() - t0
+
+
+def _run_shared_chunk(
+    func: Callable[..., Any], star: bool, chunk: List[Any], threshold: int
+) -> Tuple[List[Any], float]:
+    """
+    Like ``_run_chunk``, but arguments and results could be passed through
+    shared memory, see ``sharedmem``.
+    """
+    t0 = time.perf_counter()
+    attached = []
+    try:
+        args = [sharedmem.restore_args(item, star, attached) for item in chunk]
+        if star:
+            results = [func(*item) for item in args]
+        else:
+            results = [func(item) for item in args]
+        del args
+        segments = []
+        try:
+            results = [sharedmem.share(result, threshold, segments) for result in results]
+        except BaseException:
+            # Nobody else knows the segments created so far.
+            sharedmem.close_segments(segments, unlink=True)
+            raise
+        # The parent unlinks the segments of results after copying them out.
+        sharedmem.close_segments(segments, unlink=False)
+    finally:
+        sharedmem.close_segments(attached, unlink=False)
+    return results, time.perf_counter() - t0
+
+
+def _reduce_chunk(
+    func: Callable[[Any, Any], Any], initial: Any, chunk: List[Any]
+) -> Tuple[Any, int, float]:
+    """
+    Executed inside the worker, returning the reduced ``chunk``, its length
+    and the time spent on it.
+    """
+    t0 = time.perf_counter()
+    if initial is None:
+        result = functools.reduce(func, chunk)
+    else:
+        result = functools.reduce(func, chunk, copy.copy(initial))
+    return result, len(chunk), time.perf_counter() - t0
+
+
+class _ChunkSizer:
+    """
+    Decide the size of the next chunk.
+
+    If the total number of elements is known, use the same heuristic as
+    ``multiprocessing.Pool.map``. Otherwise, start from single-element chunks,
+    and adapt the size from the measured execution time so that each chunk
+    takes about ``CHUNK_TARGET_SECONDS``.
+    """
+
+    def __init__(
+        self, chunksize: Optional[int], workers: int, total: Optional[int] = None
+    ):
+        assert chunksize is None or chunksize >= 1
+        self.fixed = chunksize is not None
+        if chunksize is not None:
+            self.size = chunksize
+        elif total is not None:
+            self.fixed = True
+            self.size = max(1, -(-total // (workers * 4)))
+        else:
+            self.size = 1
+
+    def feedback(self, n_items: int, elapsed: float):
+        if self.fixed or n_items == 0:
+            return
+        per_item = elapsed / n_items
+        if per_item <= 0:
+            target = self.size * 2
+        else:
+            target = int(CHUNK_TARGET_SECONDS / per_item)
+        # Grow at most 2x at a time to avoid overshooting on noisy timings.
+        self.size = max(1, min(target, self.size * 2, MAX_AUTO_CHUNKSIZE))
+
+
+def _take(it: Iterator[Any], n: int) -> List[Any]:
+    chunk = []
+    for item in it:
+        chunk.append(item)
+        if len(chunk) >= n:
+            break
+    return chunk
+
+
+def _completed_futures(
+    submit: Callable[[], Optional[Future]], max_in_flight: int, ordered: bool
+) -> Generator[Future, None, None]:
+    """
+    Keep at most ``max_in_flight`` futures pending by calling ``submit``,
+    which returns ``None`` when the input is exhausted, and yield the futures
+    once they are done, in submission order if ``ordered``.
+
+    Pending futures are cancelled when this generator is closed.
+    """
+    pending: Deque[Future] = collections.deque()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max_in_flight:
+                future = submit()
+                if future is None:
+                    exhausted = True
+                else:
+                    pending.append(future)
+            if not pending:
+                return
+            if ordered:
+                future = pending.popleft()
+                wait((future,))
+            else:
+                done: Set[Future] = wait(pending, return_when=FIRST_COMPLETED)[0]
+                future = next(f for f in pending if f in done)
+                pending.remove(future)
+            yield future
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def process_map(
+    iterable: Iterable[Any],
+    func: Callable[..., Any],
+    star: bool = False,
+    workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    ordered: bool = True,
+    initializer: Optional[Callable[..., Any]] = None,
+    initargs: Tuple[Any, ...] = (),
+    total: Optional[int] = None,
+    shm_threshold: Optional[int] = SHM_THRESHOLD,
+) -> Generator[Any, None, None]:
+    """
+    Map ``func`` over ``iterable`` with a local process pool, yielding results
+    as a stream.
+
+    :workers: Number of worker processes, ``os.cpu_count()`` by default.
+    :chunksize: Number of elements sent in one task. If ``None``, it will be
+        decided by ``total`` if given, or adapted from measured execution time.
+    :max_in_flight: Maximum number of submitted but not yet yielded chunks,
+        ``2 * workers`` by default. The input will not be pulled further while
+        this limit is reached, so memory is bounded on infinite inputs.
+    :ordered: If ``True``, results are yielded in the input order; otherwise
+        they are yielded as soon as their chunk completes.
+    :initializer: Function called with ``initargs`` once in each worker.
+    :shm_threshold: Buffers (numpy arrays, bytes...) of at least this many
+        bytes, as elements, star arguments or results, are passed through
+        shared memory instead of pickles. ``None`` to always pickle.
+    """
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    max_in_flight = max_in_flight if max_in_flight is not None else 2 * workers
+    assert workers >= 1 and max_in_flight >= 1
+    sizer = _ChunkSizer(chunksize, workers, total)
+    source = iter(iterable)
+    # Shared memory segments of the arguments of each pending chunk.
+    inputs = {}
+
+    pool = ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+
+    def submit() -> Optional[Future]:
+        chunk = _take(source, sizer.size)
+        if len(chunk) == 0:
+            return None
+        if shm_threshold is None:
+            return pool.submit(_run_chunk, func, star, chunk)
+        segments = []
+        try:
+            chunk = [
+                sharedmem.share_args(item, star, shm_threshold, segments) for item in chunk
+            ]
+            future = pool.submit(_run_shared_chunk, func, star, chunk, shm_threshold)
+        except BaseException:
+            sharedmem.close_segments(segments, unlink=True)
+            raise
+        inputs[future] = segments
+        return future
+
+    futures = _completed_futures(submit, max_in_flight, ordered)
+    try:
+        for future in futures:
+            try:
+                results, elapsed = future.result()
+            finally:
+                if future in inputs:
+                    sharedmem.close_segments(inputs.pop(future), unlink=True)
+            if shm_threshold is not None:
+                results = sharedmem.release_results(results)
+            sizer.feedback(len(results), elapsed)
+            yield from results
+    finally:
+        futures.close()
+        pool.shutdown(wait=True)
+        for future, segments in inputs.items():
+            if not future.cancelled() and future.exception() is None:
+                sharedmem.discard_results(future.result()[0])
+            sharedmem.close_segments(segments, unlink=True)
+
+
+def thread_map(
+    iterable: Iterable[Any],
+    func: Callable[..., Any],
+    star: bool = False,
+    indexed: bool = False,
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    ordered: bool = True,
+) -> Generator[Any, None, None]:
+    """
+    Map ``func`` over ``iterable`` with a thread pool, yielding results as a
+    stream. Suitable for I/O bound functions, which release the GIL while
+    waiting.
+
+    :star: Call ``func(*elem)``.
+    :indexed: Call ``func(index, elem)``.
+    :workers: Number of threads, ``min(32, os.cpu_count() + 4)`` by default.
+    :max_in_flight: Maximum number of submitted but not yet yielded elements,
+        ``2 * workers`` by default. The input will not be pulled further while
+        this limit is reached, so memory is bounded on infinite inputs.
+    :ordered: If ``True``, results are yielded in the input order; otherwise
+        they are yielded as soon as they complete.
+    """
+    assert not (star and indexed), "star and indexed could not be used together"
+    workers = workers if workers is not None else min(32, (os.cpu_count() or 1) + 4)
+    max_in_flight = max_in_flight if max_in_flight is not None else 2 * workers
+    assert workers >= 1 and max_in_flight >= 1
+    source = enumerate(iterable) if indexed else iter(iterable)
+    pool = ThreadPoolExecutor(workers)
+
+    def submit() -> Optional[Future]:
+        for item in source:
+            if star or indexed:
+                return pool.submit(func, *item)
+            return pool.submit(func, item)
+        return None
+
+    futures = _completed_futures(submit, max_in_flight, ordered)
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        futures.close()
+        pool.shutdown(wait=True)
+
+
+def tree_reduce(
+    iterable: Iterable[Any],
+    func: Callable[[Any, Any], Any],
+    initial: Any = None,
+    combine: Optional[Callable[[Any, Any], Any]] = None,
+    workers: Optional[int] = None,
+    chunksize: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    initializer: Optional[Callable[..., Any]] = None,
+    initargs: Tuple[Any, ...] = (),
+    total: Optional[int] = None,
+) -> Any:
+    """
+    Reduce ``iterable`` with a local process pool.
+
+    Each chunk is reduced by ``func`` in a worker, starting from a copy of
+    ``initial`` (or from its first element if ``initial`` is ``None``). Then
+    the partial results are combined pairwise by ``combine`` in the workers,
+    level by level like a balanced tree, keeping their order. So ``combine``
+    should be associative, but needs not be commutative, and ``initial``
+    should be its identity. ``combine`` defaults to ``func``.
+
+    The arguments are the same as ``process_map``.
+    """
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    max_in_flight = max_in_flight if max_in_flight is not None else 2 * workers
+    assert workers >= 1 and max_in_flight >= 1
+    combine = func if combine is None else combine
+    sizer = _ChunkSizer(chunksize, workers, total)
+    source = iter(iterable)
+
+    pool = ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+
+    def submit() -> Optional[Future]:
+        chunk = _take(source, sizer.size)
+        if len(chunk) == 0:
+            return None
+        return pool.submit(_reduce_chunk, func, initial, chunk)
+
+    futures = _completed_futures(submit, max_in_flight, True)
+    try:
+        level = []
+        for future in futures:
+            partial, n_items, elapsed = future.result()
+            sizer.feedback(n_items, elapsed)
+            level.append(partial)
+        if len(level) == 0:
+            if initial is None:
+                raise TypeError("reduce of empty iterable with no initial value")
+            return initial
+        while len(level) > 2:
+            merged = [
+                pool.submit(combine, level[i], level[i + 1])
+                for i in range(0, len(level) - 1, 2)
+            ]
+            merged = [future.result() for future in merged]
+            if len(level) % 2 == 1:
+                merged.append(level[-1])
+            level = merged
+        return level[0] if len(level) == 1 else combine(level[0], level[1])
+    finally:
+        futures.close()
+        pool.shutdown(wait=True)
+
+
+class _PrefetchFailure:
+    """
+    An exception raised by the upstream of a prefetch.
+    """
+
+    __slots__ = ("exc",)
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+class _PrefetchEnd:
+    """
+    The end of the upstream of a prefetch.
+    """
+
+    __slots__ = ()
+
+
+def _prefetch_failure(e: BaseException) -> _PrefetchFailure:
+    # Exceptions sent from another process should be picklable.
+    try:
+        pickle.dumps(e)
+    except Exception:
+        e = RuntimeError(f"{type(e).__name__}: {e}")
+    return _PrefetchFailure(e)
+
+
+def _put_until_stopped(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _prefetch_thread_worker(
+    iterable: Iterable[Any], q: queue.Queue, stop: threading.Event
+):
+    it = iter(iterable)
+    try:
+        for item in it:
+            if not _put_until_stopped(q, item, stop):
+                return
+        message = _PrefetchEnd()
+    except BaseException as e:
+        message = _PrefetchFailure(e)
+    finally:
+        close = getattr(it, "close", None)
+        if close is not None:
+            close()
+    _put_until_stopped(q, message, stop)
+
+
+def prefetch_thread(iterable: Iterable[Any], n: int) -> Generator[Any, None, None]:
+    """
+    Pull ``iterable`` in a background thread, which keeps at most ``n``
+    elements ahead of the consumer.
+
+    Exceptions of the upstream are raised to the consumer. When the consumer
+    closes this generator, the thread stops after its current pull, and
+    closes the upstream.
+    """
+    assert n >= 1
+    q: queue.Queue = queue.Queue(maxsize=n)
+    stop = threading.Event()
+    thread = threading.Thread(
+        target=_prefetch_thread_worker,
+        args=(iterable, q, stop),
+        name="melodie-prefetch",
+        daemon=True,
+    )
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if type(item) is _PrefetchEnd:
+                return
+            if type(item) is _PrefetchFailure:
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+
+
+def _prefetch_process_worker(
+    iterable: Iterable[Any], q: Any, stop: Any, batch_size: int
+):
+    # Executed in the forked process, which inherits ``iterable``.
+    batch = []
+    started = time.perf_counter()
+    try:
+        for item in iterable:
+            batch.append(item)
+            now = time.perf_counter()
+            if len(batch) >= batch_size or now - started >= PREFETCH_FLUSH_SECONDS:
+                q.put(batch)
+                batch = []
+                started = now
+                if stop.is_set():
+                    return
+        if batch:
+            q.put(batch)
+        q.put(_PrefetchEnd())
+    except BaseException as e:
+        q.put(_prefetch_failure(e))
+
+
+def prefetch_process(
+    iterable: Iterable[Any], n: int, batch_size: int = PREFETCH_BATCH
+) -> Generator[Any, None, None]:
+    """
+    Pull ``iterable`` in a forked process, which keeps about ``n`` elements
+    ahead of the consumer, sending them in batches of up to ``batch_size``.
+
+    The process inherits ``iterable`` as it is when the first element is
+    requested, so the upstream (including its side effects) runs in that
+    process, and must not be used in this process afterwards. Elements and
+    exceptions should be picklable. The process is terminated when the
+    consumer closes this generator.
+
+    Only supported on platforms with the ``fork`` start method.
+    """
+    assert n >= 1 and batch_size >= 1
+    try:
+        ctx = multiprocessing.get_context("fork")
+    except ValueError:
+        raise ValueError("prefetch in a process requires the fork start method")
+    batch_size = min(batch_size, n)
+    q = ctx.Queue(maxsize=max(1, n // batch_size))
+    stop = ctx.Event()
+    process = ctx.Process(
+        target=_prefetch_process_worker,
+        args=(iterable, q, stop, batch_size),
+        name="melodie-prefetch",
+        daemon=True,
+    )
+    process.start()
+    try:
+        while True:
+            try:
+                message = q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                try:
+                    message = q.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    raise RuntimeError(
+                        f"prefetch process exited unexpectedly with code {process.exitcode}"
+                    )
+            if type(message) is _PrefetchEnd:
+                return
+            if type(message) is _PrefetchFailure:
+                raise message.exc
+            yield from message
+    finally:
+        stop.set()
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        q.close()
@@ -0,0 +1,303 @@
+"""
+Partitioned datasets, whose operations run on each partition in parallel.
+
+A ``MelodiePartitionedDataset`` holds its elements as a list of partitions
+and a plan of pending operations. Actions like ``collect()`` send each
+partition with the plan as one task to a local process pool, or to
+``ipyparallel`` engines, so a task costs one round trip per partition
+instead of per element.
+
+``shuffle`` (``repartition`` by a key) splits the output of each task into
+buckets on the workers by a stable hash of the key, and the buckets of all
+tasks are concatenated into the new partitions. Elements with equal keys end
+up in the same partition, on which ``group_by`` and ``join`` are done
+locally.
+"""
+import functools
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+
+from .functional import MelodieFrozenGenerator, _Stage, _run_stages
+from .memo import _as_int, stable_digest
+
+ROUND_ROBIN = "round_robin"
+
+_BACKENDS = ("process", "ipyparallel")
+
+
+class _PartitionStep:
+    """
+    A step of the plan calling ``func`` with the iterable of a whole
+    partition, like ``map_partitions``.
+    """
+
+    __slots__ = ("func",)
+
+    def __init__(self, func: Callable[[Iterable[Any]], Iterable[Any]]):
+        self.func = func
+
+    def __getstate__(self):
+        return self.func
+
+    def __setstate__(self, func):
+        self.func = func
+
+
+_Step = Union[_Stage, _PartitionStep]
+
+
+def _bucket_of(key: Any, n: int) -> int:
+    # ``hash()`` of strings differs between processes, so it could not be
+    # used to split partitions on several workers. Numbers equal to an int
+    # go with that int.
+    if type(key) is int:
+        return key % n
+    if isinstance(key, (int, float, complex)):
+        as_int = _as_int(key)
+        if as_int is not None:
+            return as_int % n
+    return int.from_bytes(stable_digest(key)[:8], "little") % n
+
+
+def _split(items: List[Any], n: int, by: Any) -> List[List[Any]]:
+    buckets: List[List[Any]] = [[] for _ in range(n)]
+    if by is None or by == ROUND_ROBIN:
+        for i, item in enumerate(items):
+            buckets[i % n].append(item)
+    else:
+        for item in items:
+            buckets[_bucket_of(by(item), n)].append(item)
+    return buckets
+
+
+def _apply_steps(items: Iterable[Any], steps: Tuple[_Step, ...]) -> List[Any]:
+    """
+    Run the plan on the elements of one partition. Consecutive element-wise
+    stages are fused into one loop.
+    """
+    fused: List[_Stage] = []
+    for step in steps:
+        if isinstance(step, _PartitionStep):
+            items = step.func(_run_stages(items, tuple(fused)))
+            fused = []
+        else:
+            fused.append(step)
+    return list(_run_stages(items, tuple(fused)))
+
+
+def _run_partition(steps: Tuple[_Step, ...], items: List[Any]) -> List[Any]:
+    return _apply_steps(items, steps)
+
+
+def _run_and_split(
+    steps: Tuple[_Step, ...], n: int, by: Callable[[Any], Any], items: List[Any]
+) -> List[List[Any]]:
+    return _split(_apply_steps(items, steps), n, by)
+
+
+def _group_items(key: Callable[[Any], Any], items: Iterable[Any]) -> List[Tuple[Any, List[Any]]]:
+    groups = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return list(groups.items())
+
+
+def _join_items(
+    key: Callable[[Any], Any],
+    other_key: Callable[[Any], Any],
+    items: List[Any],
+    others: List[Any],
+) -> List[Tuple[Any, Any]]:
+    index = {}
+    for other in others:
+        index.setdefault(other_key(other), []).append(other)
+    return [(item, other) for item in items for other in index.get(key(item), ())]
+
+
+class MelodiePartitionedDataset:
+    """
+    A dataset split into partitions. Element-wise operations are recorded,
+    and run on each partition in parallel by actions like ``collect()``.
+
+    With ``backend="process"``, a local process pool of ``workers`` is
+    started for each action, so functions must be picklable. With
+    ``backend="ipyparallel"``, partitions are sent to the engines of
+    ``EnginePool.shared()``, and functions must be importable (or pushed)
+    there.
+    """
+
+    def __init__(
+        self,
+        partitions: List[List[Any]],
+        backend: str = "process",
+        workers: Optional[int] = None,
+        steps: Tuple[_Step, ...] = (),
+    ):
+        if backend not in _BACKENDS:
+            raise ValueError(f"Unknown parallel backend {backend!r}")
+        assert len(partitions) >= 1, "a dataset should have at least one partition"
+        self.partitions = partitions
+        self.backend = backend
+        self.workers = workers
+        self._steps = steps
+
+    @staticmethod
+    def from_iterable(
+        iterable: Iterable[Any],
+        n: int,
+        by: Any = None,
+        backend: str = "process",
+        workers: Optional[int] = None,
+    ) -> "MelodiePartitionedDataset":
+        """
+        Split ``iterable`` into ``n`` partitions by ``by`` (see
+        ``repartition``) in this process.
+        """
+        assert n >= 1, "the number of partitions should be at least 1"
+        items = iterable if isinstance(iterable, list) else list(iterable)
+        return MelodiePartitionedDataset(_split(items, n, by), backend, workers)
+
+    @property
+    def num_partitions(self) -> int:
+        return len(self.partitions)
+
+    def __repr__(self) -> str:
+        return (
+            f"<MelodiePartitionedDataset {self.num_partitions} partitions, "
+            f"{len(self._steps)} pending steps, backend={self.backend!r}>"
+        )
+
+    def _with_step(self, step: _Step) -> "MelodiePartitionedDataset":
+        return MelodiePartitionedDataset(
+            self.partitions, self.backend, self.workers, self._steps + (step,)
+        )
+
+    def map(self, func: Callable[[Any], Any]) -> "MelodiePartitionedDataset":
+        return self._with_step(_Stage("map", func))
+
+    def star_map(self, func: Callable[..., Any]) -> "MelodiePartitionedDataset":
+        return self._with_step(_Stage("star_map", func))
+
+    def filter(self, func: Callable[[Any], bool]) -> "MelodiePartitionedDataset":
+        return self._with_step(_Stage("filter", func))
+
+    def star_filter(self, func: Callable[..., bool]) -> "MelodiePartitionedDataset":
+        return self._with_step(_Stage("star_filter", func))
+
+    def map_partitions(
+        self, func: Callable[[Iterable[Any]], Iterable[Any]]
+    ) -> "MelodiePartitionedDataset":
+        """
+        Call ``func`` with an iterable of the elements of each partition, and
+        use the elements it returns (or yields) as the new partition.
+        """
+        return self._with_step(_PartitionStep(func))
+
+    def _map(self, func: Callable[..., Any], *iterables: Iterable[Any]) -> List[Any]:
+        """
+        Call ``func`` on the workers with the arguments from ``iterables``,
+        one task for each partition, returning the results in order.
+        """
+        if self.backend == "process":
+            workers = min(self.workers or os.cpu_count() or 1, self.num_partitions)
+            with ProcessPoolExecutor(workers) as pool:
+                return list(pool.map(func, *iterables))
+        from .engines import EnginePool
+
+        return list(EnginePool.shared().map(zip(*iterables), func, star=True, chunksize=1))
+
+    def collect_partitions(self) -> List[List[Any]]:
+        """
+        Run the plan, and get the elements of each partition.
+        """
+        if len(self._steps) == 0:
+            return [list(partition) for partition in self.partitions]
+        return self._map(
+            functools.partial(_run_partition, self._steps), self.partitions
+        )
+
+    def collect(self) -> "MelodieFrozenGenerator[Any]":
+        """
+        Run the plan, and get the elements of all partitions in order.
+        """
+        return MelodieFrozenGenerator(
+            [item for partition in self.collect_partitions() for item in partition]
+        )
+
+    def count(self) -> int:
+        return sum(len(partition) for partition in self.collect_partitions())
+
+    def cache(self) -> "MelodiePartitionedDataset":
+        """
+        Run the plan, and keep its results as the partitions of a new dataset,
+        so later operations do not run it again.
+        """
+        return MelodiePartitionedDataset(
+            self.collect_partitions(), self.backend, self.workers
+        )
+
+    def repartition(self, n: int, by: Any = None) -> "MelodiePartitionedDataset":
+        """
+        Run the plan, and split its results into ``n`` new partitions.
+
+        :by: ``None`` or ``"round_robin"`` to deal the elements in turn, or a
+            key function to put elements with equal keys into the same
+            partition, by a hash of the key which is the same on all workers.
+        """
+        assert n >= 1, "the number of partitions should be at least 1"
+        if by is None or by == ROUND_ROBIN:
+            items = [item for partition in self.collect_partitions() for item in partition]
+            partitions = _split(items, n, by)
+        else:
+            buckets = self._map(
+                functools.partial(_run_and_split, self._steps, n, by), self.partitions
+            )
+            partitions = [[item for split in buckets for item in split[i]] for i in range(n)]
+        return MelodiePartitionedDataset(partitions, self.backend, self.workers)
+
+    def shuffle(
+        self, key: Callable[[Any], Any], n: Optional[int] = None
+    ) -> "MelodiePartitionedDataset":
+        """
+        Repartition by ``key`` into ``n`` partitions (the current number by
+        default), so elements with equal keys are in the same partition.
+        """
+        return self.repartition(n if n is not None else self.num_partitions, key)
+
+    def group_by(
+        self, key: Callable[[Any], Any], n: Optional[int] = None
+    ) -> "MelodiePartitionedDataset":
+        """
+        Get a dataset of ``(key, elements)`` pairs, shuffling by ``key`` so
+        each group is built on a single worker.
+        """
+        return self.shuffle(key, n).map_partitions(functools.partial(_group_items, key))
+
+    def join(
+        self,
+        other: "MelodiePartitionedDataset",
+        key: Callable[[Any], Any],
+        other_key: Optional[Callable[[Any], Any]] = None,
+        n: Optional[int] = None,
+    ) -> "MelodiePartitionedDataset":
+        """
+        Inner join with ``other``, getting a dataset of ``(element,
+        other_element)`` pairs whose keys are equal. Both datasets are
+        shuffled by their keys into ``n`` partitions, and each pair of
+        partitions is joined on one worker.
+        """
+        other_key = other_key if other_key is not None else key
+        n = n if n is not None else max(self.num_partitions, other.num_partitions)
+        left = self.shuffle(key, n)
+        right = other.shuffle(other_key, n)
+        return MelodiePartitionedDataset(
+            left._map(
+                functools.partial(_join_items, key, other_key),
+                left.partitions,
+                right.partitions,
+            ),
+            self.backend,
+            self.workers,
+        )
@@ -0,0 +1,269 @@
+"""
+Pipeline-parallel execution of the stage plan of a ``MelodieGenerator``.
+
+Stages are split into groups, and each group runs in its own worker
+processes. The source is read by a thread of this process, and elements go
+from group to group in numbered batches through bounded queues, so a slow
+group could be given more workers, and the output keeps the input order.
+"""
+import multiprocessing
+import queue
+import threading
+
+from typing import Any, Dict, Generator, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .functional import _Stage, _run_stages
+from .parallel import (
+    _POLL_SECONDS,
+    _PrefetchEnd,
+    _PrefetchFailure,
+    _prefetch_failure,
+)
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_QUEUE_SIZE = 8
+
+# Stages too cheap to be worth their own processes, which are grouped with
+# the previous stage by default.
+_LIGHT_KINDS = {"attributes", "cast"}
+
+
+def _default_groups(stages: Sequence[_Stage]) -> List[int]:
+    groups: List[int] = []
+    for i, stage in enumerate(stages):
+        if i > 0 and stage.kind in _LIGHT_KINDS:
+            groups[-1] += 1
+        else:
+            groups.append(1)
+    return groups
+
+
+def _stage_worker(
+    index: int,
+    stages: Tuple[_Stage, ...],
+    in_queue: Any,
+    out_queue: Any,
+    final_queue: Any,
+    ends: Any,
+    n_upstream: int,
+    n_workers: int,
+    counts: Any,
+):
+    # Executed in the forked worker processes of group ``index``. Each
+    # upstream worker sends its own end after its batches, so when the last
+    # one is received, no batch is left in ``in_queue``, and the other workers
+    # of this group are woken up by ``None``.
+    try:
+        while True:
+            message = in_queue.get()
+            if message is None:
+                break
+            if type(message) is _PrefetchEnd:
+                with ends.get_lock():
+                    ends.value += 1
+                    last = ends.value == n_upstream
+                if last:
+                    for _ in range(n_workers - 1):
+                        in_queue.put(None)
+                    break
+                continue
+            seq, batch = message
+            out = list(_run_stages(iter(batch), stages))
+            with counts.get_lock():
+                counts[2 * index] += len(batch)
+                counts[2 * index + 1] += len(out)
+            # Empty batches are sent as well, to keep the sequence complete.
+            out_queue.put((seq, out))
+        out_queue.put(_PrefetchEnd())
+    except BaseException as e:
+        final_queue.put(_prefetch_failure(e))
+
+
+class PipelineExecutor:
+    """
+    Run groups of stages of a plan in worker processes connected by bounded
+    queues. Use ``stats()`` to see the progress and queue depth of each group
+    while iterating, to decide which group needs more workers.
+    """
+
+    def __init__(
+        self,
+        source: Iterable[Any],
+        stages: Tuple[_Stage, ...],
+        workers_per_stage: Union[int, Sequence[int]] = 1,
+        groups: Optional[Sequence[int]] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        ordered: bool = True,
+    ):
+        if len(stages) == 0:
+            raise ValueError("no stages to run in a pipeline")
+        if any(stage.kind.startswith("indexed_") for stage in stages):
+            raise ValueError("indexed stages could not run in a pipeline")
+        groups = list(groups) if groups is not None else _default_groups(stages)
+        if sum(groups) != len(stages) or min(groups) < 1:
+            raise ValueError(f"groups {groups} do not split {len(stages)} stages")
+        if isinstance(workers_per_stage, int):
+            workers_per_stage = [workers_per_stage] * len(groups)
+        workers_per_stage = list(workers_per_stage)
+        if len(workers_per_stage) != len(groups) or min(workers_per_stage) < 1:
+            raise ValueError(
+                f"workers_per_stage should have one positive number for each of {len(groups)} groups"
+            )
+        assert batch_size >= 1 and queue_size >= 1
+        try:
+            self._ctx = multiprocessing.get_context("fork")
+        except ValueError:
+            raise ValueError("pipeline requires the fork start method")
+
+        self.source = source
+        self.groups: List[Tuple[_Stage, ...]] = []
+        start = 0
+        for size in groups:
+            self.groups.append(tuple(stages[start : start + size]))
+            start += size
+        self.workers = workers_per_stage
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.ordered = ordered
+        self._queues: List[Any] = []
+        self._counts = self._ctx.Array("q", 2 * len(self.groups))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        For each group, get its stages, number of workers, elements in/out,
+        and the number of batches waiting in its input queue (``None`` when not
+        running, or if the platform could not tell).
+        """
+        counts = self._counts[:]
+        report = []
+        for i, group in enumerate(self.groups):
+            depth = None
+            if self._queues:
+                try:
+                    depth = self._queues[i].qsize()
+                except NotImplementedError:
+                    pass
+            report.append(
+                {
+                    "stages": [stage.describe() for stage in group],
+                    "workers": self.workers[i],
+                    "in": counts[2 * i],
+                    "out": counts[2 * i + 1],
+                    "queue_depth": depth,
+                }
+            )
+        return report
+
+    def _feed(self, first_queue: Any, final_queue: Any, stop: threading.Event):
+        # Executed in a thread of this process.
+        def put(q: Any, message: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(message, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        it = iter(self.source)
+        seq = 0
+        try:
+            batch = []
+            for item in it:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    if not put(first_queue, (seq, batch)):
+                        return
+                    seq += 1
+                    batch = []
+            if batch and not put(first_queue, (seq, batch)):
+                return
+            put(first_queue, _PrefetchEnd())
+        except BaseException as e:
+            put(final_queue, _prefetch_failure(e))
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+
+    def __iter__(self) -> Generator[Any, None, None]:
+        ctx = self._ctx
+        n_groups = len(self.groups)
+        self._queues = queues = [ctx.Queue(self.queue_size) for _ in range(n_groups + 1)]
+        final_queue = queues[-1]
+        processes = []
+        for i, group in enumerate(self.groups):
+            ends = ctx.Value("i", 0)
+            n_upstream = self.workers[i - 1] if i > 0 else 1
+            for j in range(self.workers[i]):
+                processes.append(
+                    ctx.Process(
+                        target=_stage_worker,
+                        args=(
+                            i,
+                            group,
+                            queues[i],
+                            queues[i + 1],
+                            final_queue,
+                            ends,
+                            n_upstream,
+                            self.workers[i],
+                            self._counts,
+                        ),
+                        name=f"melodie-pipeline-{i}-{j}",
+                        daemon=True,
+                    )
+                )
+        # Fork the workers before starting the feeding thread.
+        for process in processes:
+            process.start()
+        stop = threading.Event()
+        feeder = threading.Thread(
+            target=self._feed,
+            args=(queues[0], final_queue, stop),
+            name="melodie-pipeline-feed",
+            daemon=True,
+        )
+        feeder.start()
+
+        pending: Dict[int, List[Any]] = {}
+        next_seq = 0
+        ends = 0
+        try:
+            while True:
+                try:
+                    message = final_queue.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    for process in processes:
+                        if process.exitcode not in (None, 0):
+                            raise RuntimeError(
+                                f"pipeline worker {process.name} exited unexpectedly "
+                                f"with code {process.exitcode}"
+                            )
+                    continue
+                if type(message) is _PrefetchEnd:
+                    ends += 1
+                    if ends == self.workers[-1]:
+                        break
+                    continue
+                if type(message) is _PrefetchFailure:
+                    raise message.exc
+                seq, batch = message
+                if not self.ordered:
+                    yield from batch
+                    continue
+                pending[seq] = batch
+                while next_seq in pending:
+                    yield from pending.pop(next_seq)
+                    next_seq += 1
+        finally:
+            stop.set()
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join()
+            for q in queues:
+                q.close()
+            self._queues = []
@@ -0,0 +1,230 @@
+"""
+Per-stage profiling of the fused plan of a ``MelodieGenerator``.
+"""
+import json
+import marshal
+import operator
+import time
+
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from .functional import _FILTER_KINDS
+
+
+def _identity(item: Any) -> Any:
+    return item
+
+
+class _StageProbe:
+    """
+    Wrap the function of one stage, counting calls and measuring the time
+    spent inside it.
+    """
+
+    __slots__ = ("func", "calls", "passed", "time", "is_filter")
+
+    def __init__(self, func: Callable[..., Any], is_filter: bool):
+        self.func = func
+        self.is_filter = is_filter
+        self.calls = 0
+        self.passed = 0
+        self.time = 0.0
+
+    def __call__(self, *args):
+        t0 = time.perf_counter()
+        ret = self.func(*args)
+        self.time += time.perf_counter() - t0
+        self.calls += 1
+        if ret:
+            self.passed += 1
+        return ret
+
+    @property
+    def output(self) -> int:
+        return self.passed if self.is_filter else self.calls
+
+
+class _SourceProbe:
+    """
+    Wrap the source iterator, counting elements and measuring the time
+    spent producing them.
+    """
+
+    __slots__ = ("it", "count", "time")
+
+    def __init__(self, source: Iterable[Any]):
+        self.it = iter(source)
+        self.count = 0
+        self.time = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        t0 = time.perf_counter()
+        try:
+            item = next(self.it)
+        finally:
+            self.time += time.perf_counter() - t0
+        self.count += 1
+        return item
+
+
+class PipelineProfile:
+    """
+    Statistics of each stage of a profiled generator, created by
+    ``MelodieGenerator.profile()`` and filled in while it is consumed.
+
+    For each stage, ``in`` and ``out`` are the numbers of elements entering
+    and leaving it, ``self_time`` is the time spent in its function, and
+    ``cumulative_time`` also includes the stages before it and the source.
+    """
+
+    def __init__(self, source: Iterable[Any], stages: Tuple[Any, ...]):
+        self.source = _SourceProbe(source)
+        self.stage_kinds: List[str] = []
+        self.stage_names: List[str] = []
+        self.probes: List[_StageProbe] = []
+        self.probed_funcs: List[Tuple[str, _StageProbe]] = []
+        for stage in stages:
+            kind, func = stage.kind, stage.func
+            if kind == "attributes":
+                kind, func = "map", operator.attrgetter(func)
+            elif kind == "cast":
+                # Casting is a no-op at runtime, profiled as an identity map.
+                kind, func = "map", _identity
+            probe = _StageProbe(func, kind in _FILTER_KINDS)
+            self.stage_kinds.append(stage.kind)
+            self.stage_names.append(stage.describe())
+            self.probes.append(probe)
+            self.probed_funcs.append((kind, probe))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the statistics as a dict of plain values.
+        """
+        cumulative = self.source.time
+        stages = []
+        for i, (name, probe) in enumerate(zip(self.stage_names, self.probes)):
+            cumulative += probe.time
+            stages.append(
+                {
+                    "index": i,
+                    "kind": self.stage_kinds[i],
+                    "name": name,
+                    "in": probe.calls,
+                    "out": probe.output,
+                    "self_time": probe.time,
+                    "cumulative_time": cumulative,
+                    "throughput": probe.output / cumulative if cumulative > 0 else None,
+                    "selectivity": (
+                        probe.passed / probe.calls
+                        if probe.is_filter and probe.calls > 0
+                        else None
+                    ),
+                }
+            )
+        return {
+            "source": {"out": self.source.count, "self_time": self.source.time},
+            "stages": stages,
+            "total_time": cumulative,
+        }
+
+    def table(self) -> str:
+        """
+        Format the statistics as a text table.
+        """
+        report = self.to_dict()
+        header = ("#", "stage", "in", "out", "self(s)", "cum(s)", "items/s", "select")
+        rows = [
+            (
+                "-",
+                "source",
+                "",
+                str(report["source"]["out"]),
+                f"{report['source']['self_time']:.6f}",
+                f"{report['source']['self_time']:.6f}",
+                "",
+                "",
+            )
+        ]
+        for stage in report["stages"]:
+            rows.append(
+                (
+                    str(stage["index"]),
+                    stage["name"],
+                    str(stage["in"]),
+                    str(stage["out"]),
+                    f"{stage['self_time']:.6f}",
+                    f"{stage['cumulative_time']:.6f}",
+                    "" if stage["throughput"] is None else f"{stage['throughput']:.0f}",
+                    "" if stage["selectivity"] is None else f"{stage['selectivity']:.2%}",
+                )
+            )
+        widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+        return "\n".join(
+            "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+            for row in [header] + rows
+        )
+
+    def __str__(self) -> str:
+        return self.table()
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """
+        Get a Chrome trace (``chrome://tracing`` or Perfetto) of the
+        aggregated time of each stage, laid out one after another.
+        """
+        events = []
+        ts = 0.0
+        report = self.to_dict()
+        entries = [("source", report["source"]["self_time"], {"out": report["source"]["out"]})]
+        for stage in report["stages"]:
+            entries.append(
+                (stage["name"], stage["self_time"], {"in": stage["in"], "out": stage["out"]})
+            )
+        for name, seconds, args in entries:
+            dur = seconds * 1e6
+            events.append(
+                {"name": name, "ph": "X", "ts": ts, "dur": dur, "pid": 0, "tid": 0, "args": args}
+            )
+            ts += dur
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path: str):
+        """
+        Write ``to_chrome_trace()`` as a JSON file.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+    def dump_stats(self, path: str):
+        """
+        Write the statistics in the format of ``cProfile``, which could be
+        loaded by ``pstats.Stats(path)`` or visualizers like snakeviz.
+        """
+        stats = {}
+        report = self.to_dict()
+        stats[("<source>", 0, "source")] = (
+            report["source"]["out"],
+            report["source"]["out"],
+            report["source"]["self_time"],
+            report["source"]["self_time"],
+            {},
+        )
+        for stage, probe in zip(report["stages"], self.probes):
+            code = getattr(probe.func, "__code__", None)
+            func_key = (
+                code.co_filename if code else "<stage>",
+                code.co_firstlineno if code else stage["index"],
+                f"[{stage['index']}] {stage['name']}",
+            )
+            stats[func_key] = (
+                stage["in"],
+                stage["in"],
+                stage["self_time"],
+                stage["cumulative_time"],
+                {},
+            )
+        with open(path, "wb") as f:
+            marshal.dump(stats, f)
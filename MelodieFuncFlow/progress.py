@@ -0,0 +1,207 @@
+"""
+Rate-limited progress reporting of ``MelodieGenerator.show_progress``.
+
+Elements are counted in a local variable, and a timer thread marks an
+update as due every refresh ``interval``, so the loop does not read the clock
+for each element, and the time between two updates does not depend on how
+fast the elements come. The counts are then flushed to a sink, which could
+be a tqdm bar, a logger, a callback or a metrics counter.
+"""
+import functools
+import logging
+import threading
+import time
+
+from typing import Any, Callable, Generator, Iterable, List, Optional, Union
+
+
+@functools.lru_cache(maxsize=None)
+def _in_jupyter() -> bool:
+    try:
+        from IPython import get_ipython
+
+        shell = get_ipython().__class__.__name__
+        return shell == "ZMQInteractiveShell"  # Jupyter notebook or qtconsole
+    except Exception:
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def _import_tqdm_module():
+    if _in_jupyter():
+        from tqdm.notebook import tqdm
+    else:
+        from tqdm import tqdm
+    return tqdm
+
+
+class ProgressSink:
+    """
+    The receiver of progress updates.
+
+    ``start`` is called before the first element, ``update`` with the number
+    of new elements ``n`` and the total count so far (the final count is
+    always flushed), and ``close`` once when the iteration finishes, fails
+    or is abandoned.
+    """
+
+    # Default seconds between two updates.
+    interval = 0.1
+
+    def start(self, total: Optional[int]):
+        pass
+
+    def update(self, n: int, count: int):
+        pass
+
+    def close(self, count: int):
+        pass
+
+
+class TqdmSink(ProgressSink):
+    """
+    Show a tqdm bar, or the notebook bar inside Jupyter.
+    """
+
+    def __init__(self, desc: Optional[str] = None, **tqdm_kwargs):
+        self.desc = desc
+        self.tqdm_kwargs = tqdm_kwargs
+        self.bar = None
+
+    def start(self, total: Optional[int]):
+        tqdm = _import_tqdm_module()
+        self.bar = tqdm(total=total, desc=self.desc, **self.tqdm_kwargs)
+
+    def update(self, n: int, count: int):
+        self.bar.update(n)
+
+    def close(self, count: int):
+        if self.bar is not None:
+            self.bar.close()
+
+
+class LoggingSink(ProgressSink):
+    """
+    Log the count, percentage and rate, for headless jobs without tqdm.
+    """
+
+    interval = 10.0
+
+    def __init__(
+        self,
+        logger: Optional[logging.Logger] = None,
+        level: int = logging.INFO,
+        desc: str = "progress",
+    ):
+        self.logger = logger if logger is not None else logging.getLogger("MelodieFuncFlow")
+        self.level = level
+        self.desc = desc
+        self.total: Optional[int] = None
+        self.started = 0.0
+
+    def start(self, total: Optional[int]):
+        self.total = total
+        self.started = time.monotonic()
+
+    def _log(self, count: int):
+        elapsed = time.monotonic() - self.started
+        rate = count / elapsed if elapsed > 0 else 0.0
+        if self.total:
+            self.logger.log(
+                self.level,
+                "%s: %d/%d (%.1f%%), %.1f it/s",
+                self.desc, count, self.total, 100 * count / self.total, rate,
+            )
+        else:
+            self.logger.log(self.level, "%s: %d, %.1f it/s", self.desc, count, rate)
+
+    def update(self, n: int, count: int):
+        self._log(count)
+
+
+class CallbackSink(ProgressSink):
+    """
+    Call ``callback(count, total)`` on each update.
+    """
+
+    def __init__(self, callback: Callable[[int, Optional[int]], Any]):
+        self.callback = callback
+        self.total: Optional[int] = None
+
+    def start(self, total: Optional[int]):
+        self.total = total
+
+    def update(self, n: int, count: int):
+        self.callback(count, self.total)
+
+
+class MetricsSink(ProgressSink):
+    """
+    Increase a metrics counter by the number of new elements, by calling
+    ``counter.inc(n)`` like ``prometheus_client.Counter``.
+    """
+
+    interval = 1.0
+
+    def __init__(self, counter: Any):
+        self.counter = counter
+
+    def update(self, n: int, count: int):
+        self.counter.inc(n)
+
+
+def make_sink(sink: Union[str, ProgressSink, Callable[..., Any], None]) -> ProgressSink:
+    """
+    Get a sink from ``"tqdm"``, ``"logging"``, a ``ProgressSink`` or a callback.
+    """
+    if sink is None or sink == "tqdm":
+        return TqdmSink()
+    if sink == "logging":
+        return LoggingSink()
+    if isinstance(sink, ProgressSink):
+        return sink
+    if callable(sink):
+        return CallbackSink(sink)
+    raise ValueError(f"unknown progress sink {sink!r}")
+
+
+def _tick(due: List[bool], stop: threading.Event, interval: float):
+    # Executed in the timer thread of ``track``.
+    while not stop.wait(interval):
+        due[0] = True
+
+
+def track(
+    iterable: Iterable[Any],
+    sink: ProgressSink,
+    total: Optional[int] = None,
+    interval: Optional[float] = None,
+) -> Generator[Any, None, None]:
+    """
+    Yield the elements of ``iterable``, reporting their count to ``sink`` at
+    most once per ``interval`` seconds (``sink.interval`` by default).
+    The sink is closed when the iteration finishes or the generator is closed.
+    """
+    interval = sink.interval if interval is None else interval
+    count = reported = 0
+    # With no interval, every element is reported.
+    due = [interval <= 0]
+    stop = threading.Event()
+    sink.start(total)
+    if not due[0]:
+        threading.Thread(
+            target=_tick, args=(due, stop, interval), name="melodie-progress", daemon=True
+        ).start()
+    try:
+        for item in iterable:
+            count += 1
+            if due[0]:
+                due[0] = interval <= 0
+                sink.update(count - reported, count)
+                reported = count
+            yield item
+    finally:
+        stop.set()
+        if count > reported:
+            sink.update(count - reported, count)
+        sink.close(count)
@@ -0,0 +1,177 @@
+"""
+Shared-memory transport of large buffers for ``parallel.process_map``.
+
+Elements (and star arguments) which are large ``numpy.ndarray``, ``bytes``,
+``bytearray``, ``memoryview`` or ``array.array`` objects are copied once into
+a ``multiprocessing.shared_memory`` segment, and only a small
+``SharedPayload`` handle is pickled to the worker. Workers see numpy arrays
+and memoryviews as zero-copy views of the segment, while other types are
+rebuilt from it. Large results come back the same way, and are copied out of
+their segments by the parent.
+
+The process creating a segment is not the one unlinking it: input segments
+are unlinked by the parent once their chunk is done, and result segments as
+soon as the parent copies them out.
+"""
+import array
+
+from multiprocessing import shared_memory
+from typing import Any, List, Optional, Tuple
+
+from .functional import _is_ndarray
+
+# Minimum size in bytes of the buffers sent through shared memory. Smaller
+# buffers are cheaper to pickle than to set up a segment for.
+SHM_THRESHOLD = 256 * 2**10
+
+_BUFFER_TYPES = (bytes, bytearray, memoryview, array.array)
+
+
+class SharedPayload:
+    """
+    A picklable handle of a buffer stored in a shared memory segment.
+    """
+
+    __slots__ = ("name", "kind", "nbytes", "dtype", "shape", "typecode")
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        nbytes: int,
+        dtype: Any = None,
+        shape: Optional[Tuple[int, ...]] = None,
+        typecode: Optional[str] = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.nbytes = nbytes
+        self.dtype = dtype
+        self.shape = shape
+        self.typecode = typecode
+
+    def __getstate__(self):
+        return (self.name, self.kind, self.nbytes, self.dtype, self.shape, self.typecode)
+
+    def __setstate__(self, state):
+        self.name, self.kind, self.nbytes, self.dtype, self.shape, self.typecode = state
+
+
+def share(
+    obj: Any, threshold: int, segments: List[shared_memory.SharedMemory]
+) -> Any:
+    """
+    Copy ``obj`` into a new segment if it is a buffer of at least
+    ``threshold`` bytes, returning its handle and appending the segment to
+    ``segments``. Other objects are returned as they are.
+    """
+    if _is_ndarray(obj):
+        if obj.nbytes < threshold or obj.dtype.hasobject:
+            return obj
+        import numpy
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, obj.nbytes))
+        segments.append(shm)
+        numpy.ndarray(obj.shape, obj.dtype, buffer=shm.buf)[...] = obj
+        return SharedPayload(shm.name, "ndarray", obj.nbytes, obj.dtype.str, obj.shape)
+    if not isinstance(obj, _BUFFER_TYPES):
+        return obj
+    view = memoryview(obj)
+    if view.nbytes < threshold:
+        return obj
+    shm = shared_memory.SharedMemory(create=True, size=max(1, view.nbytes))
+    segments.append(shm)
+    shm.buf[: view.nbytes] = view.cast("B") if view.contiguous else view.tobytes()
+    if isinstance(obj, array.array):
+        return SharedPayload(shm.name, "array", view.nbytes, typecode=obj.typecode)
+    return SharedPayload(shm.name, type(obj).__name__, view.nbytes)
+
+
+def restore(
+    obj: Any, attached: List[shared_memory.SharedMemory], copy: bool
+) -> Any:
+    """
+    Rebuild the object of a ``SharedPayload`` handle, attaching its segment
+    and appending it to ``attached``. Other objects are returned as they are.
+
+    Numpy arrays and memoryviews are views of the segment unless ``copy``.
+    """
+    if not isinstance(obj, SharedPayload):
+        return obj
+    shm = shared_memory.SharedMemory(name=obj.name)
+    attached.append(shm)
+    buf = shm.buf[: obj.nbytes]
+    if obj.kind == "ndarray":
+        import numpy
+
+        arr = numpy.ndarray(obj.shape, numpy.dtype(obj.dtype), buffer=buf)
+        return arr.copy() if copy else arr
+    if obj.kind == "memoryview":
+        return memoryview(bytes(buf)) if copy else buf
+    if obj.kind == "array":
+        arr = array.array(obj.typecode)
+        arr.frombytes(buf)
+        return arr
+    if obj.kind == "bytearray":
+        return bytearray(buf)
+    return bytes(buf)
+
+
+def share_args(
+    item: Any, star: bool, threshold: int, segments: List[shared_memory.SharedMemory]
+) -> Any:
+    if star:
+        return tuple(share(arg, threshold, segments) for arg in item)
+    return share(item, threshold, segments)
+
+
+def restore_args(
+    item: Any, star: bool, attached: List[shared_memory.SharedMemory]
+) -> Any:
+    if star:
+        return tuple(restore(arg, attached, False) for arg in item)
+    return restore(item, attached, False)
+
+
+def close_segments(segments: List[shared_memory.SharedMemory], unlink: bool):
+    """
+    Close (and unlink if ``unlink``) the segments. A segment still exported
+    by a view is left open, and its memory is released with the view.
+    """
+    for shm in segments:
+        if unlink:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        try:
+            shm.close()
+        except BufferError:
+            pass
+    segments.clear()
+
+
+def release_results(results: List[Any]) -> List[Any]:
+    """
+    Copy the results of a chunk out of their segments, and unlink them.
+    """
+    if not any(isinstance(result, SharedPayload) for result in results):
+        return results
+    attached: List[shared_memory.SharedMemory] = []
+    try:
+        return [restore(result, attached, True) for result in results]
+    finally:
+        close_segments(attached, unlink=True)
+
+
+def discard_results(results: List[Any]):
+    """
+    Unlink the segments of results which will not be used.
+    """
+    for result in results:
+        if isinstance(result, SharedPayload):
+            try:
+                shm = shared_memory.SharedMemory(name=result.name)
+            except FileNotFoundError:
+                continue
+            close_segments([shm], unlink=True)
@@ -0,0 +1,137 @@
+"""
+Probabilistic sketches for approximate distinct operations in constant memory.
+
+Elements are hashed by ``stable_hash64``, which does not depend on the
+process (unlike ``hash()`` of strings), so sketches built in different
+processes could be merged.
+"""
+import hashlib
+import math
+import pickle
+
+from typing import Any
+
+_MASK64 = (1 << 64) - 1
+
+
+def stable_hash64(item: Any) -> int:
+    """
+    A 64-bit hash of ``item`` that is the same across processes.
+
+    Integers are mixed by the splitmix64 finalizer, strings and bytes are
+    hashed by BLAKE2b, and other objects by BLAKE2b of their pickled bytes.
+    """
+    t = type(item)
+    if t is int and -(1 << 63) <= item < (1 << 64):
+        z = (item + 0x9E3779B97F4A7C15) & _MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return z ^ (z >> 31)
+    if t is str:
+        data = item.encode("utf-8", "surrogatepass")
+    elif t is bytes:
+        data = item
+    else:
+        data = pickle.dumps(item, 4)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class BloomFilter:
+    """
+    A set-like sketch answering "possibly seen" or "definitely not seen".
+
+    The bit array is sized for ``capacity`` elements with a false positive
+    rate of ``error_rate``. It uses ``m`` bits and ``k`` hash functions
+    derived from one 64-bit hash by double hashing.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        assert capacity >= 1, "capacity should be at least 1"
+        assert 0 < error_rate < 1, "error_rate should be in (0, 1)"
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.m = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.k = max(1, int(round(self.m / capacity * math.log(2))))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, item: Any):
+        h = stable_hash64(item)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        m = self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def add(self, item: Any) -> bool:
+        """
+        Add ``item``, returning ``True`` if it was possibly added before.
+        """
+        bits = self.bits
+        seen = True
+        for pos in self._positions(item):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not bits[byte] & mask:
+                seen = False
+                bits[byte] |= mask
+        return seen
+
+    def __contains__(self, item: Any) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def merge(self, other: "BloomFilter") -> "BloomFilter":
+        """
+        Merge ``other`` (built with the same parameters) into this filter.
+        """
+        assert (self.m, self.k) == (other.m, other.k), "filters have different sizes"
+        self.bits = bytearray(a | b for a, b in zip(self.bits, other.bits))
+        return self
+
+
+class HyperLogLog:
+    """
+    A sketch estimating the number of distinct elements with about
+    ``1.04 / sqrt(2 ** precision)`` relative standard error, using
+    ``2 ** precision`` bytes.
+    """
+
+    def __init__(self, precision: int = 14):
+        assert 4 <= precision <= 18, "precision should be in [4, 18]"
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    @classmethod
+    def from_error_rate(cls, error_rate: float) -> "HyperLogLog":
+        """
+        Create a sketch with relative standard error at most ``error_rate``.
+        """
+        precision = int(math.ceil(math.log2((1.04 / error_rate) ** 2)))
+        return cls(min(18, max(4, precision)))
+
+    def add(self, item: Any):
+        h = stable_hash64(item)
+        bits = 64 - self.p
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        m = self.m
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # Linear counting for small cardinalities.
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """
+        Merge ``other`` (with the same precision) into this sketch.
+        """
+        assert self.p == other.p, "sketches have different precisions"
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
@@ -0,0 +1,301 @@
+"""
+On-disk storage for streams larger than memory.
+"""
+import heapq
+import itertools
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import sys
+import tempfile
+import weakref
+
+from typing import Any, Callable, Generator, Iterable, Iterator, List, Optional, Union
+
+from .functional import _FrozenSequence
+
+DEFAULT_MEMORY_LIMIT = 256 * 2**20
+# Buffer size of the files written while spilling.
+WRITE_BUFFER_SIZE = 2**20
+
+_OFFSET = struct.Struct("=q")
+# Size of the pointer to an element in a list.
+_SLOT_SIZE = struct.calcsize("P")
+
+# Number of elements pickled together in the run files of ``external_sort``.
+RUN_BATCH = 1024
+# Number of elements measured to estimate their average size.
+SIZE_SAMPLE = 64
+# Maximum number of run files merged at once.
+MAX_FAN_IN = 128
+
+_NO_MORE = object()
+
+
+def _close_mmaps(resources: List[Any]):
+    # Release the memoryviews before closing the mmaps they export from.
+    for resource in resources:
+        if isinstance(resource, memoryview):
+            resource.release()
+    for resource in resources:
+        if isinstance(resource, mmap.mmap):
+            resource.close()
+    resources.clear()
+
+
+class SpilledSequence(_FrozenSequence):
+    """
+    A read-only sequence whose first elements are kept in memory, and the
+    others are pickled into a data file on disk.
+
+    The data file ``path`` holds the pickled records one after another, and
+    the index file ``path + ".idx"`` holds the int64 offsets (in native byte
+    order) of each record plus the end offset. Both files are memory-mapped,
+    so random access reads one record only.
+
+    The files are not deleted by ``close()``; pass ``remove=True`` to do so.
+    Writing another sequence to the same path replaces the files without
+    changing those still mapped by this one.
+    """
+
+    def __init__(self, memory: List[Any], path: str, spilled: int):
+        self._memory = memory
+        self._path = path
+        self._spilled = spilled
+        self._resources: List[Any] = []
+        self._data: Any = b""
+        self._offsets: Any = (0,)
+        self._inode: Optional[int] = None
+        if spilled > 0:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._inode = os.fstat(f.fileno()).st_ino
+            with open(self.index_path, "rb") as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            offsets = memoryview(index).cast("q")
+            self._resources.extend([data, offsets, index])
+            self._data = data
+            self._offsets = offsets
+        self._finalizer = weakref.finalize(self, _close_mmaps, self._resources)
+
+    @classmethod
+    def write(
+        cls, iterable: Iterable[Any], path: str, memory_limit: int
+    ) -> "SpilledSequence":
+        """
+        Consume ``iterable``, keeping elements in memory until their pickled
+        size exceeds ``memory_limit`` bytes, and spilling the rest to ``path``.
+        """
+        it = iter(iterable)
+        memory: List[Any] = []
+        used = 0
+        for item in it:
+            used += len(pickle.dumps(item, pickle.HIGHEST_PROTOCOL))
+            if used > memory_limit:
+                first_spilled = item
+                break
+            memory.append(item)
+        else:
+            return cls(memory, path, 0)
+
+        spilled = 0
+        offset = 0
+        # Files are written aside and then moved to ``path``, so a sequence
+        # still mapping older files of the same path keeps reading them,
+        # instead of seeing them truncated.
+        directory = os.path.dirname(os.path.abspath(path))
+        data_fd, data_tmp = tempfile.mkstemp(suffix=".tmp", dir=directory)
+        index_fd, index_tmp = tempfile.mkstemp(suffix=".idx.tmp", dir=directory)
+        try:
+            with os.fdopen(data_fd, "wb", buffering=WRITE_BUFFER_SIZE) as data, os.fdopen(
+                index_fd, "wb", buffering=WRITE_BUFFER_SIZE
+            ) as index:
+                dumps, pack = pickle.dumps, _OFFSET.pack
+                for item in itertools.chain((first_spilled,), it):
+                    record = dumps(item, pickle.HIGHEST_PROTOCOL)
+                    index.write(pack(offset))
+                    data.write(record)
+                    offset += len(record)
+                    spilled += 1
+                index.write(pack(offset))
+            os.replace(data_tmp, path)
+            os.replace(index_tmp, path + ".idx")
+        except BaseException:
+            for tmp in (data_tmp, index_tmp):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            raise
+        return cls(memory, path, spilled)
+
+    @property
+    def index_path(self) -> str:
+        return self._path + ".idx"
+
+    @property
+    def spilled(self) -> int:
+        """
+        Number of elements stored on disk.
+        """
+        return self._spilled
+
+    def __len__(self):
+        return len(self._memory) + self._spilled
+
+    def _load(self, i: int) -> Any:
+        offsets = self._offsets
+        return pickle.loads(self._data[offsets[i] : offsets[i + 1]])
+
+    def __getitem__(self, index: int) -> Any:
+        n_memory = len(self._memory)
+        if index < 0:
+            index += len(self)
+            if index < 0:
+                raise IndexError("index out of range")
+        if index < n_memory:
+            return self._memory[index]
+        if not 0 <= index - n_memory < self._spilled:
+            raise IndexError("index out of range")
+        return self._load(index - n_memory)
+
+    def __iter__(self) -> Iterator[Any]:
+        yield from self._memory
+        load = self._load
+        for i in range(self._spilled):
+            yield load(i)
+
+    def close(self, remove: bool = False):
+        """
+        Close the memory-mapped files, and remove them if ``remove``, unless
+        they were replaced by a newer sequence written to the same path.
+        """
+        self._finalizer()
+        if remove and self._spilled > 0:
+            try:
+                replaced = os.stat(self._path).st_ino != self._inode
+            except FileNotFoundError:
+                return
+            if not replaced:
+                os.remove(self._path)
+                os.remove(self.index_path)
+
+
+def spill_freeze(
+    iterable: Iterable[Any], path: str, memory_limit: Optional[int] = None
+) -> Union[List[Any], SpilledSequence]:
+    """
+    Build a ``SpilledSequence`` from ``iterable``, see ``SpilledSequence.write``.
+    If all elements fit in ``memory_limit``, the list of them is returned, and
+    no file is created.
+    """
+    seq = SpilledSequence.write(
+        iterable, path, DEFAULT_MEMORY_LIMIT if memory_limit is None else memory_limit
+    )
+    return seq._memory if seq.spilled == 0 else seq
+
+
+def _item_size(item: Any) -> int:
+    # The elements of tuples, lists and dicts are counted, but not deeper.
+    size = sys.getsizeof(item)
+    if isinstance(item, (tuple, list)):
+        size += sum(map(sys.getsizeof, item))
+    elif isinstance(item, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in item.items())
+    return size
+
+
+def _estimate_run_length(
+    sample: List[Any], memory_limit: int, key: Optional[Callable[[Any], Any]] = None
+) -> int:
+    """
+    Estimate how many elements fit in ``memory_limit`` bytes from their size
+    in memory (by ``sys.getsizeof``), with their slot in the run list, and
+    their sort key and its slot if there is a ``key``.
+    """
+    size = sum(_item_size(item) + _SLOT_SIZE for item in sample)
+    if key is not None:
+        size += sum(_item_size(key(item)) + _SLOT_SIZE for item in sample)
+    per_item = max(1, size // max(1, len(sample)))
+    return max(1, memory_limit // per_item)
+
+
+def _write_run(items: Iterable[Any], directory: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    it = iter(items)
+    with os.fdopen(fd, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+        while True:
+            batch = list(itertools.islice(it, RUN_BATCH))
+            if not batch:
+                break
+            pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path: str) -> Generator[Any, None, None]:
+    with open(path, "rb", buffering=WRITE_BUFFER_SIZE) as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+def _merge_runs(
+    paths: List[str], key: Optional[Callable[[Any], Any]], reverse: bool
+) -> Iterator[Any]:
+    return heapq.merge(*[_read_run(path) for path in paths], key=key, reverse=reverse)
+
+
+def external_sort(
+    iterable: Iterable[Any],
+    key: Optional[Callable[[Any], Any]] = None,
+    reverse: bool = False,
+    memory_limit: Optional[int] = None,
+    tmp_dir: Optional[str] = None,
+) -> Generator[Any, None, None]:
+    """
+    Sort ``iterable`` stably, like ``sorted``, with an external merge sort.
+
+    Elements are sorted in runs fitting ``memory_limit`` bytes (256 MiB by
+    default, estimated from the sizes of the first elements in memory).
+    Runs are written to temporary files under ``tmp_dir``, then merged
+    lazily by ``heapq.merge``, at most ``MAX_FAN_IN`` files at once. If the
+    input fits in one run, no file is written. Temporary files are removed
+    when the generator finishes or is closed.
+    """
+    memory_limit = DEFAULT_MEMORY_LIMIT if memory_limit is None else memory_limit
+    it = iter(iterable)
+    sample = list(itertools.islice(it, SIZE_SAMPLE))
+    run_length = _estimate_run_length(sample, memory_limit, key)
+    it = itertools.chain(sample, it)
+
+    run = list(itertools.islice(it, run_length))
+    run.sort(key=key, reverse=reverse)
+    following = next(it, _NO_MORE)
+    if following is _NO_MORE:
+        yield from run
+        return
+    it = itertools.chain((following,), it)
+
+    directory = tempfile.mkdtemp(prefix="melodie-sort-", dir=tmp_dir)
+    try:
+        runs = []
+        while run:
+            runs.append(_write_run(run, directory))
+            run = list(itertools.islice(it, run_length))
+            run.sort(key=key, reverse=reverse)
+
+        # Merge the runs in order, keeping the sort stable.
+        while len(runs) > MAX_FAN_IN:
+            merged = []
+            for i in range(0, len(runs), MAX_FAN_IN):
+                group = runs[i : i + MAX_FAN_IN]
+                merged.append(_write_run(_merge_runs(group, key, reverse), directory))
+                for path in group:
+                    os.remove(path)
+            runs = merged
+        yield from _merge_runs(runs, key, reverse)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
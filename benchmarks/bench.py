@@ -0,0 +1,401 @@
+"""
+Benchmarks of MelodieFuncFlow operations against plain python baselines.
+
+Each case runs the same computation with ``MelodieGenerator`` and with a
+comprehension or ``itertools``, and reports the median time of ``repeat``
+samples (alternating the two, each sample looping long enough to be
+measured reliably), the ratio of the two, the overhead per element and the
+peak memory measured by ``tracemalloc``.
+
+The ratios are compared with the stored baseline, so the comparison does
+not depend much on the speed of the machine::
+
+    python benchmarks/bench.py                          # run and print
+    python benchmarks/bench.py --save benchmarks/baseline.json
+    python benchmarks/bench.py --compare benchmarks/baseline.json
+
+``--compare`` exits with status 1 if any ratio grows by more than
+``--tolerance`` (20% by default, or the tolerance of the case) over the
+baseline, also after re-running it ``CONFIRM_RUNS`` times to rule out noise.
+Cases dominated by starting a pool are reported but not gated.
+"""
+import argparse
+import collections
+import functools
+import gc
+import heapq
+import itertools
+import json
+import operator
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MelodieFuncFlow import MelodieGenerator, compose  # noqa: E402
+
+DEFAULT_SIZES = (1000, 100000)
+DEFAULT_REPEAT = 9
+DEFAULT_TOLERANCE = 0.2
+# Minimum duration of one timing sample.
+MIN_SAMPLE_SECONDS = 0.005
+# Number of re-runs of a case over its tolerance before reporting it.
+CONFIRM_RUNS = 2
+
+
+def inc(x):
+    return x + 1
+
+
+def double(x):
+    return x * 2
+
+
+def is_even(x):
+    return x % 2 == 0
+
+
+def mod_100(x):
+    return x % 100
+
+
+def busy(x):
+    # A cpu-bound function for the parallel cases.
+    s = 0
+    for i in range(200):
+        s += (x * i) % 7
+    return s
+
+
+def _distinct_baseline(data: List[int], key: Callable[[int], Any]) -> List[int]:
+    seen = set()
+    out = []
+    for x in data:
+        k = key(x)
+        if k not in seen:
+            seen.add(k)
+            out.append(x)
+    return out
+
+
+class Case(NamedTuple):
+    name: str
+    melodie: Callable[[List[int]], Any]
+    baseline: Callable[[List[int]], Any]
+    # Upper bound of the input size, for slow cases.
+    max_size: Optional[int] = None
+    # Allowed growth of the ratio, ``--tolerance`` if ``None``.
+    tolerance: Optional[float] = None
+    # Whether a regression fails ``--compare``. Cases whose time is mostly
+    # starting a pool are too noisy for that.
+    gated: bool = True
+
+
+CASES = [
+    Case(
+        "map",
+        lambda data: MelodieGenerator(data).map(inc).l,
+        lambda data: [inc(x) for x in data],
+    ),
+    Case(
+        "filter",
+        lambda data: MelodieGenerator(data).filter(is_even).l,
+        lambda data: [x for x in data if is_even(x)],
+    ),
+    Case(
+        "indexed_map",
+        lambda data: MelodieGenerator(data).indexed_map(operator.add).l,
+        lambda data: [i + x for i, x in enumerate(data)],
+    ),
+    Case(
+        "star_map",
+        lambda data: MelodieGenerator(zip(data, data)).star_map(operator.mul).l,
+        lambda data: list(itertools.starmap(operator.mul, zip(data, data))),
+    ),
+    Case(
+        "chain_5_stages",
+        lambda data: MelodieGenerator(data)
+        .map(inc)
+        .filter(is_even)
+        .map(double)
+        .indexed_map(operator.add)
+        .filter(is_even)
+        .l,
+        lambda data: [
+            v
+            for v in (
+                i + y
+                for i, y in enumerate(double(x) for x in (inc(x) for x in data) if is_even(x))
+            )
+            if is_even(v)
+        ],
+    ),
+    Case(
+        "slice",
+        lambda data: MelodieGenerator(iter(data)).slice(len(data) // 4, len(data) // 2).l,
+        lambda data: list(itertools.islice(iter(data), len(data) // 4, len(data) // 2)),
+        tolerance=0.3,
+    ),
+    Case(
+        "frozen_slice",
+        lambda data: MelodieGenerator(data).freeze()[len(data) // 4 : len(data) // 2].l,
+        lambda data: list(data)[len(data) // 4 : len(data) // 2],
+        tolerance=0.3,
+    ),
+    Case(
+        "freeze",
+        lambda data: MelodieGenerator(data).map(inc).freeze(),
+        lambda data: list(map(inc, data)),
+    ),
+    Case(
+        "sort",
+        lambda data: MelodieGenerator(data).freeze().sort(mod_100).l,
+        lambda data: sorted(data, key=mod_100),
+    ),
+    Case(
+        "compose",
+        lambda data: MelodieGenerator(data).map(compose(inc, double, inc)).l,
+        lambda data: [inc(double(inc(x))) for x in data],
+    ),
+    Case(
+        "reduce",
+        lambda data: MelodieGenerator(data).reduce(operator.add, 0),
+        lambda data: functools.reduce(operator.add, data, 0),
+    ),
+    Case(
+        "count_by",
+        lambda data: dict(MelodieGenerator(data).count_by(mod_100)),
+        lambda data: dict(collections.Counter(map(mod_100, data))),
+    ),
+    Case(
+        "top_k",
+        lambda data: MelodieGenerator(data).top_k(10, mod_100).l,
+        lambda data: heapq.nlargest(10, data, key=mod_100),
+    ),
+    Case(
+        "distinct",
+        lambda data: MelodieGenerator(data).distinct(mod_100).l,
+        lambda data: _distinct_baseline(data, mod_100),
+    ),
+    Case(
+        "parallel_map",
+        lambda data: MelodieGenerator(data).parallel_map(busy, backend="process").l,
+        lambda data: [busy(x) for x in data],
+        max_size=20000,
+        gated=False,
+    ),
+    Case(
+        "parallel_reduce",
+        lambda data: MelodieGenerator(data).parallel_reduce(operator.add, workers=2),
+        lambda data: functools.reduce(operator.add, data),
+        gated=False,
+    ),
+    Case(
+        "thread_map",
+        lambda data: MelodieGenerator(data).thread_map(inc).l,
+        lambda data: [inc(x) for x in data],
+        max_size=20000,
+        gated=False,
+    ),
+]
+
+
+def _sample(func: Callable[[List[int]], Any], data: List[int], number: int) -> float:
+    # Like ``timeit``, the garbage collector is paused while timing.
+    gc.collect()
+    gc.disable()
+    try:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func(data)
+        return (time.perf_counter() - t0) / number
+    finally:
+        gc.enable()
+
+
+def _number_of_loops(func: Callable[[List[int]], Any], data: List[int]) -> int:
+    # Like ``timeit.Timer.autorange``, loop until a sample is long enough.
+    number = 1
+    while _sample(func, data, number) * number < MIN_SAMPLE_SECONDS:
+        number *= 2
+    return number
+
+
+def _median_times(
+    case: Case, data: List[int], repeat: int
+) -> Tuple[float, float]:
+    """
+    The median times of ``repeat`` samples of the two sides of ``case``,
+    alternating them so both see the same state of the machine.
+    """
+    numbers = (_number_of_loops(case.melodie, data), _number_of_loops(case.baseline, data))
+    samples: Tuple[List[float], List[float]] = ([], [])
+    for _ in range(repeat):
+        samples[0].append(_sample(case.melodie, data, numbers[0]))
+        samples[1].append(_sample(case.baseline, data, numbers[1]))
+    return statistics.median(samples[0]), statistics.median(samples[1])
+
+
+def _peak_memory(func: Callable[[List[int]], Any], data: List[int]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(data)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(case: Case, n: int, repeat: int) -> Dict[str, Any]:
+    data = list(range(n))
+    result, expected = case.melodie(data), case.baseline(data)
+    if isinstance(result, MelodieGenerator):
+        result = list(result)
+    assert result == expected, f"{case.name}: results differ from the baseline"
+    t_melodie, t_baseline = _median_times(case, data, repeat)
+    return {
+        "case": case.name,
+        "n": n,
+        "melodie_s": t_melodie,
+        "baseline_s": t_baseline,
+        "ratio": t_melodie / t_baseline if t_baseline > 0 else float("inf"),
+        "overhead_ns": (t_melodie - t_baseline) / n * 1e9,
+        "melodie_peak": _peak_memory(case.melodie, data),
+        "baseline_peak": _peak_memory(case.baseline, data),
+    }
+
+
+def run_suite(
+    sizes: Sequence[int] = DEFAULT_SIZES,
+    repeat: int = DEFAULT_REPEAT,
+    pattern: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Run the cases whose names contain ``pattern`` on each input size.
+    """
+    results = []
+    for case in CASES:
+        if pattern is not None and pattern not in case.name:
+            continue
+        for n in sizes:
+            if case.max_size is not None and n > case.max_size:
+                continue
+            results.append(run_case(case, n, repeat))
+    return results
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    header = ("case", "n", "melodie ms", "baseline ms", "ratio", "ns/elem", "peak KiB")
+    rows = [
+        (
+            r["case"],
+            str(r["n"]),
+            f"{r['melodie_s'] * 1e3:.3f}",
+            f"{r['baseline_s'] * 1e3:.3f}",
+            f"{r['ratio']:.2f}",
+            f"{r['overhead_ns']:+.1f}",
+            f"{r['melodie_peak'] / 1024:.0f} / {r['baseline_peak'] / 1024:.0f}",
+        )
+        for r in results
+    ]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.rjust(width) if i else cell.ljust(width) for i, (cell, width) in enumerate(zip(row, widths)))
+        for row in [header] + rows
+    )
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """
+    Get a message for each gated case whose ratio grew by more than its
+    tolerance (``tolerance`` by default) over the ratio stored in ``baseline``.
+    """
+    stored = {(r["case"], r["n"]): r["ratio"] for r in baseline["results"]}
+    cases = {case.name: case for case in CASES}
+    regressions = []
+    for r in results:
+        case = cases.get(r["case"])
+        if case is not None and not case.gated:
+            continue
+        limit = tolerance if case is None or case.tolerance is None else case.tolerance
+        old = stored.get((r["case"], r["n"]))
+        if old is not None and r["ratio"] > old * (1 + limit):
+            regressions.append(
+                f"{r['case']} (n={r['n']}): ratio {r['ratio']:.2f}, baseline {old:.2f}"
+            )
+    return regressions
+
+
+def confirm(
+    results: List[Dict[str, Any]],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    repeat: int,
+    runs: int = CONFIRM_RUNS,
+) -> List[str]:
+    """
+    Like ``compare``, but re-run the cases over their tolerance up to
+    ``runs`` times, keeping their lowest ratio, so only regressions
+    reproduced by every run are reported.
+    """
+    cases = {case.name: case for case in CASES}
+    results = list(results)
+    for _ in range(runs):
+        flagged = {
+            (r["case"], r["n"])
+            for r in results
+            if compare([r], baseline, tolerance)
+        }
+        if not flagged:
+            break
+        for i, r in enumerate(results):
+            if (r["case"], r["n"]) in flagged:
+                rerun = run_case(cases[r["case"]], r["n"], repeat)
+                if rerun["ratio"] < r["ratio"]:
+                    results[i] = rerun
+    return compare(results, baseline, tolerance)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("-k", "--pattern", help="only run cases containing this")
+    parser.add_argument("--save", metavar="PATH", help="store the results as the baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare with a stored baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.repeat, args.pattern)
+    print(format_results(results))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                f,
+                indent=1,
+            )
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = confirm(results, json.load(f), args.tolerance, args.repeat)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
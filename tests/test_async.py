@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from MelodieFuncFlow import (
+    MelodieAsyncGenerator,
+    MelodieGenerator,
+    melodie_async_generator,
+)
+
+
+async def _double_later(x):
+    await asyncio.sleep(0.05)
+    return x * 2
+
+
+async def _is_odd(x):
+    return x % 2 == 1
+
+
+def test_async_operations():
+    async def main():
+        g = MelodieAsyncGenerator(range(10))
+        assert await g.filter(_is_odd).map(lambda x: x + 1).to_list() == [2, 4, 6, 8, 10]
+
+        assert await MelodieAsyncGenerator([1, 2, 3]).reduce(lambda a, b: a + b) == 6
+        assert await MelodieAsyncGenerator([1, 2, 3]).fold_left(
+            lambda acc, b: acc + [b], []
+        ) == [1, 2, 3]
+        assert await MelodieAsyncGenerator(range(5)).slice(1, 3).to_list() == [1, 2]
+        assert await MelodieAsyncGenerator(range(5)).slice(2, -1).to_list() == [2, 3, 4]
+        assert await MelodieAsyncGenerator([3, 4]).indexed_map(lambda i, x: i * x).to_list() == [0, 4]
+        assert await MelodieAsyncGenerator([(1, 2), (2, 2)]).star_filter(
+            lambda a, b: a == b
+        ).to_list() == [(2, 2)]
+
+        l = []
+        await MelodieAsyncGenerator([1, 2]).indexed_extra_job(
+            lambda i, x: l.append(i)
+        ).exhaust()
+        assert l == [0, 1]
+
+        frozen = await MelodieAsyncGenerator([1, 2, 3]).freeze()
+        assert frozen.l == [1, 2, 3]
+        assert await MelodieAsyncGenerator([1, 1]).to_set() == {1}
+
+    asyncio.run(main())
+
+
+def test_async_concurrent_map():
+    async def main():
+        t0 = time.time()
+        ret = await MelodieAsyncGenerator(range(20)).map(
+            _double_later, concurrency=20
+        ).to_list()
+        assert ret == [i * 2 for i in range(20)]
+        assert time.time() - t0 < 0.5
+
+        async def sleep_for(t):
+            await asyncio.sleep(t)
+            return t
+
+        ret = await MelodieAsyncGenerator([0.2, 0.1, 0.0]).map(
+            sleep_for, concurrency=3, ordered=False
+        ).to_list()
+        assert ret == [0.0, 0.1, 0.2]
+
+    asyncio.run(main())
+
+
+def test_async_conversions():
+    @melodie_async_generator
+    async def produce(n):
+        for i in range(n):
+            await asyncio.sleep(0)
+            yield i
+
+    assert produce(3).to_sync().l == [0, 1, 2]
+
+    async def main():
+        assert await MelodieGenerator([1, 2]).to_async().map(_double_later).to_list() == [2, 4]
+        assert await produce(3).head() == 0
+
+    asyncio.run(main())
@@ -0,0 +1,31 @@
+from benchmarks.bench import compare, confirm, format_results, run_suite
+
+
+def test_benchmark_suite_runs():
+    results = run_suite(sizes=[200], repeat=1)
+    assert {r["case"] for r in results} >= {"map", "chain_5_stages", "sort", "parallel_map"}
+    assert "chain_5_stages" in format_results(results)
+
+    assert compare(results, {"results": results}, 0.2) == []
+    slower = [dict(r, ratio=r["ratio"] * 2) for r in results]
+    regressions = compare(slower, {"results": results}, 0.2)
+    # cases dominated by starting a pool are not gated.
+    assert len(regressions) == len(results) - 3
+    assert not any(message.startswith("parallel_map") for message in regressions)
+
+    # a case could allow more than the default tolerance.
+    a_bit_slower = [dict(r, ratio=r["ratio"] * 1.25) for r in results]
+    assert "slice" not in {m.split()[0] for m in compare(a_bit_slower, {"results": results}, 0.2)}
+
+
+def test_benchmark_confirm_reruns():
+    results = run_suite(sizes=[200], repeat=1, pattern="filter")
+    # a noisy run is not reported once a re-run is within the tolerance.
+    noisy = [dict(r, ratio=r["ratio"] * 3) for r in results]
+    baseline = {"results": [dict(r, ratio=r["ratio"] * 2) for r in results]}
+    assert compare(noisy, baseline, 0.2) != []
+    assert confirm(noisy, baseline, 0.2, repeat=1) == []
+
+    # a regression reproduced by the re-runs is still reported.
+    baseline = {"results": [dict(r, ratio=r["ratio"] / 3) for r in results]}
+    assert len(confirm(results, baseline, 0.2, repeat=1)) == len(results)
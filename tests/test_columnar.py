@@ -0,0 +1,102 @@
+import array
+from collections import namedtuple
+from dataclasses import dataclass
+
+import pytest
+
+from MelodieFuncFlow import MelodieFrozenTable, MelodieGenerator
+
+
+@dataclass
+class Agent:
+    id: int
+    wealth: float
+    name: str
+
+
+def make_agents():
+    return [Agent(i, float(10 - i), f"agent-{i}") for i in range(5)]
+
+
+@pytest.mark.parametrize("backend", ["array", "numpy"])
+def test_table_from_records(backend):
+    if backend == "numpy":
+        pytest.importorskip("numpy")
+    t = MelodieGenerator(make_agents()).freeze(columnar=True, backend=backend)
+    assert isinstance(t, MelodieFrozenTable)
+    assert t.fields == ["id", "wealth", "name"]
+    assert len(t) == 5
+    assert t[1].name == "agent-1"
+    assert t[-1].id == 4
+    assert [row.id for row in t] == [0, 1, 2, 3, 4]
+    assert t.attributes("wealth").l == [10.0, 9.0, 8.0, 7.0, 6.0]
+    if backend == "array":
+        assert isinstance(t.column("id"), array.array)
+        assert t.column("id").typecode == "q"
+    else:
+        assert t.column("id").dtype.kind == "i"
+    assert isinstance(t.column("name"), list)
+    assert list(t.to_columns()) == t.fields
+    assert t.to_columns()["name"] is t.column("name")
+
+    assert t.sort("wealth").attributes("id").l == [4, 3, 2, 1, 0]
+    assert t.sort("id", reverse=True, cache=True).head().id == 4
+    assert t.top_k(2, "id").attributes("id").l == [4, 3]
+    assert t.sort(lambda row: row.name, reverse=True).head().id == 4
+    assert t.filter(lambda row: row.id % 2 == 0).attributes("name").l == [
+        "agent-0",
+        "agent-2",
+        "agent-4",
+    ]
+    assert t.where([True, False, False, False, True]).attributes("id").l == [0, 4]
+    assert t[1:3].attributes("id").l == [1, 2]
+    assert t.top_k(2, "wealth").attributes("id").l == [0, 1]
+    assert t.bottom_k(1, lambda row: row.wealth).head().id == 4
+    assert t.map(lambda row: row.id * 2).l == [0, 2, 4, 6, 8]
+
+
+def test_table_from_scalars():
+    t = MelodieFrozenTable.from_iterable([3, 1, 2], backend="array")
+    assert t.l == [3, 1, 2]
+    assert t.sort("value").l == [1, 2, 3]
+    # to_dict means the same as for other generators.
+    pairs = MelodieFrozenTable.from_iterable([{"k": "a", "v": 1}, {"k": "b", "v": 2}])
+    assert pairs.to_dict() == {"a": 1, "b": 2}
+    assert t[0] == 3
+
+    # values of other types fall back to lists, so they are not coerced
+    for values in ([1, 2.5], [2.5, 1], [1, True], [True, 1], [2 ** 53 + 1, 0.5], [1.5, 2 ** 70]):
+        column = MelodieFrozenTable.from_iterable(values, backend="array").column()
+        assert isinstance(column, list)
+        assert [(type(v), v) for v in column] == [(type(v), v) for v in values]
+    assert MelodieFrozenTable.from_iterable([0.5, 2.5], backend="array").column().typecode == "d"
+    rows = [{"n": 1, "x": 0.5}, {"n": True, "x": 2}]
+    t = MelodieGenerator(rows).freeze(columnar=True)
+    assert [type(v) for v in t.attributes("n")] == [int, bool]
+    assert [type(v) for v in t.attributes("x")] == [float, int]
+    assert MelodieFrozenTable.from_iterable([1, "a"], backend="array").column() == [1, "a"]
+    assert MelodieFrozenTable.from_iterable([1, 2 ** 70], backend="array").column() == [1, 2 ** 70]
+
+
+def test_table_numpy_mask():
+    np = pytest.importorskip("numpy")
+    Point = namedtuple("Point", ["x", "y"])
+    t = MelodieGenerator(Point(i, i * i) for i in range(10)).freeze(columnar=True)
+    assert isinstance(t.column("x"), np.ndarray)
+    assert type(t[3].y) is int
+    assert t.where(t.column("y") > 50).attributes("x").l == [8, 9]
+
+
+def test_table_from_dicts():
+    t = MelodieFrozenTable.from_iterable([{"a": 1, "b": True}, {"a": 2, "b": False}])
+    assert t.fields == ["a", "b"]
+    assert [row.b for row in t] == [True, False]
+    assert len(MelodieFrozenTable.from_iterable([])) == 0
+
+
+def test_table_column_values_are_python_objects():
+    pytest.importorskip("numpy")
+    t = MelodieFrozenTable.from_iterable([{"id": 1}, {"id": 2}])
+    ids = t.attributes("id")
+    assert ids.column() is t.column("id")
+    assert [type(v) for v in ids.l] == [int, int]
@@ -0,0 +1,123 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from MelodieFuncFlow import EnginePool, MelodieGenerator
+
+
+class FakeView:
+    """
+    A view running tasks in threads, standing for the views of an
+    ``ipyparallel.Client``, whose ``AsyncResult`` objects are futures too.
+    """
+
+    def __init__(self, executor, namespace):
+        self.executor = executor
+        self.namespace = namespace
+
+    def apply_async(self, func, *args):
+        return self.executor.submit(func, *args)
+
+    def apply_sync(self, func, *args):
+        return func(*args)
+
+    def execute(self, code, block=True):
+        exec(code, self.namespace)
+
+
+class AbortableFuture(Future):
+    aborted = 0
+
+    def abort(self):
+        AbortableFuture.aborted += 1
+        self.cancel()
+
+
+class OnlyFirstView(FakeView):
+    """
+    A view running only the first task, the others staying pending like
+    queued ``AsyncResult`` objects, whose ``cancel()`` succeeds locally.
+    """
+
+    def __init__(self, executor, namespace):
+        super().__init__(executor, namespace)
+        self.started = False
+
+    def apply_async(self, func, *args):
+        future = AbortableFuture()
+        if not self.started:
+            self.started = True
+            future.set_result(func(*args))
+        return future
+
+
+class FakeClient:
+    ids = [0, 1]
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(2)
+        self.namespace = {}
+        self.closed = False
+
+    def load_balanced_view(self):
+        return FakeView(self.executor, self.namespace)
+
+    def __getitem__(self, key):
+        return FakeView(self.executor, self.namespace)
+
+    def close(self):
+        self.closed = True
+        self.executor.shutdown()
+
+
+def test_engine_pool():
+    calls = []
+    client = FakeClient()
+    pool = EnginePool(init_functions=[lambda: calls.append("init")], init_code="x = 1", client=client)
+
+    g = MelodieGenerator(range(100)).parallel_map(lambda x: x * 2, engine_pool=pool)
+    assert g.l == [x * 2 for x in range(100)]
+    # fewer elements than engines.
+    assert MelodieGenerator([3]).parallel_map(lambda x: -x, engine_pool=pool).l == [-3]
+    assert MelodieGenerator([]).parallel_map(lambda x: -x, engine_pool=pool).l == []
+    assert calls == ["init"]
+    assert client.namespace["x"] == 1
+
+    g = MelodieGenerator(zip(range(10), range(10))).parallel_map(
+        lambda a, b: a * b,
+        star=True,
+        ordered=False,
+        chunksize=3,
+        init_code="y = 2",
+        initializer=calls.append,
+        initargs=("again",),
+        engine_pool=pool,
+    )
+    assert sorted(g) == [x * x for x in range(10)]
+    MelodieGenerator([1]).parallel_map(abs, initializer=calls.append, initargs=("again",), engine_pool=pool).exhaust()
+    assert calls == ["init", "again"]
+    assert client.namespace["y"] == 2
+
+    # arguments whose == does not give a bool.
+    class Table:
+        def __eq__(self, other):
+            raise ValueError("ambiguous")
+
+    table = Table()
+    for _ in range(2):
+        MelodieGenerator([1]).parallel_map(abs, initializer=calls.append, initargs=(table,), engine_pool=pool).exhaust()
+    assert calls == ["init", "again", table]
+
+    with pool:
+        pass
+    assert pool.closed and client.closed
+
+
+
+def test_engine_pool_aborts_pending_tasks():
+    client = FakeClient()
+    client.load_balanced_view = lambda: OnlyFirstView(client.executor, client.namespace)
+    pool = EnginePool(client=client)
+    it = pool.map(range(100), abs, chunksize=1, max_in_flight=4)
+    assert next(it) == 0
+    it.close()
+    # the 3 other tasks in flight are aborted on the engines.
+    assert AbortableFuture.aborted == 3
@@ -0,0 +1,45 @@
+import pytest
+
+from MelodieFuncFlow import MelodieGenerator
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_lines(tmp_path, suffix):
+    path = str(tmp_path / ("lines.txt" + suffix))
+    lines = [f"line {i}" for i in range(1000)] + ["", "last"]
+    assert MelodieGenerator(lines).to_lines(path, buffer_size=100) == len(lines)
+    assert MelodieGenerator.from_lines(path, chunk_size=7).l == lines
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_jsonl(tmp_path, suffix):
+    path = str(tmp_path / ("data.jsonl" + suffix))
+    items = [{"id": i, "name": f"名字{i}"} for i in range(100)]
+    assert MelodieGenerator(items).to_jsonl(path, ensure_ascii=False) == 100
+    assert MelodieGenerator.from_jsonl(path, chunk_size=16).l == items
+
+
+def test_csv(tmp_path):
+    path = str(tmp_path / "data.csv")
+    rows = [{"id": str(i), "text": f"a, \"quoted\"\n{i}"} for i in range(3000)]
+    assert MelodieGenerator(rows).to_csv(path) == 3000
+    assert MelodieGenerator.from_csv(path).l == rows
+
+    MelodieGenerator([[1, 2], [3, 4]]).to_csv(path, fields=["a", "b"])
+    assert MelodieGenerator.from_csv(path, header=False).l == [["a", "b"], ["1", "2"], ["3", "4"]]
+
+
+@pytest.mark.parametrize("suffix", ["", ".gz"])
+def test_records(tmp_path, suffix):
+    path = str(tmp_path / ("data.bin" + suffix))
+    records = [(i, i * 0.5) for i in range(1000)]
+    assert MelodieGenerator(records).to_records(path, "<qd", buffer_size=100) == 1000
+    assert MelodieGenerator.from_records(path, "<qd", chunk_size=50).l == records
+
+
+def test_records_incomplete(tmp_path):
+    path = str(tmp_path / "data.bin")
+    with open(path, "wb") as f:
+        f.write(b"\x00" * 12)
+    with pytest.raises(ValueError):
+        MelodieGenerator.from_records(path, "<q").l
@@ -1,5 +1,8 @@
+import collections
 from ast import Tuple
 import time
+
+import pytest
 from typing import Dict
 from MelodieFuncFlow import (
     MelodieGenerator,
@@ -183,6 +186,70 @@ def test_process():
     g.show_progress().extra_job(lambda x: time.sleep(0.1)).to_list()
 
 
+def test_progress_sinks(caplog):
+    import logging
+    from MelodieFuncFlow.progress import MetricsSink
+
+    calls = []
+    assert MelodieGenerator(range(1000)).show_progress(
+        lambda count, total: calls.append((count, total))
+    ).l == list(range(1000))
+    # updates are rate-limited, and the final count is always reported.
+    assert len(calls) < 100
+    assert calls[-1] == (1000, 1000)
+
+    # totals propagate through maps and slices, but not filters.
+    frozen = MelodieGenerator(range(10)).freeze()
+    for g, total in [
+        (frozen.map(lambda x: x), 10),
+        (frozen[2:5], 3),
+        (MelodieGenerator(x for x in range(10)).slice(2, 5), None),
+        (MelodieGenerator(range(10)).map(lambda x: x).slice(2, 50), 8),
+        (frozen.filter(lambda x: x > 3), None),
+    ]:
+        calls.clear()
+        g.show_progress(lambda count, total: calls.append((count, total))).exhaust()
+        assert calls[-1][1] == total
+
+    class Counter:
+        value = 0
+
+        def inc(self, n):
+            self.value += n
+
+    counter = Counter()
+    MelodieGenerator(range(50)).show_progress(MetricsSink(counter)).exhaust()
+    assert counter.value == 50
+
+    with caplog.at_level(logging.INFO, logger="MelodieFuncFlow"):
+        MelodieGenerator(range(5)).show_progress("logging").exhaust()
+    assert "progress: 5" in caplog.text
+
+    # a slow tail after many fast elements is still refreshed.
+    def fast_then_slow():
+        yield from range(300000)
+        for i in range(5):
+            time.sleep(0.05)
+            yield i
+
+    times = []
+    MelodieGenerator(fast_then_slow()).show_progress(
+        lambda count, total: times.append((count, time.monotonic())), interval=0.02
+    ).exhaust()
+    tail = [t for count, t in times if count > 300000]
+    assert len(tail) >= 4
+    assert max(b - a for a, b in zip(tail, tail[1:])) < 0.2
+
+    # the sink is closed when the consumer stops early.
+    calls.clear()
+    g = MelodieGenerator(range(10)).show_progress(
+        lambda count, total: calls.append(count)
+    )
+    assert g.head() == 0
+    g.inner.close()
+    assert calls == [1]
+
+
 def test_conv():
     assert MelodieGenerator([1, 2, 3, 3, 4]).to_set() == {1, 2, 3, 4}
     assert MelodieGenerator([1, 2, 3, 3, 4]).s == {1, 2, 3, 4}
@@ -195,3 +262,391 @@ def test_decorators():
             yield i
 
     assert f().to_list() == [0, 1, 2]
+
+
+def test_fused_plan():
+    def is_even(x):
+        return x % 2 == 0
+
+    g = (
+        MelodieGenerator(range(10))
+        .map(lambda x: x + 1)
+        .filter(is_even)
+        .indexed_map(lambda i, x: (i, x))
+        .star_map(lambda i, x: i * x)
+    )
+    plan = g.explain()
+    assert "4 stages" in plan
+    assert "1: filter(test_fused_plan.<locals>.is_even)" in plan
+    assert g.l == [0, 4, 12, 24, 40]
+
+    # each indexed stage counts the elements reaching itself.
+    assert MelodieGenerator(range(6)).indexed_filter(
+        lambda i, x: i % 2 == 0
+    ).indexed_map(lambda i, x: (i, x)).l == [(0, 0), (1, 2), (2, 4)]
+
+    # plans with builtin equivalents for all stages give the same results.
+    Point = collections.namedtuple("Point", ["x", "y"])
+    points = [Point(1, 2), Point(3, 4), Point(5, 6)]
+    assert MelodieGenerator(points).filter(lambda p: p.x > 1).attributes("y").cast(int).l == [4, 6]
+    assert MelodieGenerator(points).star_map(lambda x, y: x * y).map(str).l == ["2", "12", "30"]
+
+
+def test_chain_on_running_generator():
+    g = MelodieGenerator(range(5)).map(lambda x: x * 10)
+    assert g.head() == 0
+    g2 = g.map(lambda x: x + 1)
+    assert "1 stages" in g2.explain()
+    assert g2.l == [11, 21, 31, 41]
+    assert g.l == []
+
+
+def test_profile(tmp_path):
+    import json
+    import pstats
+
+    g = (
+        MelodieGenerator(range(10))
+        .map(lambda x: x + 1)
+        .filter(lambda x: x % 2 == 0)
+        .indexed_filter(lambda i, x: x > 4)
+        .cast(int)
+        .profile()
+    )
+    assert g.l == [6, 8, 10]
+    report = g.profiler.to_dict()
+    assert report["source"]["out"] == 10
+    assert [(s["in"], s["out"]) for s in report["stages"]] == [
+        (10, 10),
+        (10, 5),
+        (5, 3),
+        (3, 3),
+    ]
+    assert report["stages"][1]["selectivity"] == 0.5
+    assert report["stages"][0]["selectivity"] is None
+    times = [s["cumulative_time"] for s in report["stages"]]
+    assert times == sorted(times)
+    assert "filter(" in g.profiler.table()
+
+    g.profiler.save_chrome_trace(str(tmp_path / "trace.json"))
+    with open(tmp_path / "trace.json") as f:
+        assert len(json.load(f)["traceEvents"]) == 5
+    g.profiler.dump_stats(str(tmp_path / "stats.prof"))
+    assert len(pstats.Stats(str(tmp_path / "stats.prof")).stats) == 5
+
+    # a running generator is profiled as the source only.
+    g = MelodieGenerator(range(3)).map(lambda x: x)
+    g.head()
+    p = g.profile()
+    assert p.l == [1, 2]
+    assert p.profiler.to_dict()["stages"] == []
+
+
+def test_batch():
+    assert MelodieGenerator(range(5)).batch(2).l == [[0, 1], [2, 3], [4]]
+    assert MelodieGenerator(range(5)).batch(2).unbatch().l == [0, 1, 2, 3, 4]
+    assert MelodieGenerator([]).batch(2).l == []
+
+
+def test_map_batches():
+    sizes = []
+
+    def double(chunk):
+        sizes.append(len(chunk))
+        return [x * 2 for x in chunk]
+
+    assert MelodieGenerator(range(5)).map_batches(double, size=2).l == [0, 2, 4, 6, 8]
+    assert sizes == [2, 2, 1]
+
+    np = pytest.importorskip("numpy")
+    ret = MelodieGenerator(range(5)).map_batches(lambda a: a * 2, size=3, format="numpy").l
+    assert ret == [0, 2, 4, 6, 8]
+    assert type(ret[0]) is int
+    ret = MelodieGenerator(range(5)).map_batches(
+        lambda a: np.sqrt(a), format="numpy", dtype=np.float64
+    ).l
+    assert ret[4] == 2.0
+
+
+def test_frozen_random_access():
+    g = MelodieGenerator(range(10)).f
+    assert g[3] == 3
+    assert g[-1] == 9
+
+    view = g[2:8]
+    assert isinstance(view, MelodieFrozenGenerator)
+    assert len(view) == 6
+    assert view.l == [2, 3, 4, 5, 6, 7]
+    assert view.l == [2, 3, 4, 5, 6, 7]
+    assert view[0] == 2
+    assert view[-1] == 7
+
+    assert g[::3].l == [0, 3, 6, 9]
+    assert g[::-1].l == list(range(9, -1, -1))
+    assert g[::-1][::-1].l == list(range(10))
+    assert g[-3:].l == [7, 8, 9]
+    assert g[1:9:2][1:3].l == [3, 5]
+    assert g[::-2][::-1].l == [1, 3, 5, 7, 9]
+    assert g.slice(7, -1).l == [7, 8, 9]
+    assert g.slice(3).map(lambda x: x * 2).l == [0, 2, 4]
+    assert g[2:5].sort(lambda x: -x).l == [4, 3, 2]
+
+    # a stop of -1 means the end for both frozen and plain generators
+    data = [0, 1, 2, 3, 4, 5]
+    assert MelodieFrozenGenerator(data)[2:-1].l == MelodieGenerator(data)[2:-1].l == [2, 3, 4, 5]
+    assert MelodieFrozenGenerator(data)[:-1].l == MelodieGenerator(data)[:-1].l == data
+    assert MelodieFrozenGenerator(data)[1:-2].l == [1, 2, 3]
+
+    # the view does not copy elements
+    items = [object() for _ in range(3)]
+    assert MelodieFrozenGenerator(items)[1:].head() is items[1]
+
+
+def test_slice_does_not_overconsume():
+    it = iter(range(10))
+    assert MelodieGenerator(it).slice(1, 3).l == [1, 2]
+    assert next(it) == 3
+
+
+def test_top_k():
+    data = [5, 1, 9, 3, 7, 2]
+    assert MelodieGenerator(iter(data)).top_k(3).l == [9, 7, 5]
+    assert MelodieGenerator(iter(data)).bottom_k(2, key=lambda x: -x).l == [9, 7]
+
+    g = MelodieFrozenGenerator(data)
+    assert g.top_k(2).l == [9, 7]
+    assert g.bottom_k(2).l == [1, 2]
+
+    def neg(x):
+        return -x
+
+    # uses the cached permutation after sorting
+    g.sort(neg, reverse=True, cache=True)
+    assert g.top_k(2, neg).l == [1, 2]
+    g.sort(neg, cache=True)
+    assert g.bottom_k(2, neg).l == [9, 7]
+    assert g.top_k(2, neg).l == [1, 2]
+
+
+def test_partition():
+    data = [5, 1, 9, 3, 7, 2, 8]
+    g = MelodieFrozenGenerator(data)
+    for k in range(len(data)):
+        ret = g.partition(k).l
+        assert sorted(ret) == sorted(data)
+        assert ret[k] == sorted(data)[k]
+        assert all(x <= ret[k] for x in ret[:k])
+        assert all(x >= ret[k] for x in ret[k + 1 :])
+    assert g.partition(-1).l[-1] == 9
+    assert g.partition(0, key=lambda x: -x).head() == 9
+
+
+def test_sort_cache():
+    calls = []
+
+    def key(x):
+        calls.append(x)
+        return x
+
+    data = [3, 1, 2]
+    g = MelodieFrozenGenerator(data)
+    # not cached by default
+    assert g.sort(key).l == [1, 2, 3]
+    assert g.sort(key).l == [1, 2, 3]
+    assert len(calls) == 6
+    calls.clear()
+    assert g.sort(key, cache=True).l == [1, 2, 3]
+    assert g.sort(key).l == [1, 2, 3]
+    assert len(calls) == 3
+    # only the most recent permutation is kept
+    assert g.sort(key, reverse=True, cache=True).l == [3, 2, 1]
+    assert len(g._sort_cache) == 1
+    g.sort(key)
+    assert len(calls) == 9
+    g.clear_sort_cache()
+    g.sort(key)
+    assert len(calls) == 12
+
+    # a permutation of another length is not used
+    g.sort(key, cache=True)
+    data.append(0)
+    assert g.sort(key).l == [0, 1, 2, 3]
+    data.pop()
+
+    # sorting a view composes the indices
+    assert g[1:].sort(key).l == [1, 2]
+    assert g.sort(key).sort(lambda x: -x).l == [3, 2, 1]
+
+    # without a cache, elements are sorted directly, and by themselves without a key
+    g = MelodieFrozenGenerator([3, 1, 2])
+    assert type(g.sort(None).inner) is list
+    assert g.sort(None).l == [1, 2, 3]
+    assert g.sort(None, reverse=True, cache=True).l == [3, 2, 1]
+    assert g.top_k(2).l == [3, 2]
+
+
+def test_cache():
+    pulled = []
+
+    def produce():
+        for i in range(5):
+            pulled.append(i)
+            yield i
+
+    g = MelodieGenerator(produce()).cache()
+    assert g.head() == 0
+    assert pulled == [0]
+    assert g.slice(2).l == [0, 1]
+    assert pulled == [0, 1]
+    assert g.map(lambda x: x * 10).l == [0, 10, 20, 30, 40]
+    assert g.l == [0, 1, 2, 3, 4]
+    assert g.cached == 5
+
+    it1, it2 = iter(g), iter(g)
+    assert next(it1) == 0 and next(it1) == 1
+    assert next(it2) == 0
+
+
+def test_cache_maxsize():
+    g = MelodieGenerator(range(100)).cache(maxsize=4)
+    assert g.l == list(range(100))
+    try:
+        g.l
+        raise AssertionError("evicted elements could not be replayed")
+    except RuntimeError:
+        pass
+
+
+def test_tee():
+    a, b = MelodieGenerator(range(1000)).map(lambda x: x + 1).tee(2)
+    for x, y in zip(a, b):
+        assert x == y
+    assert a.l == [] and b.l == []
+
+    a, b, c = MelodieGenerator(range(10)).tee(3)
+    assert a.l == list(range(10))
+    assert b.filter(lambda x: x > 7).l == [8, 9]
+    assert c.head() == 0
+
+
+def test_tee_evicts_consumed():
+    a, b = MelodieGenerator(range(10000)).tee(2)
+    buffer = a._source.buffer
+    for x, y in zip(a, b):
+        assert len(buffer.items) <= 64
+
+
+def test_cache_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    g = MelodieGenerator(range(10000)).cache()
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: g.l, range(4)))
+    assert all(r == list(range(10000)) for r in results)
+
+
+def test_group_by():
+    words = ["apple", "bob", "avocado", "banana", "cat"]
+    assert MelodieGenerator(words).group_by(lambda w: w[0]).l == [
+        ("a", ["apple", "avocado"]),
+        ("b", ["bob", "banana"]),
+        ("c", ["cat"]),
+    ]
+    assert MelodieGenerator(sorted(words)).group_by(lambda w: w[0], presorted=True).to_dict() == {
+        "a": ["apple", "avocado"],
+        "b": ["banana", "bob"],
+        "c": ["cat"],
+    }
+
+
+def test_reduce_by_key():
+    data = [("a", 1), ("b", 2), ("a", 3)]
+    assert MelodieGenerator(data).reduce_by_key(
+        lambda p: p[0], lambda acc, p: acc + p[1], 0
+    ).l == [("a", 4), ("b", 2)]
+    assert MelodieGenerator(data).reduce_by_key(
+        lambda p: p[0], lambda p, q: (p[0], p[1] + q[1])
+    ).to_dict() == {"a": ("a", 4), "b": ("b", 2)}
+
+    # each key starts from its own copy of initial
+    ret = MelodieGenerator(data).reduce_by_key(
+        lambda p: p[0], lambda acc, p: acc.append(p[1]) or acc, []
+    ).to_dict()
+    assert ret == {"a": [1, 3], "b": [2]}
+
+    assert MelodieGenerator(sorted(data)).reduce_by_key(
+        lambda p: p[0], lambda acc, p: acc + p[1], 0, presorted=True
+    ).l == [("a", 4), ("b", 2)]
+
+    assert MelodieGenerator("abracadabra").count_by(lambda c: c).to_dict() == {
+        "a": 5,
+        "b": 2,
+        "r": 2,
+        "c": 1,
+        "d": 1,
+    }
+
+
+def test_join():
+    agents = [("a1", "e1"), ("a2", "e2"), ("a3", "e9")]
+    envs = [("e1", 10), ("e2", 20), ("e2", 21), ("e3", 30)]
+
+    def agent_env(a):
+        return a[1]
+
+    def env_id(e):
+        return e[0]
+
+    inner = MelodieGenerator(agents).join(envs, agent_env, env_id).l
+    assert inner == [
+        (("a1", "e1"), ("e1", 10)),
+        (("a2", "e2"), ("e2", 20)),
+        (("a2", "e2"), ("e2", 21)),
+    ]
+    for build in ["left", "right"]:
+        g = MelodieGenerator(agents)
+        ret = g.join(envs, agent_env, env_id, how="outer", build=build).l
+        assert sorted(ret, key=str) == sorted(
+            inner + [(("a3", "e9"), None), (None, ("e3", 30))], key=str
+        )
+        ret = MelodieGenerator(agents).join(envs, agent_env, env_id, how="left", build=build).l
+        assert sorted(ret, key=str) == sorted(inner + [(("a3", "e9"), None)], key=str)
+        ret = MelodieGenerator(agents).join(envs, agent_env, env_id, how="right", build=build).l
+        assert sorted(ret, key=str) == sorted(inner + [(None, ("e3", 30))], key=str)
+
+    # the frozen (left) side is built, and the plain generator is streamed
+    ret = MelodieFrozenGenerator(agents).join(
+        MelodieGenerator(envs), agent_env, env_id
+    ).l
+    assert sorted(ret) == sorted(inner)
+
+
+def test_merge_join_and_cogroup():
+    left = [1, 2, 2, 4, 6]
+    right = [2, 3, 4, 4, 7]
+    ident = lambda x: x
+    assert MelodieGenerator(left).merge_join(right, ident).l == [
+        (2, 2),
+        (2, 2),
+        (4, 4),
+        (4, 4),
+    ]
+    assert MelodieGenerator(left).merge_join(right, ident, how="outer").l == [
+        (1, None),
+        (2, 2),
+        (2, 2),
+        (None, 3),
+        (4, 4),
+        (4, 4),
+        (6, None),
+        (None, 7),
+    ]
+    assert MelodieGenerator(left).merge_join(right, ident).l == MelodieGenerator(
+        left
+    ).join(right, ident).l
+
+    assert MelodieGenerator(["ab", "ac", "b"]).cogroup(["a", "c"], lambda s: s[0]).l == [
+        ("a", ["ab", "ac"], ["a"]),
+        ("b", ["b"], []),
+        ("c", [], ["c"]),
+    ]
@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+import time
+
+from MelodieFuncFlow import MelodieGenerator
+from MelodieFuncFlow.memo import MemoCache, stable_digest
+
+
+def square(x):
+    return x * x
+
+
+def test_memo_map():
+    calls = []
+
+    def f(x):
+        calls.append(x)
+        return x * 10
+
+    g = MelodieGenerator([1, 2, 1, 3, 2, 1]).memo_map(f)
+    assert g.l == [10, 20, 10, 30, 20, 10]
+    assert calls == [1, 2, 3]
+    assert g.memo.stats() == {"hits": 3, "disk_hits": 0, "misses": 3, "size": 3}
+
+    # by key, and with unhashable keys.
+    g = MelodieGenerator([[1, "a"], [1, "b"], [2, "c"]]).memo_map(
+        lambda pair: pair[1], key=lambda pair: [pair[0]]
+    )
+    assert g.l == ["a", "a", "c"]
+
+
+def test_memo_lru_and_ttl():
+    cache = MemoCache(square, maxsize=2)
+    for x in [1, 2, 1, 3, 2]:
+        cache(x)
+    # 2 was evicted by 3, as 1 was used more recently.
+    assert cache.stats() == {"hits": 1, "disk_hits": 0, "misses": 4, "size": 2}
+
+    cache = MemoCache(square, ttl=0.05)
+    cache(2)
+    cache(2)
+    time.sleep(0.1)
+    cache(2)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_memo_persist(tmp_path):
+    path = str(tmp_path / "memo.sqlite")
+    assert MelodieGenerator(range(5)).memo_map(square, persist=path, namespace="square").l == [0, 1, 4, 9, 16]
+
+    calls = []
+
+    def tracked(x):
+        calls.append(x)
+        return x * x
+
+    g = MelodieGenerator(range(7)).memo_map(tracked, persist=path, namespace="square")
+    assert g.l == [0, 1, 4, 9, 16, 25, 36]
+    assert calls == [5, 6]
+    assert g.memo.stats()["disk_hits"] == 5
+    g.memo.close()
+
+    # another function does not see the results of square.
+    g = MelodieGenerator([1]).memo_map(lambda x: -x, persist=path)
+    assert g.l == [-1]
+
+    # lambdas with the same qualified name do not share results.
+    assert MelodieGenerator([1, 2, 3]).memo_map(lambda x: x * 2, persist=path).l == [2, 4, 6]
+    assert MelodieGenerator([1, 2, 3]).memo_map(lambda x: x * 100, persist=path).l == [100, 200, 300]
+
+
+def test_stable_digest_of_equal_keys():
+    a, b = "".join(["ke", "y"]), "".join(["k", "ey"])
+    assert a is not b
+    assert stable_digest((a, a)) == stable_digest((a, b))
+    assert stable_digest(1) == stable_digest(1.0) == stable_digest(True) == stable_digest(1 + 0j)
+    assert stable_digest({"x": 1, "y": [a]}) == stable_digest({"y": [b], "x": 1.0})
+    assert stable_digest({a, "z"}) == stable_digest(frozenset(["z", b]))
+    assert stable_digest((1,)) != stable_digest([1])
+    assert stable_digest("1") != stable_digest(1) != stable_digest(1.5)
+
+
+def test_default_namespace_across_runs():
+    # the frozenset constant of ``f`` is pickled in the order of string hashes.
+    code = (
+        "from MelodieFuncFlow.memo import default_namespace\n"
+        "def f(x):\n"
+        "    return x in {'a', 'b', 'c', 'd', 'e', 'f'}\n"
+        "print(default_namespace(f))"
+    )
+    namespaces = {
+        subprocess.check_output(
+            [sys.executable, "-c", code], text=True, env=dict(os.environ, PYTHONHASHSEED=str(seed))
+        )
+        for seed in range(4)
+    }
+    assert len(namespaces) == 1
@@ -0,0 +1,331 @@
+import os
+import threading
+import time
+
+import pytest
+
+from MelodieFuncFlow import MelodieGenerator
+from MelodieFuncFlow.parallel import _ChunkSizer
+
+_factor = 1
+
+
+def square(x):
+    return x * x
+
+
+def add(a, b):
+    return a + b
+
+
+def sleep_reversed(x):
+    time.sleep(0.05 * (3 - x))
+    return x
+
+
+def set_factor(factor):
+    global _factor
+    _factor = factor
+
+
+def scale(x):
+    return x * _factor
+
+
+def test_process_map():
+    assert MelodieGenerator(range(100)).parallel_map(
+        square, backend="process", workers=2
+    ).l == [i * i for i in range(100)]
+
+    assert MelodieGenerator(range(100)).freeze().parallel_map(
+        square, backend="process", workers=2, chunksize=7
+    ).l == [i * i for i in range(100)]
+
+
+def test_process_map_star():
+    assert MelodieGenerator((i, i) for i in range(10)).parallel_map(
+        add, star=True, backend="process", workers=2
+    ).l == [i * 2 for i in range(10)]
+
+
+def test_process_map_unordered():
+    ret = (
+        MelodieGenerator(range(3))
+        .parallel_map(
+            sleep_reversed, backend="process", workers=3, chunksize=1, ordered=False
+        )
+        .l
+    )
+    assert ret == [2, 1, 0]
+
+
+def test_process_map_initializer():
+    assert MelodieGenerator([1, 2, 3]).parallel_map(
+        scale, backend="process", workers=2, initializer=set_factor, initargs=(10,)
+    ).l == [10, 20, 30]
+
+
+def test_process_map_early_stop():
+    def infinite():
+        i = 0
+        while True:
+            yield i
+            i += 1
+
+    g = MelodieGenerator(infinite()).parallel_map(
+        square, backend="process", workers=2, max_in_flight=2
+    )
+    assert g.slice(5).l == [0, 1, 4, 9, 16]
+
+
+def test_chunk_sizer():
+    assert _ChunkSizer(None, 4, total=100).size == 7
+    assert _ChunkSizer(3, 4).size == 3
+
+    sizer = _ChunkSizer(None, 4)
+    assert sizer.size == 1
+    sizer.feedback(1, 1e-6)
+    assert sizer.size == 2
+    sizer.feedback(2, 2.0)
+    assert sizer.size == 1
+
+
+def test_unknown_backend():
+    try:
+        MelodieGenerator([1]).parallel_map(square, backend="gpu")
+        raise AssertionError
+    except ValueError:
+        pass
+
+
+def test_thread_map():
+    t0 = time.time()
+    ret = MelodieGenerator(range(8)).thread_map(
+        lambda x: time.sleep(0.1) or x * 2, workers=8
+    ).l
+    assert ret == [i * 2 for i in range(8)]
+    assert time.time() - t0 < 0.5
+
+    assert MelodieGenerator([3, 4]).indexed_thread_map(lambda i, x: i * x).l == [0, 4]
+    assert MelodieGenerator([(1, 2), (3, 4)]).star_thread_map(
+        lambda a, b: a + b
+    ).l == [3, 7]
+
+
+def test_thread_map_unordered():
+    ret = (
+        MelodieGenerator([0.2, 0.1, 0.0])
+        .thread_map(lambda t: time.sleep(t) or t, workers=3, ordered=False)
+        .l
+    )
+    assert ret == [0.0, 0.1, 0.2]
+
+
+def test_thread_map_bounded():
+    pulled = []
+
+    def infinite():
+        i = 0
+        while True:
+            pulled.append(i)
+            yield i
+            i += 1
+
+    g = MelodieGenerator(infinite()).thread_map(
+        lambda x: x + 1, workers=2, max_in_flight=3
+    )
+    assert g.head() == 1
+    assert len(pulled) <= 4
+
+
+def parity(x):
+    return x % 2
+
+
+def test_reduce_by_key_on_workers():
+    ret = MelodieGenerator(range(1000)).reduce_by_key(
+        parity, add, workers=2, chunksize=100
+    ).to_dict()
+    assert ret == {0: sum(range(0, 1000, 2)), 1: sum(range(1, 1000, 2))}
+
+    assert MelodieGenerator(range(1000)).count_by(
+        parity, workers=2, chunksize=64
+    ).to_dict() == {0: 500, 1: 500}
+
+
+def concat(a, b):
+    return a + b
+
+
+def add_to_sketch(sketch, item):
+    sketch.add(item)
+    return sketch
+
+
+def test_parallel_reduce():
+    assert MelodieGenerator(range(1000)).parallel_reduce(add, workers=2) == sum(range(1000))
+    # the combination keeps the order for non-commutative operations.
+    words = [str(i) for i in range(200)]
+    assert MelodieGenerator(words).parallel_reduce(
+        concat, workers=3, chunksize=7
+    ) == "".join(words)
+    assert MelodieGenerator(x for x in range(10)).parallel_reduce(
+        add, 0, add, workers=2
+    ) == 45
+    assert MelodieGenerator([]).parallel_reduce(add, 0, add, workers=2) == 0
+
+
+def test_fold():
+    from MelodieFuncFlow.sketches import HyperLogLog
+
+    assert MelodieGenerator(range(10)).fold(max) == 9
+    assert MelodieGenerator(range(100)).fold(add, 0, workers=2, chunksize=9) == 4950
+    assert MelodieGenerator([]).fold(add, 0) == 0
+
+    sketch = MelodieGenerator(i % 500 for i in range(5000)).parallel_reduce(
+        add_to_sketch, HyperLogLog(), HyperLogLog.merge, workers=2
+    )
+    assert abs(sketch.count() - 500) < 25
+
+
+def tile_sum(tile):
+    return tile.sum(axis=0)
+
+
+def flip(tile):
+    return tile[::-1].copy()
+
+
+def head_bytes(data, n):
+    return bytes(data[:n])
+
+
+def test_shared_memory_transport():
+    np = pytest.importorskip("numpy")
+
+    def segments():
+        return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+    before = segments()
+    tiles = [np.full((256, 256), i, dtype=np.float64) for i in range(6)]
+    sums = MelodieGenerator(tiles).parallel_map(tile_sum, backend="process", workers=2).l
+    assert all((s == 256 * i).all() for i, s in enumerate(sums))
+
+    # large results come back through shared memory as well.
+    flipped = MelodieGenerator(tiles).parallel_map(
+        flip, backend="process", workers=2, shm_threshold=1
+    ).l
+    assert all((f == t).all() for f, t in zip(flipped, tiles))
+
+    payloads = [(bytes([i]) * 2**19, 3) for i in range(4)]
+    assert MelodieGenerator(payloads).parallel_map(
+        head_bytes, star=True, backend="process", workers=2
+    ).l == [bytes([i]) * 3 for i in range(4)]
+
+    # stopping early cleans up the segments of pending chunks.
+    g = MelodieGenerator(tiles * 4).parallel_map(
+        flip, backend="process", workers=2, chunksize=1, shm_threshold=1
+    )
+    assert (g.head() == tiles[0]).all()
+    g.inner.close()
+    assert segments() == before
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="no /dev/shm to check for segments")
+def test_shared_memory_results_cleanup_on_failure(monkeypatch):
+    from MelodieFuncFlow import parallel, sharedmem
+
+    share = sharedmem.share
+    calls = []
+
+    def share_then_fail(obj, threshold, segments):
+        calls.append(obj)
+        if len(calls) == 2:
+            raise MemoryError("no space left for shared memory")
+        return share(obj, threshold, segments)
+
+    before = set(os.listdir("/dev/shm"))
+    monkeypatch.setattr(sharedmem, "share", share_then_fail)
+    with pytest.raises(MemoryError):
+        parallel._run_shared_chunk(bytes, False, [2**20, 2**20], 1)
+    assert set(os.listdir("/dev/shm")) == before
+
+
+def failing_source(n):
+    for i in range(n):
+        yield i
+    raise KeyError("upstream failed")
+
+
+@pytest.mark.parametrize("mode", ["thread", "process"])
+def test_prefetch(mode):
+    assert MelodieGenerator(range(1000)).map(square).prefetch(8, mode).l == [
+        i * i for i in range(1000)
+    ]
+    assert MelodieGenerator(["end", None, 1]).prefetch(1, mode).l == ["end", None, 1]
+
+    g = MelodieGenerator(failing_source(3)).prefetch(2, mode)
+    assert g.head() == 0
+    with pytest.raises(KeyError):
+        g.l
+
+    g = MelodieGenerator(x for x in range(10**9)).prefetch(4, mode)
+    assert g.slice(3).l == [0, 1, 2]
+    g.inner.close()
+
+
+def test_prefetch_closes_upstream():
+    closed = threading.Event()
+
+    def source():
+        try:
+            yield from range(10**9)
+        finally:
+            closed.set()
+
+    g = MelodieGenerator(source()).prefetch(2)
+    assert g.head() == 0
+    g.inner.close()
+    assert closed.wait(5)
+
+
+def test_prefetch_overlaps():
+    def slow_source():
+        for i in range(5):
+            time.sleep(0.05)
+            yield i
+
+    t0 = time.perf_counter()
+    MelodieGenerator(slow_source()).prefetch(5).extra_job(lambda x: time.sleep(0.05)).exhaust()
+    assert time.perf_counter() - t0 < 0.45
+
+
+def test_pipeline():
+    data = list(range(1000))
+    expected = [x * x + 1 for x in data if x % 3]
+    g = (
+        MelodieGenerator(data)
+        .map(square)
+        .filter(lambda x: x % 3)
+        .map(lambda x: x + 1)
+        .pipeline(workers_per_stage=[1, 2, 3], batch_size=16, queue_size=2)
+    )
+    assert g.l == expected
+    stats = g.executor.stats()
+    assert [s["stages"][0].split("(")[0] for s in stats] == ["map", "filter", "map"]
+    assert [s["workers"] for s in stats] == [1, 2, 3]
+    assert [(s["in"], s["out"]) for s in stats] == [(1000, 1000), (1000, len(expected)), (len(expected),) * 2]
+
+    g = MelodieGenerator(data).map(square).attributes("real").pipeline(batch_size=7, ordered=False)
+    assert len(g.executor.groups) == 1
+    assert sorted(g) == [x * x for x in data]
+
+    # closing early stops the workers.
+    assert MelodieGenerator(iter(range(10**9))).map(square).pipeline().slice(0, 3).l == [0, 1, 4]
+
+    with pytest.raises(ZeroDivisionError):
+        MelodieGenerator([1, 0]).map(lambda x: 1 / x).pipeline().exhaust()
+    with pytest.raises(ValueError):
+        MelodieGenerator(data).indexed_map(add).pipeline()
+    with pytest.raises(ValueError):
+        MelodieGenerator(data).map(square).pipeline(workers_per_stage=[1, 2])
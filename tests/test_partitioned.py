@@ -0,0 +1,86 @@
+import operator
+
+import pytest
+
+from MelodieFuncFlow import MelodieGenerator, MelodiePartitionedDataset
+
+
+def square(x):
+    return x * x
+
+
+def is_odd(x):
+    return x % 2 == 1
+
+
+def first(pair):
+    return pair[0]
+
+
+def key_of(row):
+    return row[0]
+
+
+def running_sum(items):
+    s = 0
+    for x in items:
+        s += x
+        yield s
+
+
+def test_partitioned():
+    ds = MelodieGenerator(range(10)).partitioned(3, workers=2)
+    assert ds.partitions == [[0, 3, 6, 9], [1, 4, 7], [2, 5, 8]]
+    assert ds.map(square).filter(is_odd).collect().l == [9, 81, 1, 49, 25]
+    assert ds.map_partitions(running_sum).map(square).collect_partitions() == [
+        [0, 9, 81, 324],
+        [1, 25, 144],
+        [4, 49, 225],
+    ]
+    assert ds.filter(is_odd).count() == 5
+    assert MelodieGenerator(zip("ab", [1, 2])).partitioned(2).star_map(operator.mul).collect().l == ["a", "bb"]
+
+    # repartitioning keeps the elements, and puts equal keys together.
+    assert ds.repartition(2).partitions == [[0, 6, 1, 7, 5], [3, 9, 4, 2, 8]]
+    shuffled = ds.map(square).shuffle(is_odd, n=4)
+    assert shuffled.num_partitions == 4
+    assert sorted(shuffled.collect()) == sorted(x * x for x in range(10))
+    for partition in shuffled.partitions:
+        assert len({is_odd(x) for x in partition}) <= 1
+
+    with pytest.raises(ValueError):
+        MelodiePartitionedDataset([[1]], backend="spark")
+
+
+def test_partitioned_group_by_and_join():
+    words = ["apple", "bob", "avocado", "cat", "banana", "cherry", "date"]
+    ds = MelodieGenerator(words).partitioned(3, by=len)
+    groups = {k: sorted(v) for k, v in ds.group_by(first).collect()}
+    assert groups == {
+        "a": ["apple", "avocado"],
+        "b": ["banana", "bob"],
+        "c": ["cat", "cherry"],
+        "d": ["date"],
+    }
+
+    prices = MelodieGenerator([("a", 1), ("b", 2), ("b", 3), ("z", 9)]).partitioned(2)
+    joined = ds.join(prices, first, first, n=5).collect()
+    assert sorted(joined) == [
+        ("apple", ("a", 1)),
+        ("avocado", ("a", 1)),
+        ("banana", ("b", 2)),
+        ("banana", ("b", 3)),
+        ("bob", ("b", 2)),
+        ("bob", ("b", 3)),
+    ]
+
+
+def test_partitioned_equal_keys():
+    # equal keys which are not the same objects are put into one group.
+    a, b = "".join(["ke", "y"]), "".join(["k", "ey"])
+    rows = [((a, "x"), 1), ((b, "x"), 2)]
+    groups = MelodieGenerator(rows).partitioned(4, workers=1).group_by(key_of).collect().l
+    assert [(k, [v for _, v in items]) for k, items in groups] == [(("key", "x"), [1, 2])]
+
+    groups = dict(MelodieGenerator([(True, 1), (1, 2), (1.0, 3), (2, 4)]).partitioned(3).group_by(key_of).collect())
+    assert sorted(len(items) for items in groups.values()) == [1, 3]
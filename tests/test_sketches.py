@@ -0,0 +1,44 @@
+import subprocess
+import sys
+
+from MelodieFuncFlow import MelodieGenerator
+from MelodieFuncFlow.sketches import BloomFilter, HyperLogLog, stable_hash64
+
+
+def test_distinct():
+    assert MelodieGenerator([3, 1, 3, 2, 1]).distinct().l == [3, 1, 2]
+    assert MelodieGenerator(["a", "B", "b", "A"]).distinct(str.lower).l == ["a", "B"]
+    assert MelodieGenerator([[1], [2], [1]]).distinct(approximate=True).l == [[1], [2]]
+
+    data = [i % 1000 for i in range(5000)]
+    ret = MelodieGenerator(data).distinct(approximate=True, capacity=1000).l
+    assert len(ret) == len(set(ret))
+    assert len(ret) >= 950
+
+
+def test_count_distinct():
+    data = [i % 5000 for i in range(20000)]
+    assert MelodieGenerator(data).count_distinct() == 5000
+    approx = MelodieGenerator(data).count_distinct(approximate=True, error_rate=0.02)
+    assert abs(approx - 5000) / 5000 < 0.1
+    assert MelodieGenerator(["a", "A"]).count_distinct(str.lower, approximate=True) == 1
+
+
+def test_sketch_merge():
+    a, b = HyperLogLog(10), HyperLogLog(10)
+    for i in range(3000):
+        (a if i % 2 else b).add(f"id-{i}")
+    assert abs(a.merge(b).count() - 3000) / 3000 < 0.15
+
+    f1, f2 = BloomFilter(100), BloomFilter(100)
+    f1.add("x")
+    f2.add("y")
+    f1.merge(f2)
+    assert "x" in f1 and "y" in f1
+    assert "z" not in BloomFilter(100)
+
+
+def test_stable_hash():
+    code = "from MelodieFuncFlow.sketches import stable_hash64; print(stable_hash64('abc'), stable_hash64(7))"
+    out = subprocess.check_output([sys.executable, "-c", code], text=True).split()
+    assert [int(x) for x in out] == [stable_hash64("abc"), stable_hash64(7)]
@@ -0,0 +1,101 @@
+import os
+
+from MelodieFuncFlow import MelodieFrozenGenerator, MelodieGenerator
+from MelodieFuncFlow.storage import SpilledSequence
+
+
+def test_spill_freeze(tmp_path):
+    path = str(tmp_path / "spill.bin")
+    g = MelodieGenerator({"i": i} for i in range(1000)).freeze(
+        spill_to=path, memory_limit=200
+    )
+    assert isinstance(g, MelodieFrozenGenerator)
+    assert isinstance(g.inner, SpilledSequence)
+    assert 0 < g.inner.spilled < 1000
+    assert os.path.exists(path) and os.path.exists(path + ".idx")
+
+    assert len(g) == 1000
+    assert g[0] == {"i": 0}
+    assert g[999] == {"i": 999}
+    assert g[-2] == {"i": 998}
+    assert g[500:503].map(lambda d: d["i"]).l == [500, 501, 502]
+    assert g.map(lambda d: d["i"]).l == list(range(1000))
+    # replayable
+    assert g.map(lambda d: d["i"]).reduce(lambda a, b: a + b) == sum(range(1000))
+    assert g.sort(lambda d: -d["i"]).head() == {"i": 999}
+
+    g.inner.close(remove=True)
+    assert not os.path.exists(path)
+
+
+def test_spill_freeze_same_path(tmp_path):
+    path = str(tmp_path / "spill.bin")
+    old = MelodieGenerator(range(1000)).freeze(spill_to=path, memory_limit=100)
+    new = MelodieGenerator(str(i) for i in range(50)).freeze(spill_to=path, memory_limit=100)
+    # the old sequence still reads its own files.
+    assert old.l == list(range(1000))
+    assert new.l == [str(i) for i in range(50)]
+    assert sorted(os.listdir(tmp_path)) == ["spill.bin", "spill.bin.idx"]
+
+    old.inner.close(remove=True)
+    assert new[-1] == "49"
+    new.inner.close(remove=True)
+    assert os.listdir(tmp_path) == []
+
+
+def test_spill_freeze_in_memory(tmp_path):
+    path = str(tmp_path / "spill.bin")
+    g = MelodieGenerator(range(10)).freeze(spill_to=path)
+    assert g.l == list(range(10))
+    assert isinstance(g.inner, list)
+    assert not os.path.exists(path)
+
+
+def test_external_sort(tmp_path, monkeypatch):
+    import random
+
+    from MelodieFuncFlow import storage
+
+    monkeypatch.setattr(storage, "MAX_FAN_IN", 3)
+    data = [(random.randint(0, 50), i) for i in range(5000)]
+    g = MelodieGenerator(iter(data)).sort_external(
+        key=lambda p: p[0], memory_limit=2000, tmp_dir=str(tmp_path)
+    )
+    assert g.l == sorted(data, key=lambda p: p[0])
+    assert MelodieGenerator(iter(data)).sort_external(
+        key=lambda p: p[0], reverse=True, memory_limit=2000, tmp_dir=str(tmp_path)
+    ).l == sorted(data, key=lambda p: p[0], reverse=True)
+    # temporary files are removed
+    assert os.listdir(tmp_path) == []
+
+
+def test_external_sort_early_close(tmp_path):
+    g = MelodieGenerator(range(3000, 0, -1)).sort_external(memory_limit=1000, tmp_dir=str(tmp_path))
+    assert g.slice(3).l == [1, 2, 3]
+    assert len(os.listdir(tmp_path)) == 1
+    g.inner.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_external_sort_in_memory(tmp_path):
+    assert MelodieGenerator([3, 1, 2]).sort_external(tmp_dir=str(tmp_path)).l == [1, 2, 3]
+    assert MelodieGenerator([]).sort_external().l == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_external_sort_run_length():
+    import tracemalloc
+
+    from MelodieFuncFlow.storage import _estimate_run_length
+
+    # runs of small ints and of tuples take about ``memory_limit`` bytes.
+    limit = 2**20
+    for make in (lambda i: 10**6 + i, lambda i: (i * 0.5, str(i))):
+        n = _estimate_run_length([make(i) for i in range(64)], limit)
+        tracemalloc.start()
+        run = [make(i) for i in range(n)]
+        run.sort()
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del run
+        assert 0.5 * limit < used < 1.5 * limit